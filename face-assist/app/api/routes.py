@@ -1,20 +1,242 @@
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, Response, g, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
+import io
 import os
-from ..core.face_processor import FaceProcessor
+import json
+import time
+import itertools
+import zipfile
+from typing import Optional
+from ..core.face_processor import (
+    FaceProcessor, IMAGE_EXTENSIONS, FULL_FRAME, STAGE_METRIC, format_rejections, parse_boxes, read_archive_images,
+    reserved_name_error
+)
+from ..core.event_publisher import EventPublisher
+from ..core.face_watcher import FaceDatabaseWatcher
 from ..core.hailo_manager import HailoManager
+from ..core.history import RecognitionHistory
+from ..core.job_queue import JOB_STATES, JobQueue
+from ..core.metrics import RequestProfiler, registry
+from ..core.model_registry import ModelRegistry
+from ..core.quantization import evaluate
+from ..core.upload_manager import UploadError, UploadManager, save_stream
+from ..core.stream_manager import StreamManager, recognition_event
 from ..config.default_config import (
     MODELS_PATH, FACES_PATH, RESULTS_PATH,
-    MAX_MODEL_SIZE, SUPPORTED_FORMATS
+    MAX_MODEL_SIZE, SUPPORTED_FORMATS, MAX_BATCH_IMAGES,
+    STREAMS_CONFIG, HAILO_PATH, HAILO_DEVICE_INFO, HAILO_POLL_INTERVAL,
+    MODEL_MEMORY_BUDGET, INFERENCE_SESSIONS, INFERENCE_THREADS,
+    MAX_PACKAGE_SIZE, UPLOAD_EXPIRY, SERVER_WORKERS, SHARED_GALLERY_PATH, METRICS_PATH,
+    WATCH_FACES, WATCH_POLL_INTERVAL, WATCH_DEBOUNCE,
+    EVENT_WEBHOOK_URL, EVENT_WINDOW, EVENT_MAX_PENDING, EVENT_TIMEOUT,
+    JOBS_PATH, JOB_WORKERS, JOB_NICE, JOB_MAX_YIELD, JOB_RETENTION,
+    HISTORY_MAX_SIZE, HISTORY_MAX_AGE, HISTORY_CROPS
 )
 
 # Create blueprints
 api = Blueprint('api', __name__)
 web = Blueprint('web', __name__, static_folder='web')
 
-# Initialize processors
-face_processor = FaceProcessor(FACES_PATH)
-hailo_manager = HailoManager()
+# Room for multipart headers when checking the size of single-request uploads
+MULTIPART_OVERHEAD = 64 * 1024
+# Enrollment jobs pause while these run in the same worker
+FOREGROUND_ENDPOINTS = {'api.verify_face', 'api.identify_face', 'api.verify_faces', 'api.identify_faces'}
+# Images enrolled between checks for cancellation and foreground requests
+IMPORT_CHUNK = 8
+# Seconds a Hailo status stream stays open, and milliseconds before the
+# browser reconnects it
+HAILO_EVENTS_LIFETIME = 300
+HAILO_EVENTS_RETRY = 5000
+
+def _enroll_job(params, files, job):
+    """Enroll one uploaded image"""
+    with open(files[0], 'rb') as f:
+        data = f.read()
+    boxes = [tuple(box) for box in params['boxes']] if params.get('boxes') else None
+    success, message = face_processor.add_face(params['person'], data, params['filename'], boxes)
+    if not success:
+        raise ValueError(message)
+    person = secure_filename(params['person']) or params['person']
+    return {'message': message, 'person': person, 'face_count': face_processor.get_face_count(person)}
+
+def _import_job(params, files, job):
+    """Enroll uploaded archives and images in chunks"""
+    person = params.get('person')
+    archives = files[:params['archives']]
+    images = zip(params['filenames'], files[params['archives']:])
+
+    def items():
+        for filename, path in images:
+            with open(path, 'rb') as f:
+                yield person, filename, f.read()
+        for path in archives:
+            yield from read_archive_images(path, person)
+
+    result = {'imported': 0, 'failed': [], 'people': {}}
+    chunk = []
+    done = 0
+    for item in itertools.chain(items(), [None]):
+        if item is not None:
+            chunk.append(item)
+            if len(chunk) < IMPORT_CHUNK:
+                continue
+        if chunk:
+            job.checkpoint(done)
+            imported = face_processor.import_images(chunk)
+            result['imported'] += imported['imported']
+            result['failed'].extend(imported['failed'])
+            result['people'].update(imported['people'])
+            done += len(chunk)
+            chunk = []
+    job.checkpoint(done)
+    return result
+
+# Services behind the routes, created by init_services in every server worker
+model_registry: Optional[ModelRegistry] = None
+face_processor: Optional[FaceProcessor] = None
+hailo_manager: Optional[HailoManager] = None
+stream_manager: Optional[StreamManager] = None
+event_publisher: Optional[EventPublisher] = None
+history: Optional[RecognitionHistory] = None
+face_watcher: Optional[FaceDatabaseWatcher] = None
+upload_manager: Optional[UploadManager] = None
+profiler: Optional[RequestProfiler] = None
+job_queue: Optional[JobQueue] = None
+
+def init_services(processor: Optional[FaceProcessor] = None) -> None:
+    """Create the services behind the routes and start their background threads.
+
+    Args:
+        processor: Face processor to serve instead of one on the add-on's
+            face database. Only the recognition routes are served then:
+            the job queue, face watcher, streams, Hailo polling, history
+            and event webhook are not created, so nothing runs or is
+            written outside the processor's own database.
+    """
+    global model_registry, face_processor, hailo_manager, stream_manager, event_publisher
+    global history, face_watcher, upload_manager, profiler, job_queue
+    profiler = RequestProfiler(os.path.join(RESULTS_PATH, 'profiles'))
+    if processor is not None:
+        face_processor = processor
+        return
+
+    model_registry = ModelRegistry(MODELS_PATH, MODEL_MEMORY_BUDGET, SUPPORTED_FORMATS,
+                                   INFERENCE_SESSIONS, INFERENCE_THREADS)
+    # Workers of a multi-process server share one gallery and one set of streams
+    shared = SERVER_WORKERS > 1
+    face_processor = FaceProcessor(FACES_PATH, model_registry=model_registry,
+                                   shared_path=SHARED_GALLERY_PATH if shared else None)
+    hailo_manager = HailoManager(HAILO_PATH, HAILO_DEVICE_INFO, poll_interval=HAILO_POLL_INTERVAL)
+    hailo_manager.start_polling()
+    stream_manager = StreamManager(face_processor, STREAMS_CONFIG, coordinate=shared)
+    # Stream events reach the publisher of the worker running the streams only
+    if EVENT_WEBHOOK_URL:
+        event_publisher = EventPublisher(EVENT_WEBHOOK_URL, EVENT_WINDOW, EVENT_MAX_PENDING, timeout=EVENT_TIMEOUT)
+        event_publisher.start()
+        stream_manager.listeners.append(event_publisher.publish)
+    # Every worker appends its recognitions to the same history database
+    if HISTORY_MAX_SIZE:
+        history = RecognitionHistory(os.path.join(RESULTS_PATH, 'history'), HISTORY_MAX_SIZE, HISTORY_CROPS,
+                                     max_age=HISTORY_MAX_AGE)
+        history.start()
+        stream_manager.listeners.append(history.record)
+    # One worker watches the face database; the shared gallery carries its updates
+    face_watcher = FaceDatabaseWatcher(
+        FACES_PATH, face_processor.sync_people, IMAGE_EXTENSIONS, WATCH_DEBOUNCE, WATCH_POLL_INTERVAL,
+        lock_path=os.path.join(SHARED_GALLERY_PATH, 'watcher.lock') if shared else None
+    )
+    if WATCH_FACES:
+        face_watcher.start()
+
+    upload_manager = UploadManager({
+        'model': {'dir': MODELS_PATH, 'max_size': MAX_MODEL_SIZE, 'extensions': SUPPORTED_FORMATS},
+        'hailo': {'dir': RESULTS_PATH, 'max_size': MAX_PACKAGE_SIZE, 'extensions': ['.tar.gz']}
+    }, UPLOAD_EXPIRY)
+    job_queue = JobQueue(JOBS_PATH, face_processor.server_token, JOB_WORKERS, JOB_MAX_YIELD,
+                         JOB_NICE, JOB_RETENTION)
+    job_queue.register('enroll', _enroll_job, priority=10)
+    job_queue.register('import', _import_job, priority=20)
+    job_queue.start()
+
+    # Metrics read when /api/metrics is scraped, summed over every worker
+    if shared:
+        registry.share(METRICS_PATH, face_processor.server_token)
+
+registry.describe('face_assist_request_seconds', 'API request latency by endpoint')
+registry.describe('face_assist_requests_total', 'API requests by endpoint and status')
+registry.gauge('face_assist_gallery_encodings', lambda: len(face_processor.gallery))
+registry.gauge('face_assist_gallery_people', lambda: len(face_processor.gallery.people))
+registry.gauge('face_assist_result_cache_entries', lambda: len(face_processor.result_cache))
+registry.gauge('face_assist_result_cache_hits', lambda: face_processor.result_cache.hits)
+registry.gauge('face_assist_result_cache_misses', lambda: face_processor.result_cache.misses)
+registry.gauge('face_assist_queue_depth', lambda: {
+    (('queue', queue),): depth
+    for queue, depth in {**face_processor.queue_depths(),
+                         **({'jobs': job_queue.counts()['queued']} if job_queue else {})}.items()
+})
+# Only the worker running the streams reports them
+registry.gauge('face_assist_stream_frames', lambda: {
+    (('counter', counter), ('stream', stream['name'])): stream[counter]
+    for stream in stream_manager.list_streams()
+    for counter in ('frames_sampled', 'frames_dropped', 'frames_static', 'frames_processed')
+} if stream_manager and stream_manager.is_leader else {})
+
+def _read_boxes():
+    """Read the face boxes supplied with a single image, or return an error response
+
+    `boxes` holds a JSON list of face boxes found upstream; `cropped`
+    marks the image as a face crop. Detection is skipped in both cases.
+    """
+    if request.form.get('cropped', '').lower() in ('1', 'true', 'yes'):
+        return [FULL_FRAME], None
+    if 'boxes' not in request.form:
+        return None, None
+    try:
+        return parse_boxes(json.loads(request.form['boxes'])), None
+    except ValueError as e:
+        return None, (jsonify({'error': f'Invalid boxes: {e}'}), 400)
+
+def _read_batch_boxes(count):
+    """Read the face boxes supplied per image of a batch, or return an error response
+
+    `boxes` holds a JSON list with one entry per image, a list of boxes or
+    null to detect faces; `cropped` marks every image as a face crop.
+    """
+    if request.form.get('cropped', '').lower() in ('1', 'true', 'yes'):
+        return [[FULL_FRAME]] * count, None
+    if 'boxes' not in request.form:
+        return None, None
+    try:
+        entries = json.loads(request.form['boxes'])
+        if not isinstance(entries, list) or len(entries) != count:
+            raise ValueError('expected one entry per image')
+        return [parse_boxes(entry) if entry is not None else None for entry in entries], None
+    except ValueError as e:
+        return None, (jsonify({'error': f'Invalid boxes: {e}'}), 400)
+
+@api.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile = profiler.start()
+    if job_queue and request.endpoint in FOREGROUND_ENDPOINTS:
+        job_queue.begin_foreground()
+        g.foreground = True
+
+@api.teardown_request
+def end_foreground(exc):
+    if g.pop('foreground', False):
+        job_queue.end_foreground()
+
+@api.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.observe('face_assist_request_seconds', time.perf_counter() - g.request_start,
+                     endpoint=endpoint)
+    registry.inc('face_assist_requests_total', endpoint=endpoint, status=response.status_code)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.stop(profile)
+    return response
 
 @web.route('/')
 def index():
@@ -22,19 +244,27 @@ def index():
 
 @api.route('/models', methods=['GET'])
 def list_models():
-    """List all uploaded models"""
-    models = []
-    for model in os.listdir(MODELS_PATH):
-        if any(model.endswith(fmt) for fmt in SUPPORTED_FORMATS):
-            models.append({
-                'name': model,
-                'size': os.path.getsize(os.path.join(MODELS_PATH, model))
-            })
-    return jsonify(models)
+    """List all uploaded models with their hash and load state"""
+    return jsonify(model_registry.list_models())
+
+@api.route('/models/status', methods=['GET'])
+def models_status():
+    """Report model memory budget, loaded models and recent evictions"""
+    return jsonify(model_registry.status())
+
+@api.route('/models/<name>/unload', methods=['POST'])
+def unload_model(name):
+    """Release the sessions of a loaded model"""
+    if not model_registry.unload(name):
+        return jsonify({'error': 'Model not loaded'}), 404
+    return jsonify({'message': 'Model unloaded'})
 
 @api.route('/upload/model', methods=['POST'])
 def upload_model():
     """Handle model upload"""
+    # Reject oversized requests before the multipart body is read
+    if (request.content_length or 0) > MAX_MODEL_SIZE + MULTIPART_OVERHEAD:
+        return jsonify({'error': 'Model file too large'}), 413
     if 'model' not in request.files:
         return jsonify({'error': 'No model file provided'}), 400
     
@@ -42,13 +272,81 @@ def upload_model():
     if not any(model_file.filename.endswith(fmt) for fmt in SUPPORTED_FORMATS):
         return jsonify({'error': 'Unsupported model format'}), 400
     
-    if model_file.content_length > MAX_MODEL_SIZE:
-        return jsonify({'error': 'Model file too large'}), 400
-    
     filename = secure_filename(model_file.filename)
-    model_file.save(os.path.join(MODELS_PATH, filename))
+    try:
+        save_stream(model_file.stream, MODELS_PATH, filename, MAX_MODEL_SIZE)
+    except UploadError:
+        return jsonify({'error': 'Model file too large'}), 413
+    model_registry.register(filename)
     return jsonify({'message': 'Model uploaded successfully'})
 
+def _upload_error(e: UploadError):
+    return jsonify({'error': str(e)}), e.status
+
+@api.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload of a model or Hailo runtime package"""
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be an integer'}), 400
+    
+    try:
+        upload = upload_manager.create(data.get('kind', 'model'), data.get('filename'),
+                                       size, data.get('sha256'))
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify(upload), 201
+
+@api.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Report how many bytes of an upload were received"""
+    try:
+        return jsonify(upload_manager.status(upload_id))
+    except UploadError as e:
+        return _upload_error(e)
+
+@api.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_upload(upload_id):
+    """Append the raw request body to an upload at the Upload-Offset header"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+    
+    try:
+        return jsonify(upload_manager.append(upload_id, offset, request.stream))
+    except UploadError as e:
+        return _upload_error(e)
+
+@api.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Verify a fully received upload and move it into place"""
+    try:
+        upload = upload_manager.complete(upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    
+    if upload['kind'] == 'model':
+        model_registry.register(upload['filename'])
+        return jsonify(dict(upload, message='Model uploaded successfully'))
+    
+    success, message = hailo_manager.install_runtime(upload['path'])
+    os.remove(upload['path'])
+    if not success:
+        return jsonify({'error': message}), 500
+    return jsonify(dict(upload, message=message))
+
+@api.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """Discard an unfinished upload"""
+    try:
+        upload_manager.cancel(upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({'message': 'Upload cancelled'})
+
 @api.route('/faces', methods=['GET'])
 def list_faces():
     """List all registered faces"""
@@ -57,26 +355,109 @@ def list_faces():
 @api.route('/faces/<person>', methods=['POST'])
 def add_face(person):
     """Add a new face image for a person"""
+    error = reserved_name_error(person)
+    if error:
+        return jsonify({'error': error}), 400
     if 'image' not in request.files:
         return jsonify({'error': 'No image file provided'}), 400
     
     image_file = request.files['image']
     if not image_file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
         return jsonify({'error': 'Unsupported image format'}), 400
+    boxes, error = _read_boxes()
+    if error:
+        return error
+    if boxes and len(boxes) > 1:
+        return jsonify({'error': 'Enroll one face box per image'}), 400
     
-    # Save the image temporarily
-    temp_path = os.path.join(FACES_PATH, secure_filename(person), secure_filename(image_file.filename))
-    os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-    image_file.save(temp_path)
-    
-    # Process the face
-    success, message = face_processor.add_face(person, temp_path)
+    # Detection and encoding run as a job; poll /api/jobs/<id> for the result
+    job = job_queue.submit('enroll', {'person': person, 'filename': image_file.filename, 'boxes': boxes},
+                           [(image_file.filename, image_file.read())])
+    return jsonify(job), 202
+
+@api.route('/faces/<person>', methods=['GET'])
+def list_person_images(person):
+    """List the enrollment images of a person"""
+    images = face_processor.list_images(person)
+    if not images and not face_processor.has_person(person):
+        return jsonify({'error': 'Person not found'}), 404
+    return jsonify({'name': person, 'face_count': face_processor.get_face_count(person), 'images': images})
+
+@api.route('/faces/<person>', methods=['DELETE'])
+def delete_person(person):
+    """Delete a person with all of their images"""
+    if not face_processor.delete_person(person):
+        return jsonify({'error': 'Person not found'}), 404
+    return jsonify({'message': 'Person deleted'})
+
+@api.route('/faces/<person>/<filename>', methods=['DELETE'])
+def delete_image(person, filename):
+    """Delete one enrollment image of a person"""
+    if not face_processor.delete_image(person, filename):
+        return jsonify({'error': 'Image not found'}), 404
+    return jsonify({'message': 'Image deleted', 'face_count': face_processor.get_face_count(person)})
+
+@api.route('/faces/import', methods=['POST'])
+def import_faces():
+    """Enroll a zip archive or a set of images in one request"""
+    archives = request.files.getlist('archive')
+    images = request.files.getlist('images')
+    person = request.form.get('person')
+    if not archives and not images:
+        return jsonify({'error': 'No archive or images provided'}), 400
+    if images and not person:
+        return jsonify({'error': 'Missing person name'}), 400
+    error = reserved_name_error(person) if person else None
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not success:
-        os.remove(temp_path)
-        return jsonify({'error': message}), 400
+    files = [(archive.filename, archive.read()) for archive in archives]
+    if not all(zipfile.is_zipfile(io.BytesIO(data)) for _, data in files):
+        return jsonify({'error': 'Invalid zip archive'}), 400
     
-    return jsonify({'message': message})
+    files.extend((image_file.filename, image_file.read()) for image_file in images)
+    job = job_queue.submit('import', {
+        'person': person,
+        'archives': len(archives),
+        'filenames': [image_file.filename for image_file in images]
+    }, files)
+    return jsonify(job), 202
+
+@api.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List recent enrollment jobs and the number of jobs per state"""
+    state = request.args.get('state')
+    if state and state not in JOB_STATES:
+        return jsonify({'error': f"state must be one of {', '.join(JOB_STATES)}"}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify({'counts': job_queue.counts(), 'jobs': job_queue.list_jobs(state, limit)})
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the state, progress and result of a job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@api.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_queue.cancel(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@api.route('/faces/progress', methods=['GET'])
+def faces_progress():
+    """Report progress of face database loading and imports"""
+    return jsonify(face_processor.progress)
+
+@api.route('/faces/rebuild', methods=['POST'])
+def rebuild_faces():
+    """Re-encode every image in the face database"""
+    face_processor.rebuild()
+    return jsonify(face_processor.list_people())
 
 @api.route('/verify', methods=['POST'])
 def verify_face():
@@ -86,43 +467,324 @@ def verify_face():
     
     image_file = request.files['image']
     person = request.form['person']
+    boxes, error = _read_boxes()
+    if error:
+        return error
+    
+    # Verify the face straight from the request stream
+    rejected = []
+    match, confidence = face_processor.verify_face(person, image_file.read(), rejected, boxes)
     
-    # Save the image temporarily
-    temp_path = os.path.join(RESULTS_PATH, 'temp_verify.jpg')
-    image_file.save(temp_path)
+    return jsonify({
+        'match': match,
+        'confidence': confidence,
+        'rejected': format_rejections(rejected)
+    })
+
+@api.route('/identify', methods=['POST'])
+def identify_face():
+    """Identify the people in an image against the whole face database"""
+    if 'image' not in request.files:
+        return jsonify({'error': 'No image file provided'}), 400
     
-    # Verify the face
-    match, confidence = face_processor.verify_face(person, temp_path)
+    try:
+        top_k = int(request.form.get('top_k', 3))
+    except ValueError:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    if top_k < 1:
+        return jsonify({'error': 'top_k must be at least 1'}), 400
     
-    # Clean up
-    os.remove(temp_path)
+    boxes, error = _read_boxes()
+    if error:
+        return error
+    
+    image = request.files['image'].read()
+    rejected = []
+    faces = face_processor.identify_face(image, top_k, rejected, boxes)
+    if not faces:
+        if rejected:
+            return jsonify({'error': 'No face passed the quality gate',
+                            'rejected': format_rejections(rejected)}), 400
+        return jsonify({'error': 'No face detected in image'}), 400
+    
+    # Callers that name a camera publish the result like a stream would
+    camera = request.form.get('camera')
+    for face in faces:
+        event = recognition_event(camera, face)
+        if history:
+            history.record(event, image)
+        if camera and event_publisher:
+            event_publisher.publish(event)
+    
+    return jsonify({'faces': faces, 'rejected': format_rejections(rejected)})
+
+def _read_batch_images():
+    """Read the images of a batch request, or return an error response"""
+    images = request.files.getlist('images')
+    if not images:
+        return None, (jsonify({'error': 'No image files provided'}), 400)
+    if len(images) > MAX_BATCH_IMAGES:
+        return None, (jsonify({'error': f'At most {MAX_BATCH_IMAGES} images per request'}), 400)
+    return [image_file.read() for image_file in images], None
+
+@api.route('/verify/batch', methods=['POST'])
+def verify_faces():
+    """Verify many images against a known person in one request"""
+    if 'person' not in request.form:
+        return jsonify({'error': 'Missing person name'}), 400
+    
+    images, error = _read_batch_images()
+    if error:
+        return error
+    boxes, error = _read_batch_boxes(len(images))
+    if error:
+        return error
+    
+    return jsonify({'results': face_processor.verify_faces(request.form['person'], images, boxes)})
+
+@api.route('/identify/batch', methods=['POST'])
+def identify_faces():
+    """Identify the people in many images in one request"""
+    try:
+        top_k = int(request.form.get('top_k', 3))
+    except ValueError:
+        return jsonify({'error': 'top_k must be an integer'}), 400
+    if top_k < 1:
+        return jsonify({'error': 'top_k must be at least 1'}), 400
+    
+    images, error = _read_batch_images()
+    if error:
+        return error
+    boxes, error = _read_batch_boxes(len(images))
+    if error:
+        return error
+    
+    return jsonify({'results': face_processor.identify_faces(images, top_k, boxes)})
+
+@api.route('/streams', methods=['GET'])
+def list_streams():
+    """List camera streams with their pipeline counters"""
+    return jsonify(stream_manager.list_streams())
+
+@api.route('/streams', methods=['POST'])
+def add_stream():
+    """Start ingesting a camera stream or video file"""
+    data = request.get_json(silent=True) or {}
+    name = data.get('name')
+    url = data.get('url')
+    if not name or not url:
+        return jsonify({'error': 'Missing stream name or url'}), 400
+    
+    try:
+        fps = float(data.get('fps', 2.0))
+        motion_threshold = float(data.get('motion_threshold', 4.0))
+        top_k = int(data.get('top_k', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'fps, motion_threshold and top_k must be numbers'}), 400
+    if fps <= 0 or top_k < 1:
+        return jsonify({'error': 'fps must be positive and top_k at least 1'}), 400
+    
+    try:
+        stream = stream_manager.add(name, url, fps, motion_threshold, top_k)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify(stream.status()), 201
+
+@api.route('/streams/<name>', methods=['GET'])
+def stream_status(name):
+    """Get the status of a camera stream"""
+    stream = stream_manager.get(name)
+    if stream is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify(stream.status())
+
+@api.route('/streams/<name>', methods=['DELETE'])
+def remove_stream(name):
+    """Stop ingesting a camera stream"""
+    if not stream_manager.remove(name):
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify({'message': 'Stream removed'})
+
+@api.route('/streams/<name>/events', methods=['GET'])
+def stream_events(name):
+    """Get the most recent recognition events of a camera stream"""
+    stream = stream_manager.get(name)
+    if stream is None:
+        return jsonify({'error': 'Stream not found'}), 404
     
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(list(stream.events)[-limit:] if limit > 0 else [])
+
+@api.route('/results', methods=['GET'])
+def list_results():
+    """Page through the recognition history, newest first"""
+    if not history:
+        return jsonify({'error': 'Recognition history is disabled'}), 404
+    
+    limit = request.args.get('limit', 100, type=int)
+    if not 1 <= limit <= 1000:
+        return jsonify({'error': 'limit must be between 1 and 1000'}), 400
+    bounds = {}
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        if value is None:
+            continue
+        try:
+            bounds[name] = float(value)
+        except ValueError:
+            return jsonify({'error': f'{name} must be a Unix timestamp'}), 400
+    try:
+        page = history.query(
+            person=request.args.get('person'),
+            camera=request.args.get('camera'),
+            since=bounds.get('since'),
+            until=bounds.get('until'),
+            limit=limit,
+            cursor=request.args.get('cursor')
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify(page)
+
+@api.route('/results/stats', methods=['GET'])
+def results_stats():
+    """Report the size and backlog of the recognition history"""
+    if not history:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **history.stats()})
+
+@api.route('/results/<int:record_id>/crop', methods=['GET'])
+def result_crop(record_id):
+    """Return the face crop stored with a history record"""
+    jpeg = history.crop(record_id) if history else None
+    if jpeg is None:
+        return jsonify({'error': 'Crop not found'}), 404
+    return Response(jpeg, mimetype='image/jpeg')
+
+@api.route('/events', methods=['GET'])
+def event_status():
+    """Report delivery counters of the recognition event publisher"""
+    if not event_publisher:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **event_publisher.status()})
+
+@api.route('/detector', methods=['GET'])
+def detector_status():
+    """Report inference backend settings and time spent per processing stage"""
+    gate = face_processor.quality_gate
     return jsonify({
-        'match': match,
-        'confidence': confidence
+        'settings': face_processor.backend.settings(),
+        'quality_gate': gate.settings() if gate else None,
+        'timings': face_processor.metrics.summary(STAGE_METRIC, 'stage')
     })
 
-@api.route('/hailo/status', methods=['GET'])
-def hailo_status():
-    """Check Hailo device status"""
-    is_installed = hailo_manager.is_runtime_installed()
-    if not is_installed:
-        return jsonify({
-            'installed': False,
-            'message': 'Hailo runtime not installed'
-        })
-    
-    device_present, device_info = hailo_manager.check_device()
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose latency histograms and counters in Prometheus text format"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/profile', methods=['GET'])
+def profile_status():
+    """Report the request profiler state"""
+    return jsonify(profiler.status())
+
+@api.route('/profile', methods=['POST'])
+def start_profile():
+    """Profile the next N API requests and write a .prof file"""
+    data = request.get_json(silent=True) or {}
+    try:
+        count = int(data.get('requests', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'requests must be an integer'}), 400
+    if count < 1:
+        return jsonify({'error': 'requests must be positive'}), 400
+    
+    profiler.arm(count)
+    return jsonify({'message': f'Profiling the next {count} requests', **profiler.status()})
+
+@api.route('/cache', methods=['GET'])
+def cache_stats():
+    """Report recognition result cache statistics"""
+    return jsonify(face_processor.result_cache.stats())
+
+@api.route('/cache', methods=['DELETE'])
+def clear_cache():
+    """Drop all cached recognition results"""
+    face_processor.result_cache.clear()
+    return jsonify({'message': 'Cache cleared'})
+
+@api.route('/gallery/storage', methods=['GET'])
+def gallery_storage():
+    """Compare the match decisions of every storage mode on the current gallery"""
+    max_probes = request.args.get('max_probes', 1000, type=int)
+    if max_probes < 1:
+        return jsonify({'error': 'max_probes must be positive'}), 400
+    
+    # The gallery may already hold quantized rows, so the modes are compared
+    # on the float64 encodings of the cache
+    encodings, labels = face_processor.encoding_cache.encodings()
     return jsonify({
-        'installed': True,
-        'device_present': device_present,
-        'device_info': device_info,
-        'temperature': hailo_manager.get_device_temperature()
+        'storage': face_processor.gallery.storage,
+        'encodings': len(encodings),
+        'threshold': face_processor.match_threshold,
+        'modes': evaluate(encodings, labels, face_processor.match_threshold, max_probes=max_probes)
     })
 
+@api.route('/gallery/compact', methods=['POST'])
+def gallery_compact():
+    """Reduce the encodings of one or every person to prototypes"""
+    data = request.get_json(silent=True) or {}
+    person = data.get('person')
+    prototypes = data.get('prototypes')
+    if prototypes is not None:
+        try:
+            prototypes = int(prototypes)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'prototypes must be an integer'}), 400
+        if prototypes < 0:
+            return jsonify({'error': 'prototypes must not be negative'}), 400
+    if person is not None and not face_processor.list_images(person):
+        return jsonify({'error': 'Person not found'}), 404
+
+    return jsonify(face_processor.compact(person, prototypes))
+
+@api.route('/hailo/status', methods=['GET'])
+def hailo_status():
+    """Return the Hailo device status cached by the background poller"""
+    return jsonify(hailo_manager.status())
+
+@api.route('/hailo/events', methods=['GET'])
+def hailo_events():
+    """Stream Hailo status changes as Server-Sent Events
+
+    Each stream ends after HAILO_EVENTS_LIFETIME seconds, so open pages
+    do not hold a request thread for good; EventSource reconnects after
+    the advertised retry delay.
+    """
+    def generate():
+        deadline = time.monotonic() + HAILO_EVENTS_LIFETIME
+        status = hailo_manager.status()
+        yield f"retry: {HAILO_EVENTS_RETRY}\ndata: {json.dumps(status)}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed = hailo_manager.wait_for_change(status['version'], timeout=min(15, remaining))
+            if changed is None:
+                yield ": keepalive\n\n"
+                continue
+            status = changed
+            yield f"data: {json.dumps(status)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @api.route('/hailo/upload', methods=['POST'])
 def upload_hailo():
     """Handle Hailo runtime package upload"""
+    if (request.content_length or 0) > MAX_PACKAGE_SIZE + MULTIPART_OVERHEAD:
+        return jsonify({'error': 'Package file too large'}), 413
     if 'package' not in request.files:
         return jsonify({'error': 'No package file provided'}), 400
     
@@ -131,8 +793,11 @@ def upload_hailo():
         return jsonify({'error': 'Invalid package format'}), 400
     
     # Save the package
-    package_path = os.path.join(RESULTS_PATH, 'hailort.tar.gz')
-    package_file.save(package_path)
+    try:
+        package_path, _ = save_stream(package_file.stream, RESULTS_PATH, 'hailort.tar.gz',
+                                      MAX_PACKAGE_SIZE)
+    except UploadError:
+        return jsonify({'error': 'Package file too large'}), 413
     
     # Install the runtime
     success, message = hailo_manager.install_runtime(package_path)
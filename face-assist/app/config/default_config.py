@@ -17,7 +17,46 @@ def get_default_config():
         "results_path": "/share/face-assist/results",
         "max_model_size": 500,
         "supported_model_formats": [".onnx", ".tflite"],
-        "log_level": "info"
+        "log_level": "info",
+        "search_index": "auto",
+        "index_nprobe": 8,
+        "gallery_storage": "float32",
+        "enroll_dedupe": 0.2,
+        "compact_above": 0,
+        "compact_prototypes": 8,
+        "quality_min_face_size": 20,
+        "quality_min_sharpness": 10,
+        "quality_min_brightness": 20,
+        "quality_max_brightness": 235,
+        "quality_min_contrast": 8,
+        "quality_max_yaw": 0,
+        "quality_max_roll": 0,
+        "enroll_workers": 0,
+        "result_cache_size": 256,
+        "result_cache_ttl": 30,
+        "detection_model": "hog",
+        "detection_upsample": 1,
+        "detection_max_width": 640,
+        "hailo_poll_interval": 10,
+        "hailo_device_info": "hailort-device-info",
+        "inference_backend": "dlib",
+        "embedder_model": "",
+        "detector_model": "",
+        "inference_sessions": 2,
+        "inference_batch_size": 8,
+        "inference_threads": 1,
+        "onnx_match_threshold": 1.0,
+        "model_memory_budget": 0,
+        "server_workers": 2,
+        "server_threads": 8,
+        "watch_faces": True,
+        "watch_poll_interval": 10,
+        "event_webhook_url": "",
+        "event_window": 5,
+        "job_workers": 1,
+        "history_max_size": 500,
+        "history_days": 0,
+        "history_crops": False
     }
 
 # Load configuration
@@ -28,18 +67,100 @@ MODELS_PATH = CONFIG.get('models_path', '/share/face-assist/models')
 FACES_PATH = CONFIG.get('faces_path', '/share/face-assist/faces')
 RESULTS_PATH = CONFIG.get('results_path', '/share/face-assist/results')
 HAILO_PATH = "/opt/hailo"
+HAILO_DEVICE_INFO = CONFIG.get('hailo_device_info', 'hailort-device-info')  # Name or path of the tool
+HAILO_POLL_INTERVAL = CONFIG.get('hailo_poll_interval', 10)  # Seconds
+STREAMS_CONFIG = "/data/streams.json"
 
 # Model settings
 MAX_MODEL_SIZE = CONFIG.get('max_model_size', 500) * 1024 * 1024  # Convert to bytes
 SUPPORTED_FORMATS = CONFIG.get('supported_model_formats', [".onnx", ".tflite"])
+MAX_PACKAGE_SIZE = 200 * 1024 * 1024  # Largest Hailo runtime package accepted
+UPLOAD_EXPIRY = 24 * 3600  # Seconds an unfinished chunked upload is kept
+# Memory loaded models may use, 0 = twice the largest model size
+MODEL_MEMORY_BUDGET = (CONFIG.get('model_memory_budget', 0) * 1024 * 1024) or 2 * MAX_MODEL_SIZE
 
 # API settings
 API_HOST = "0.0.0.0"
-API_PORT = 8099
+API_PORT = 5000  # Internal port nginx proxies /api to; nginx serves 8099
+
+# Server settings
+SERVER_WORKERS = CONFIG.get('server_workers', 2)  # Worker processes
+SERVER_THREADS = CONFIG.get('server_threads', 8)  # Request threads per worker
+SERVER_TIMEOUT = 300  # Seconds before a silent worker is restarted; covers long imports
+SHARED_GALLERY_PATH = "/data/gallery"  # Gallery mapped by every worker
+METRICS_PATH = "/data/metrics"  # Per-worker metrics summed by /api/metrics
+SERVER_TOKEN_ENV = "FACE_ASSIST_SERVER_TOKEN"  # Identifies one server start
+
+# Background jobs
+JOBS_PATH = "/data/jobs"  # Job database and uploaded files waiting to be enrolled
+JOB_WORKERS = CONFIG.get('job_workers', 1)  # Job threads per server worker
+JOB_NICE = 10  # Niceness added to job threads
+JOB_MAX_YIELD = 2.0  # Longest pause a job makes at once for verify/identify requests
+JOB_RETENTION = 24 * 3600  # Seconds finished jobs stay queryable
+
+# Recognition history
+HISTORY_MAX_SIZE = CONFIG.get('history_max_size', 500) * 1024 * 1024  # 0 disables the history
+HISTORY_MAX_AGE = CONFIG.get('history_days', 0) * 24 * 3600  # 0 keeps records until the size limit
+HISTORY_CROPS = CONFIG.get('history_crops', False)  # Store a JPEG of every recognized face
+
+# Recognition event publishing
+EVENT_WEBHOOK_URL = CONFIG.get('event_webhook_url', '')  # Empty disables publishing
+EVENT_WINDOW = CONFIG.get('event_window', 5)  # Seconds repeated sightings are coalesced
+EVENT_MAX_PENDING = 256  # Distinct pending sightings before new ones are dropped
+EVENT_TIMEOUT = 5.0  # Seconds to wait for the webhook per request
 
 # Logging
 LOG_LEVEL = CONFIG.get('log_level', 'info').upper()
 
+# Face database watching
+WATCH_FACES = CONFIG.get('watch_faces', True)  # Pick up photos added or removed on disk
+WATCH_POLL_INTERVAL = CONFIG.get('watch_poll_interval', 10)  # Seconds, used without inotify
+WATCH_DEBOUNCE = 2.0  # Quiet seconds before changed folders are synced
+
+# Enrollment settings
+ENROLL_WORKERS = CONFIG.get('enroll_workers', 0) or os.cpu_count() or 1  # 0 = all cores
+MAX_IMAGE_SIZE = 10 * 1024 * 1024  # Largest image accepted from bulk imports
+MAX_BATCH_IMAGES = 32  # Largest number of images in one batch request
+MAX_FACE_BOXES = 32  # Largest number of face boxes supplied with one image
+
+# Recognition result cache
+RESULT_CACHE_SIZE = CONFIG.get('result_cache_size', 256)  # 0 disables the cache
+RESULT_CACHE_TTL = CONFIG.get('result_cache_ttl', 30)  # Seconds
+
+# Face detection settings
+DETECTION_MODEL = CONFIG.get('detection_model', 'hog')  # hog or cnn
+DETECTION_UPSAMPLE = CONFIG.get('detection_upsample', 1)
+DETECTION_MAX_WIDTH = CONFIG.get('detection_max_width', 640)  # 0 = full resolution
+
+# Inference backend settings
+INFERENCE_BACKEND = CONFIG.get('inference_backend', 'dlib')  # dlib or onnx
+EMBEDDER_MODEL = CONFIG.get('embedder_model', '')  # File name in MODELS_PATH
+DETECTOR_MODEL = CONFIG.get('detector_model', '')  # Optional, dlib detection if empty
+INFERENCE_SESSIONS = CONFIG.get('inference_sessions', 2)  # Sessions per model
+INFERENCE_BATCH_SIZE = CONFIG.get('inference_batch_size', 8)  # Faces per embedder run
+INFERENCE_THREADS = CONFIG.get('inference_threads', 1)  # Threads per session
+ONNX_MATCH_THRESHOLD = CONFIG.get('onnx_match_threshold', 1.0)  # Distance of normalized embeddings
+
 # Face recognition settings
 FACE_MATCH_THRESHOLD = 0.6
 CONFIDENCE_THRESHOLD = 80.0
+
+# Quality gate settings; faces failing a check are not encoded, 0 disables a check
+QUALITY_MIN_FACE_SIZE = CONFIG.get('quality_min_face_size', 20)  # Pixels
+QUALITY_MIN_SHARPNESS = CONFIG.get('quality_min_sharpness', 10)  # Laplacian variance
+QUALITY_MIN_BRIGHTNESS = CONFIG.get('quality_min_brightness', 20)  # Mean gray level
+QUALITY_MAX_BRIGHTNESS = CONFIG.get('quality_max_brightness', 235)  # 255 disables
+QUALITY_MIN_CONTRAST = CONFIG.get('quality_min_contrast', 8)  # Gray level standard deviation
+QUALITY_MAX_YAW = CONFIG.get('quality_max_yaw', 0)  # Degrees
+QUALITY_MAX_ROLL = CONFIG.get('quality_max_roll', 0)  # Degrees
+
+# Gallery search settings
+SEARCH_INDEX = CONFIG.get('search_index', 'auto')  # exact, ivf or auto
+INDEX_NPROBE = CONFIG.get('index_nprobe', 8)
+INDEX_MIN_GALLERY_SIZE = 5000  # auto mode uses exact search below this size
+GALLERY_STORAGE = CONFIG.get('gallery_storage', 'float32')  # float32, float16 or int8
+
+# Gallery compaction settings
+ENROLL_DEDUPE = CONFIG.get('enroll_dedupe', 0.2)  # Share of the match threshold, 0 disables
+COMPACT_ABOVE = CONFIG.get('compact_above', 0)  # Encodings per person before compacting, 0 disables
+COMPACT_PROTOTYPES = CONFIG.get('compact_prototypes', 8)
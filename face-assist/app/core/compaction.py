@@ -0,0 +1,80 @@
+import numpy as np
+from typing import Optional
+
+def pairwise_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Euclidean distances between the rows of a and the rows of b."""
+    sq = (np.einsum('ij,ij->i', a, a)[:, None] + np.einsum('ij,ij->i', b, b)[None, :]
+          - 2.0 * a @ b.T)
+    return np.sqrt(np.maximum(sq, 0.0))
+
+def novel_rows(candidates: np.ndarray, existing: Optional[np.ndarray], distance: float) -> np.ndarray:
+    """Mask of the candidates that are not near-duplicates.
+
+    A candidate is a near-duplicate when it lies within `distance` of an
+    existing encoding or of an earlier candidate that was kept, so a burst
+    of similar photos keeps its first one only.
+
+    Args:
+        candidates: New encodings of shape (N, dim)
+        existing: Encodings already enrolled for the person, may be None
+        distance: Largest distance at which encodings count as duplicates
+
+    Returns:
+        Boolean array of length N, True for the encodings to keep
+    """
+    candidates = np.asarray(candidates, dtype=np.float64)
+    keep = np.ones(len(candidates), dtype=bool)
+    if distance <= 0 or not len(candidates):
+        return keep
+    if existing is not None and len(existing):
+        keep &= pairwise_distances(candidates, np.asarray(existing, dtype=np.float64)).min(axis=1) > distance
+    within = pairwise_distances(candidates, candidates)
+    for i in range(1, len(candidates)):
+        if keep[i] and (within[i, :i][keep[:i]] <= distance).any():
+            keep[i] = False
+    return keep
+
+def find_prototypes(encodings: np.ndarray, k: int, iterations: int = 25, seed: int = 0) -> np.ndarray:
+    """Summarize encodings by the centers of k clusters.
+
+    Centers are seeded with k-means++ from a fixed seed, so the same
+    encodings always give the same prototypes.
+
+    Args:
+        encodings: Encodings of one person, shape (N, dim)
+        k: Number of prototypes
+        iterations: Largest number of k-means refinement steps
+        seed: Seed of the center initialization
+
+    Returns:
+        Array of at most k prototypes; the encodings themselves if there
+        are no more than k of them
+    """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    if len(encodings) <= k:
+        return encodings
+    rng = np.random.default_rng(seed)
+    centers = [encodings[rng.integers(len(encodings))]]
+    closest = pairwise_distances(encodings, centers[0][None, :])[:, 0] ** 2
+    for _ in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            break
+        center = encodings[rng.choice(len(encodings), p=closest / total)]
+        centers.append(center)
+        closest = np.minimum(closest, pairwise_distances(encodings, center[None, :])[:, 0] ** 2)
+    centers = np.asarray(centers)
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = pairwise_distances(encodings, centers).argmin(axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sizes = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, encodings)
+        used = sizes > 0
+        centers = sums[used] / sizes[used][:, None]
+        labels = None if not used.all() else labels
+    return centers
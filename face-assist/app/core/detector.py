@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+import face_recognition
+from typing import Dict, List
+from .inference import InferenceBackend, Location
+
+class FaceDetector(InferenceBackend):
+    """dlib detection and encoding through face_recognition."""
+
+    name = 'dlib'
+
+    def __init__(self, model: str = 'hog', upsample: int = 1, max_width: int = 640,
+                 match_threshold: float = 0.6):
+        """Initialize the dlib backend.
+
+        Detection runs on a copy downscaled to at most `max_width` pixels
+        wide; the boxes are mapped back so encodings are still computed on
+        the original-resolution image. Instances are plain data, so they
+        can be handed to worker processes.
+
+        Args:
+            model: dlib detector, 'hog' (fast, CPU) or 'cnn' (accurate, slow)
+            upsample: Times the detection image is upsampled to find small faces
+            max_width: Widest image detection runs on, 0 to disable downscaling
+            match_threshold: Encoding distance at or below which faces match
+        """
+        if model not in ('hog', 'cnn'):
+            raise ValueError(f"Unknown detection model: {model}")
+        self.model = model
+        self.upsample = upsample
+        self.max_width = max_width
+        self.match_threshold = match_threshold
+
+    @property
+    def cache_suffix(self) -> str:
+        # dlib encodings keep the file names used before backends existed
+        return ''
+
+    def settings(self) -> Dict[str, any]:
+        """Detector settings as a dictionary."""
+        return {
+            'backend': self.name,
+            'model': self.model,
+            'upsample': self.upsample,
+            'max_width': self.max_width
+        }
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        """Find faces, running the detector on a downscaled copy.
+
+        Args:
+            image: RGB image array
+
+        Returns:
+            Face locations in original image coordinates
+        """
+        height, width = image.shape[:2]
+        scale = 1.0
+        small = image
+        if self.max_width and width > self.max_width:
+            scale = self.max_width / width
+            small = cv2.resize(image, (self.max_width, max(1, int(round(height * scale)))),
+                               interpolation=cv2.INTER_AREA)
+
+        locations = face_recognition.face_locations(
+            small, number_of_times_to_upsample=self.upsample, model=self.model
+        )
+        if scale == 1.0:
+            return locations
+        return [
+            (
+                max(0, int(top / scale)),
+                min(width, int(round(right / scale))),
+                min(height, int(round(bottom / scale))),
+                max(0, int(left / scale))
+            )
+            for top, right, bottom, left in locations
+        ]
+
+    def embed(self, image: np.ndarray, locations: List[Location]) -> List[np.ndarray]:
+        """Encode faces at full resolution with the dlib ResNet model."""
+        return face_recognition.face_encodings(image, locations)
@@ -0,0 +1,270 @@
+import os
+import fcntl
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+CACHE_FILENAME = '.encodings.npz'
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Compute the SHA-256 hex digest of a file.
+
+    Args:
+        path: Path to the file
+        chunk_size: Number of bytes read per iteration
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class EncodingCache:
+    def __init__(self, face_db_path: str, filename: str = CACHE_FILENAME, dim: int = 128,
+                 shared: bool = False):
+        """Initialize the encoding cache.
+
+        Entries are keyed by the image path relative to the face database
+        and validated against the file size, modification time and content
+        hash, so only new or changed images have to be encoded again.
+
+        Args:
+            face_db_path: Path to the face database directory
+            filename: Name of the cache file inside the database directory
+            dim: Dimension of the cached encodings
+            shared: Whether other processes write the same cache file; saves
+                then merge their entries under a file lock instead of
+                overwriting them
+        """
+        self.face_db_path = face_db_path
+        self.dim = dim
+        self.path = os.path.join(face_db_path, filename)
+        self.shared = shared
+        self.logger = logging.getLogger(__name__)
+        self._entries: Dict[str, Dict] = {}
+        # Entries dropped since the last save, which a merge must not restore
+        self._removed: Set[str] = set()
+        self._cleared = False
+        self._lock = threading.Lock()
+        self._dirty = False
+        # Modification time of the cache file when it was last read or written
+        self._file_mtime: Optional[int] = None
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self) -> None:
+        """Load cached entries from disk, starting empty if unreadable."""
+        self._entries = self._read()
+        if self._entries:
+            self.logger.info(f"Loaded {len(self._entries)} cached image encodings")
+
+    def refresh(self) -> None:
+        """Adopt the entries other processes saved since the file was last read or written."""
+        if not self.shared:
+            return
+        try:
+            if os.stat(self.path).st_mtime_ns == self._file_mtime:
+                return
+        except FileNotFoundError:
+            return
+        self._merge()
+
+    def _read(self) -> Dict[str, Dict]:
+        """Read the entries stored in the cache file."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            self._file_mtime = os.stat(self.path).st_mtime_ns
+            with np.load(self.path, allow_pickle=False) as data:
+                paths = data['paths']
+                sizes = data['sizes']
+                mtimes = data['mtimes']
+                hashes = data['hashes']
+                counts = data['counts']
+                encodings = data['encodings']
+            if encodings.ndim != 2 or encodings.shape[1] != self.dim:
+                raise ValueError(f"unexpected encoding shape {encodings.shape}")
+            offsets = np.concatenate(([0], np.cumsum(counts)))
+            return {
+                str(rel_path): {
+                    'size': int(sizes[i]),
+                    'mtime': int(mtimes[i]),
+                    'hash': str(hashes[i]),
+                    'encodings': encodings[offsets[i]:offsets[i + 1]]
+                }
+                for i, rel_path in enumerate(paths)
+            }
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable encoding cache {self.path}: {e}")
+            return {}
+
+    def lookup(self, rel_path: str, stat: os.stat_result) -> Optional[np.ndarray]:
+        """Return cached encodings for an image if it is unchanged.
+
+        Size and modification time are checked first; when only the
+        modification time differs the content hash decides.
+
+        Args:
+            rel_path: Image path relative to the face database
+            stat: Current stat result of the image file
+
+        Returns:
+            Array of encodings (possibly empty) or None on a cache miss
+        """
+        entry = self._entries.get(rel_path)
+        if entry is None or entry['size'] != stat.st_size:
+            return None
+        if entry['mtime'] == stat.st_mtime_ns:
+            return entry['encodings']
+
+        full_path = os.path.join(self.face_db_path, rel_path)
+        if file_hash(full_path) != entry['hash']:
+            return None
+        with self._lock:
+            entry['mtime'] = stat.st_mtime_ns
+            self._dirty = True
+        return entry['encodings']
+
+    def store(self, rel_path: str, encodings: Iterable[np.ndarray],
+              stat: Optional[os.stat_result] = None) -> None:
+        """Record the encodings computed for an image.
+
+        Args:
+            rel_path: Image path relative to the face database
+            encodings: Encodings found in the image, may be empty
+            stat: Stat result of the image file, read from disk if omitted
+        """
+        full_path = os.path.join(self.face_db_path, rel_path)
+        if stat is None:
+            stat = os.stat(full_path)
+        entry = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': file_hash(full_path),
+            'encodings': np.asarray(list(encodings), dtype=np.float64).reshape(-1, self.dim)
+        }
+        with self._lock:
+            self._entries[rel_path] = entry
+            self._removed.discard(rel_path)
+            self._dirty = True
+
+    def discard(self, rel_path: str) -> None:
+        """Remove the entry for an image if present.
+
+        Args:
+            rel_path: Image path relative to the face database
+        """
+        with self._lock:
+            if self._entries.pop(rel_path, None) is not None:
+                self._removed.add(rel_path)
+                self._dirty = True
+
+    def clear(self) -> None:
+        """Remove every entry so all images are encoded again."""
+        with self._lock:
+            self._entries = {}
+            self._removed = set()
+            self._cleared = True
+            self._dirty = True
+
+    def prune(self, live_paths: Iterable[str], prefix: str = '') -> int:
+        """Drop entries whose images no longer exist.
+
+        Args:
+            live_paths: Relative paths of all images currently on disk
+            prefix: Only consider entries whose path starts with it, such
+                as the folder of one person
+
+        Returns:
+            Number of entries removed
+        """
+        live = set(live_paths)
+        with self._lock:
+            stale = [rel_path for rel_path in self._entries
+                     if rel_path.startswith(prefix) and rel_path not in live]
+            for rel_path in stale:
+                del self._entries[rel_path]
+            self._removed.update(stale)
+            if stale:
+                self._dirty = True
+        return len(stale)
+
+    def count(self, prefix: str = '') -> int:
+        """Number of cached encodings of the images whose path starts with prefix."""
+        with self._lock:
+            return sum(len(entry['encodings']) for rel_path, entry in self._entries.items()
+                       if rel_path.startswith(prefix))
+
+    def encodings(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached float64 encodings of every image and the person index of every row."""
+        with self._lock:
+            items = sorted(self._entries.items())
+        people = {}
+        rows, labels = [], []
+        for rel_path, entry in items:
+            label = people.setdefault(rel_path.split('/', 1)[0], len(people))
+            rows.append(entry['encodings'])
+            labels.extend([label] * len(entry['encodings']))
+        if not rows:
+            return np.empty((0, self.dim)), np.empty(0, dtype=np.int64)
+        return np.concatenate(rows).astype(np.float64, copy=False), np.asarray(labels)
+
+    def save(self) -> None:
+        """Write the cache to disk atomically if it changed."""
+        if not self.shared:
+            self._write()
+            return
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self._dirty:
+                self._merge()
+            self._write()
+
+    def _merge(self) -> None:
+        """Adopt entries other processes saved since this cache was loaded."""
+        on_disk = self._read()
+        with self._lock:
+            if self._cleared:
+                return
+            for rel_path, entry in on_disk.items():
+                if rel_path not in self._entries and rel_path not in self._removed:
+                    self._entries[rel_path] = entry
+
+    def _write(self) -> None:
+        """Write the entries to the cache file if they changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            items = sorted(self._entries.items())
+            self._dirty = False
+            self._removed = set()
+            self._cleared = False
+
+        paths = [rel_path for rel_path, _ in items]
+        encodings = [entry['encodings'] for _, entry in items]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    paths=np.array(paths, dtype=str),
+                    sizes=np.array([e['size'] for _, e in items], dtype=np.int64),
+                    mtimes=np.array([e['mtime'] for _, e in items], dtype=np.int64),
+                    hashes=np.array([e['hash'] for _, e in items], dtype=str),
+                    counts=np.array([len(enc) for enc in encodings], dtype=np.int64),
+                    encodings=(np.concatenate(encodings) if encodings
+                               else np.empty((0, self.dim), dtype=np.float64))
+                )
+            os.replace(tmp_path, self.path)
+            self._file_mtime = os.stat(self.path).st_mtime_ns
+        except Exception as e:
+            self.logger.error(f"Error saving encoding cache: {e}")
+            with self._lock:
+                self._dirty = True
@@ -0,0 +1,210 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import requests
+from .metrics import registry
+
+# Home Assistant accepts calls through the Supervisor proxy with this token
+SUPERVISOR_URL = 'http://supervisor/'
+SUPERVISOR_TOKEN_ENV = 'SUPERVISOR_TOKEN'
+
+registry.describe('face_assist_events_total', 'Recognition events by outcome of their delivery')
+
+class EventPublisher:
+    def __init__(self, url: str, window: float = 5.0, max_pending: int = 256,
+                 batch_size: int = 50, timeout: float = 5.0, max_backoff: float = 60.0):
+        """Initialize the publisher of recognition events to a webhook.
+
+        Recognition threads only add events to a bounded table of pending
+        sightings and never wait for the network. Repeated sightings of the
+        same person by the same camera within one window are coalesced into
+        one entry with a count. A background thread posts the pending
+        entries as JSON batches once per window. When the target is slow or
+        down, sightings keep coalescing and the ones that do not fit are
+        dropped and reported as a per-camera count in the next batch.
+        Batches that fail are sent again, so a target that times out after
+        accepting a batch sees its sightings twice; every sighting carries
+        an id to recognize repeats by.
+
+        Args:
+            url: Webhook the batches are posted to
+            window: Seconds sightings are coalesced before they are sent
+            max_pending: Largest number of distinct pending sightings
+            batch_size: Largest number of sightings per request
+            timeout: Seconds to wait for the target per request
+            max_backoff: Longest pause between retries after failures
+        """
+        self.url = url
+        self.window = window
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.logger = logging.getLogger(__name__)
+        self.stats = {'published': 0, 'coalesced': 0, 'dropped': 0, 'sent': 0, 'failed': 0, 'batches': 0}
+        self.last_error: Optional[str] = None
+        self.last_sent: Optional[float] = None
+        self._pending: 'OrderedDict[Tuple[str, Optional[str]], Dict]' = OrderedDict()
+        self._dropped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._session = requests.Session()
+        token = os.environ.get(SUPERVISOR_TOKEN_ENV)
+        if token and url.startswith(SUPERVISOR_URL):
+            self._session.headers['Authorization'] = f"Bearer {token}"
+
+    def start(self) -> None:
+        """Start the sender thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='event-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Send what is pending and stop the sender thread."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def publish(self, event: Dict, frame=None) -> None:
+        """Queue a recognition event without blocking.
+
+        Args:
+            event: Event with at least 'camera', 'timestamp', 'person' and
+                'distance', as produced for stream recognitions
+            frame: Frame the face was found in; not sent, accepted so the
+                method can be a stream listener
+        """
+        camera = event.get('camera') or 'api'
+        key = (camera, event.get('person'))
+        timestamp = event.get('timestamp') or time.time()
+        distance = event.get('distance')
+        with self._lock:
+            self.stats['published'] += 1
+            sighting = self._pending.get(key)
+            if sighting is not None:
+                sighting['count'] += 1
+                sighting['last_seen'] = timestamp
+                if distance is not None and (sighting['distance'] is None or distance < sighting['distance']):
+                    sighting['distance'] = distance
+                    sighting['location'] = event.get('location')
+                self.stats['coalesced'] += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self._drop(camera, 1)
+                return
+            self._pending[key] = {
+                'id': uuid.uuid4().hex,
+                'camera': camera,
+                'person': key[1],
+                'first_seen': timestamp,
+                'last_seen': timestamp,
+                'count': 1,
+                'distance': distance,
+                'location': event.get('location')
+            }
+
+    def status(self) -> Dict[str, any]:
+        with self._lock:
+            pending = len(self._pending)
+            stats = dict(self.stats)
+        return {
+            'url': self.url,
+            'window': self.window,
+            'pending': pending,
+            'last_sent': self.last_sent,
+            'error': self.last_error,
+            **stats
+        }
+
+    def _take(self) -> Tuple[List[Dict], Dict[str, int]]:
+        """Remove and return everything pending."""
+        with self._lock:
+            sightings = list(self._pending.values())
+            dropped = self._dropped
+            self._pending = OrderedDict()
+            self._dropped = {}
+        return sightings, dropped
+
+    def _restore(self, sightings: List[Dict], dropped: Dict[str, int]) -> None:
+        """Put sightings that could not be sent back in front of newer ones.
+
+        Sightings of the same person and camera are merged; what no longer
+        fits is counted as dropped.
+        """
+        with self._lock:
+            newer = self._pending
+            self._pending = OrderedDict()
+            for sighting in sightings:
+                key = (sighting['camera'], sighting['person'])
+                later = newer.pop(key, None)
+                if later is not None:
+                    sighting['count'] += later['count']
+                    sighting['last_seen'] = later['last_seen']
+                self._pending[key] = sighting
+            self._pending.update(newer)
+            while len(self._pending) > self.max_pending:
+                (camera, _), sighting = self._pending.popitem()
+                self._drop(camera, sighting['count'])
+            for camera, count in dropped.items():
+                self._dropped[camera] = self._dropped.get(camera, 0) + count
+
+    def _drop(self, camera: str, count: int) -> None:
+        """Count sightings that did not fit; the lock must be held."""
+        self._dropped[camera] = self._dropped.get(camera, 0) + count
+        self.stats['dropped'] += count
+        registry.inc('face_assist_events_total', count, outcome='dropped')
+
+    def _send(self, sightings: List[Dict], dropped: Dict[str, int]) -> None:
+        """Post one batch, raising when the target does not accept it."""
+        response = self._session.post(self.url, json={
+            'events': sightings,
+            'dropped': dropped,
+            'sent': time.time()
+        }, timeout=self.timeout)
+        response.raise_for_status()
+
+    def _flush(self) -> bool:
+        """Send everything pending in batches; False when the target failed."""
+        sightings, dropped = self._take()
+        if not sightings and not dropped:
+            return True
+        for start in range(0, max(len(sightings), 1), self.batch_size):
+            batch = sightings[start:start + self.batch_size]
+            try:
+                self._send(batch, dropped)
+            except Exception as e:
+                self.last_error = str(e)
+                self.stats['failed'] += 1
+                self.logger.warning(f"Error sending recognition events to {self.url}: {e}")
+                self._restore(sightings[start:], dropped)
+                return False
+            sent = sum(sighting['count'] for sighting in batch)
+            self.stats['sent'] += sent
+            self.stats['batches'] += 1
+            registry.inc('face_assist_events_total', sent, outcome='sent')
+            # The dropped counts go out with the first batch only
+            dropped = {}
+        self.last_error = None
+        self.last_sent = time.time()
+        return True
+
+    def _run(self) -> None:
+        """Flush once per window, backing off while the target fails."""
+        delay = self.window
+        while not self._stop.is_set():
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._flush():
+                delay = self.window
+            else:
+                delay = min(max(delay, self.window) * 2, self.max_backoff)
+        self._flush()
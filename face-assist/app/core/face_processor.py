@@ -1,114 +1,1221 @@
+import io
 import os
+import json
+import fcntl
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+import cv2
 import numpy as np
 import face_recognition
 from PIL import Image
 import logging
-from typing import Dict, List, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional, Union, BinaryIO
+from werkzeug.utils import secure_filename
+from .compaction import find_prototypes, novel_rows
+from .detector import FaceDetector
+from .encoding_cache import EncodingCache
+from .gallery import FaceGallery
+from .inference import InferenceBackend, Location, Rejection, create_backend
+from .metrics import registry
+from .quality import QualityGate
+from .quantization import dequantize, quantize
+from .result_cache import ResultCache, content_key
+from .search_index import create_index
+from .shared_gallery import SharedFaceGallery
+from ..config.default_config import (
+    FACE_MATCH_THRESHOLD, CONFIDENCE_THRESHOLD,
+    SEARCH_INDEX, INDEX_NPROBE, INDEX_MIN_GALLERY_SIZE, GALLERY_STORAGE,
+    ENROLL_DEDUPE, COMPACT_ABOVE, COMPACT_PROTOTYPES,
+    QUALITY_MIN_FACE_SIZE, QUALITY_MIN_SHARPNESS, QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS,
+    QUALITY_MIN_CONTRAST, QUALITY_MAX_YAW, QUALITY_MAX_ROLL,
+    ENROLL_WORKERS, MAX_IMAGE_SIZE, MAX_FACE_BOXES,
+    RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+    DETECTION_MODEL, DETECTION_UPSAMPLE, DETECTION_MAX_WIDTH,
+    MODELS_PATH, INFERENCE_BACKEND, EMBEDDER_MODEL, DETECTOR_MODEL,
+    INFERENCE_SESSIONS, INFERENCE_BATCH_SIZE, INFERENCE_THREADS, ONNX_MATCH_THRESHOLD,
+    SERVER_TOKEN_ENV
+)
+
+# Anything load_image accepts: a path, encoded bytes, a file-like object
+# or an already decoded RGB array
+ImageSource = Union[str, bytes, BinaryIO, np.ndarray]
+
+def load_image(source: ImageSource) -> np.ndarray:
+    """Decode an image source into an RGB array without touching disk.
+
+    Args:
+        source: Path, encoded bytes, file-like object or RGB array
+
+    Returns:
+        Image as an RGB numpy array
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return face_recognition.load_image_file(source)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Names of the /faces/import, /faces/progress and /faces/rebuild routes, which
+# a person could not be enrolled or looked up under
+RESERVED_NAMES = frozenset({'import', 'progress', 'rebuild'})
+
+# Face box that clamps to the whole image, for images that are face crops
+FULL_FRAME: Location = (0, 1 << 30, 1 << 30, 0)
+
+# Share of a supplied face box kept on every side when only that region of
+# an enrollment photo is stored, so a rebuild can still detect the face
+ENROLL_CROP_MARGIN = 0.5
+
+# Prototype counts set per person by FaceProcessor.compact
+COMPACTION_FILENAME = '.compaction.json'
+
+# Histogram of time spent per processing stage
+STAGE_METRIC = 'face_assist_stage_seconds'
+registry.describe(STAGE_METRIC, 'Time spent per face processing stage')
+registry.describe('face_assist_quality_rejections_total', 'Faces the quality gate kept from being encoded')
+
+def parse_boxes(boxes: any) -> List[Location]:
+    """Validate face boxes supplied by a caller.
+
+    Boxes are either [top, right, bottom, left] lists, the order locations
+    are reported in, or objects with `x`, `y`, `width` and `height`.
+
+    Args:
+        boxes: Decoded JSON list of boxes
+
+    Returns:
+        Boxes as (top, right, bottom, left) tuples, not yet clamped to an
+        image
+
+    Raises:
+        ValueError: If a box is malformed, empty or there are too many
+    """
+    if not isinstance(boxes, list) or not boxes:
+        raise ValueError('boxes must be a non-empty list')
+    if len(boxes) > MAX_FACE_BOXES:
+        raise ValueError(f'At most {MAX_FACE_BOXES} boxes per image')
+    locations = []
+    for box in boxes:
+        if isinstance(box, dict):
+            try:
+                x, y, width, height = (box[key] for key in ('x', 'y', 'width', 'height'))
+            except KeyError:
+                raise ValueError('Box objects need x, y, width and height')
+            box = [y, x + width, y + height, x] if _numbers([x, y, width, height]) else None
+        if not isinstance(box, (list, tuple)) or len(box) != 4 or not _numbers(box):
+            raise ValueError('Boxes must be [top, right, bottom, left] or {x, y, width, height}')
+        top, right, bottom, left = (int(round(value)) for value in box)
+        if bottom <= top or right <= left:
+            raise ValueError(f'Empty face box: {list(box)}')
+        locations.append((top, right, bottom, left))
+    return locations
+
+def _numbers(values: List[any]) -> bool:
+    """Whether every value is a finite number."""
+    return all(isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+               for value in values)
+
+def format_rejections(rejected: List[Rejection]) -> List[Dict[str, any]]:
+    """Rejected faces as JSON-ready dictionaries."""
+    return [
+        {'location': list(location), 'reason': reason, 'value': round(value, 2)}
+        for location, reason, value in rejected
+    ]
+
+def encode_image_file(img_path: str, backend: InferenceBackend, gate: Optional[QualityGate] = None) -> Tuple[
+        List[np.ndarray], List[Rejection], Optional[str]]:
+    """Detect and encode every face in an image file.
+
+    Runs inside enrollment worker processes, so failures are returned
+    instead of raised.
+
+    Args:
+        img_path: Path to the image file
+        backend: Inference backend to run
+        gate: Quality gate faces must pass to be encoded
+
+    Returns:
+        Tuple of (encodings, rejected faces, error message or None)
+    """
+    try:
+        image = face_recognition.load_image_file(img_path)
+        _, encodings, rejected, _ = backend.process(image, gate)
+        return encodings, rejected, None
+    except Exception as e:
+        return [], [], str(e)
+
+def encode_image_files_batched(paths: List[str], backend: InferenceBackend,
+                               gate: Optional[QualityGate] = None) -> Iterator[
+        Tuple[List[np.ndarray], List[Rejection], Optional[str]]]:
+    """Encode image files in batches with a backend that batches inference.
+
+    Args:
+        paths: Paths to the image files
+        backend: Inference backend to run
+        gate: Quality gate faces must pass to be encoded
+
+    Yields:
+        Tuples of (encodings, rejected faces, error message or None) in
+        input order
+    """
+    for start in range(0, len(paths), backend.batch_size):
+        images, errors = [], {}
+        for i, img_path in enumerate(paths[start:start + backend.batch_size]):
+            try:
+                images.append(face_recognition.load_image_file(img_path))
+            except Exception as e:
+                errors[i] = str(e)
+        try:
+            processed = iter(backend.process_batch(images, gate))
+        except Exception as e:
+            processed = None
+            errors = {i: str(e) for i in range(len(images) + len(errors))}
+        for i in range(len(images) + len(errors)):
+            if i in errors:
+                yield [], [], errors[i]
+            else:
+                _, encodings, rejected, _ = next(processed)
+                yield encodings, rejected, None
+
+def encode_image_data(data: bytes, backend: InferenceBackend, gate: Optional[QualityGate] = None,
+                      locations: Optional[List[Location]] = None) -> Tuple[
+        List[Location], List[np.ndarray], List[Rejection], Optional[str], Dict[str, float]]:
+    """Decode an in-memory image, then detect and encode every face.
+
+    Runs inside request worker processes, so failures are returned
+    instead of raised.
+
+    Args:
+        data: Encoded image bytes
+        backend: Inference backend to run
+        gate: Quality gate faces must pass to be encoded
+        locations: Face boxes supplied with the image; only these are
+            encoded, without running detection
+
+    Returns:
+        Tuple of (face locations, encodings, rejected faces, error message
+        or None, stage timings in seconds)
+    """
+    try:
+        start = time.perf_counter()
+        image = load_image(data)
+        decoded = time.perf_counter() - start
+        locations, encodings, rejected, timings = backend.process(image, gate, locations)
+        timings['decode'] = decoded
+        return locations, encodings, rejected, None, timings
+    except Exception as e:
+        return [], [], [], str(e), {}
+
+def read_archive_images(archive, person: Optional[str] = None) -> Iterator[Tuple[str, str, bytes]]:
+    """Read enrollment images from a zip archive.
+
+    Images are assigned to `person` if given, otherwise to the name of the
+    folder that contains them inside the archive.
+
+    Args:
+        archive: Path or file-like object of the zip archive
+        person: Optional name of the person all images belong to
+
+    Yields:
+        Tuples of (person, filename, image bytes)
+    """
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            parts = info.filename.replace('\\', '/').split('/')
+            owner = person or (parts[-2] if len(parts) > 1 else None)
+            if not owner or info.file_size > MAX_IMAGE_SIZE:
+                continue
+            yield owner, parts[-1], zf.read(info)
+
+def _crop_image(data: bytes, location: Location, ext: str) -> bytes:
+    """Re-encode the region of a face box plus ENROLL_CROP_MARGIN, or return the image if that is all of it."""
+    image = load_image(data)
+    height, width = image.shape[:2]
+    top, right, bottom, left = location
+    margin_y = int((bottom - top) * ENROLL_CROP_MARGIN)
+    margin_x = int((right - left) * ENROLL_CROP_MARGIN)
+    top, bottom = max(0, top - margin_y), min(height, bottom + margin_y)
+    left, right = max(0, left - margin_x), min(width, right + margin_x)
+    if (top, right, bottom, left) == (0, width, height, 0):
+        return data
+    ok, encoded = cv2.imencode(ext.lower() or '.jpg',
+                               cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_RGB2BGR))
+    if not ok:
+        raise ValueError(f"Cannot encode {ext} image")
+    return encoded.tobytes()
+
+def reserved_name_error(person: str) -> Optional[str]:
+    """Error for a person name taken by an API route, None if the name is free."""
+    if (secure_filename(person) or person) in RESERVED_NAMES:
+        return f"'{person}' is a reserved name, choose another name for the person"
+    return None
+
+def _rejection_message(rejected: List[Rejection]) -> str:
+    """Error for an image whose every face the quality gate rejected."""
+    _, reason, value = rejected[0]
+    return f"Face rejected by quality gate: {reason} ({value:.1f})"
+
+def _latency_probes(snapshot, people: List[str], count: int = 16, seed: int = 0) -> np.ndarray:
+    """Encodings of some of the people, used to time verification."""
+    labels = [snapshot.person_index[person] for person in people if person in snapshot]
+    rows = np.flatnonzero(np.isin(snapshot.labels, labels))
+    if not len(rows):
+        return np.empty((0, snapshot.matrix.shape[1]), dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(rows, min(count, len(rows)), replace=False))
+    return dequantize(snapshot.matrix[rows], None if snapshot.scales is None else snapshot.scales[rows])
+
+def _verify_latency(snapshot, people: List[str], probes: np.ndarray, max_people: int = 50) -> float:
+    """Mean seconds to compare one probe with every encoding of one person."""
+    people = people[:max_people]
+    if not people or not len(probes):
+        return 0.0
+    start = time.perf_counter()
+    for person in people:
+        for probe in probes:
+            snapshot.person_distances(person, probe)
+    return (time.perf_counter() - start) / (len(people) * len(probes))
 
 class FaceProcessor:
-    def __init__(self, face_db_path: str):
+    def __init__(self, face_db_path: str, workers: int = ENROLL_WORKERS, model_registry=None,
+                 shared_path: Optional[str] = None, backend: Optional[InferenceBackend] = None):
         """Initialize the face processor.
         
         Args:
             face_db_path: Path to the face database directory
+            workers: Number of worker processes used to encode images
+            model_registry: ModelRegistry uploaded models are loaded from
+            shared_path: Directory of a gallery shared with the other server
+                workers; each process holds its own gallery if omitted
+            backend: Inference backend to run, the configured one if omitted
         """
         self.face_db_path = face_db_path
-        self.known_faces: Dict[str, List[np.ndarray]] = {}
-        self.load_known_faces()
+        self.shared_path = shared_path
+        # Workers of one server start share the token, so the first one to
+        # load the gallery can tell the others apart from a previous run
+        self.server_token = os.environ.get(SERVER_TOKEN_ENV) or uuid.uuid4().hex
+        self.workers = workers
         self.logger = logging.getLogger(__name__)
+        self.progress = {'phase': 'idle', 'done': 0, 'total': 0}
+        self.backend = backend or create_backend(
+            INFERENCE_BACKEND,
+            FaceDetector(DETECTION_MODEL, DETECTION_UPSAMPLE, DETECTION_MAX_WIDTH, FACE_MATCH_THRESHOLD),
+            MODELS_PATH, EMBEDDER_MODEL, DETECTOR_MODEL, INFERENCE_SESSIONS,
+            INFERENCE_BATCH_SIZE, INFERENCE_THREADS, ONNX_MATCH_THRESHOLD,
+            registry=model_registry
+        )
+        self.backend.warmup()
+        self.match_threshold = self.backend.match_threshold
+        gate = QualityGate(QUALITY_MIN_FACE_SIZE, QUALITY_MIN_SHARPNESS, QUALITY_MIN_BRIGHTNESS,
+                           QUALITY_MAX_BRIGHTNESS, QUALITY_MIN_CONTRAST, QUALITY_MAX_YAW, QUALITY_MAX_ROLL)
+        self.quality_gate = gate if gate.enabled else None
+        # Enrollment photos this close to an enrolled face add nothing
+        self.dedupe_distance = ENROLL_DEDUPE * self.match_threshold
+        self._compaction_path = os.path.join(face_db_path, COMPACTION_FILENAME)
+        self._overrides: Dict[str, int] = {}
+        self._overrides_mtime: Optional[int] = None
+        self.metrics = registry
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+        # Single writer so enrollment images are persisted off the request path
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='face-writer')
+        # Whether a save of the encoding cache is queued on the writer
+        self._cache_save_pending = False
+        self._cache_save_lock = threading.Lock()
+        # Serializes writes, full loads and per-person syncs of the database;
+        # with a shared gallery a lock file extends it to the other workers
+        self._db_lock = threading.RLock()
+        self._db_lock_depth = 0
+        self.gallery = self._create_gallery()
+        self._db_lock_file = open(os.path.join(shared_path, 'database.lock'), 'a') if shared_path else None
+        # Encodings of different backends are not comparable, so each
+        # backend keeps its own cache and index files
+        suffix = self.backend.cache_suffix
+        self.encoding_cache = EncodingCache(face_db_path, f".encodings{suffix}.npz",
+                                            self.backend.embedding_dim, shared=bool(shared_path))
+        self.load_known_faces()
+
+    def _create_gallery(self) -> FaceGallery:
+        """Create an empty gallery with the configured search index."""
+        dim = self.backend.embedding_dim
+        index = create_index(
+            SEARCH_INDEX,
+            dim=dim,
+            nprobe=INDEX_NPROBE,
+            min_size=INDEX_MIN_GALLERY_SIZE,
+            path=os.path.join(self.face_db_path, f".index{self.backend.cache_suffix}.npz")
+        )
+        if self.shared_path:
+            return SharedFaceGallery(self.shared_path, dim=dim, index=index, storage=GALLERY_STORAGE)
+        return FaceGallery(dim=dim, index=index, storage=GALLERY_STORAGE)
+
+    @contextmanager
+    def _database_lock(self):
+        """Hold the database writer lock; reentrant within a process."""
+        with self._db_lock:
+            if self._db_lock_file and self._db_lock_depth == 0:
+                fcntl.flock(self._db_lock_file, fcntl.LOCK_EX)
+            self._db_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._db_lock_depth -= 1
+                if self._db_lock_file and self._db_lock_depth == 0:
+                    fcntl.flock(self._db_lock_file, fcntl.LOCK_UN)
+
+    def load_known_faces(self, force: bool = False) -> None:
+        """Load all known faces from the database directory.
+
+        Encodings are reused from the on-disk cache for unchanged images;
+        only new or modified images are encoded, on the worker pool, and
+        entries for deleted images are dropped.
+
+        With a shared gallery only the first worker of a server start scans
+        the database; the others wait for it and map what it published.
+
+        Args:
+            force: Scan the database even if the shared gallery is loaded
+        """
+        if not isinstance(self.gallery, SharedFaceGallery):
+            with self._database_lock():
+                self._load_known_faces()
+            return
+        with self._database_lock(), self.gallery.file_lock():
+            if not force and self.gallery.attach(self.server_token):
+                self.logger.info(f"Attached to shared gallery with {len(self.gallery)} encodings")
+                return
+            self._load_known_faces()
 
-    def load_known_faces(self) -> None:
-        """Load all known faces from the database directory."""
+    def _load_known_faces(self) -> None:
+        """Scan the database, encode what is not cached and publish the gallery."""
         try:
-            for person_dir in os.listdir(self.face_db_path):
-                person_path = os.path.join(self.face_db_path, person_dir)
-                if os.path.isdir(person_path):
-                    self._load_person_faces(person_dir, person_path)
+            images = self._scan_images()
         except Exception as e:
             self.logger.error(f"Error loading faces: {e}")
+            return
+
+        encodings: Dict[str, List[np.ndarray]] = {}
+        pending = []
+        for person, rel_path, stat in images:
+            try:
+                cached = self.encoding_cache.lookup(rel_path, stat)
+            except Exception as e:
+                self.logger.error(f"Error processing {rel_path}: {e}")
+                continue
+            if cached is None:
+                pending.append((person, rel_path, stat))
+            else:
+                encodings.setdefault(person, []).extend(cached)
+
+        for person, _, face_encodings, _, _ in self._encode_images(pending, 'loading'):
+            encodings.setdefault(person, []).extend(face_encodings)
+        encodings = {person: self._gallery_encodings(person, person_encodings)
+                     for person, person_encodings in encodings.items()}
+
+        if isinstance(self.gallery, SharedFaceGallery):
+            self.gallery.replace(encodings, self.server_token)
+        else:
+            gallery = self._create_gallery()
+            for person, person_encodings in encodings.items():
+                gallery.add(person, person_encodings)
+            self.gallery = gallery
+        self.metrics.inc('face_assist_gallery_loads_total')
+
+        removed = self.encoding_cache.prune(rel_path for _, rel_path, _ in images)
+        if removed:
+            self.logger.info(f"Dropped {removed} cached encodings for deleted images")
+        self.encoding_cache.save()
+
+    def rebuild(self) -> None:
+        """Re-encode every image in the database, ignoring cached encodings."""
+        self.encoding_cache.clear()
+        self.load_known_faces(force=True)
+
+    def _scan_images(self) -> List[Tuple[str, str, os.stat_result]]:
+        """List the enrollment images in the database directory.
+
+        Returns:
+            List of (person, database-relative path, stat result) tuples
+        """
+        images = []
+        for person_dir in os.listdir(self.face_db_path):
+            images.extend(self._scan_person(person_dir))
+        return images
+
+    def _scan_person(self, person: str) -> List[Tuple[str, str, os.stat_result]]:
+        """List the enrollment images in one person's folder, if it exists."""
+        person_path = os.path.join(self.face_db_path, person)
+        if not os.path.isdir(person_path):
+            return []
+        images = []
+        for img_file in os.listdir(person_path):
+            if img_file.lower().endswith(IMAGE_EXTENSIONS):
+                img_path = os.path.join(person_path, img_file)
+                try:
+                    images.append((person, os.path.join(person, img_file), os.stat(img_path)))
+                except FileNotFoundError:
+                    continue
+        return images
+
+    def sync_people(self, people: Iterable[str]) -> Dict[str, int]:
+        """Bring the gallery in line with the folders of some people.
+
+        Each person's encodings are rebuilt from the images in their folder,
+        reusing cached encodings and encoding only new or changed images.
+        People whose folder is gone are removed from the gallery, and people
+        the gallery already holds exactly are left alone, so the watcher
+        does not publish the writes of enrollments again. Requests keep
+        using the previous snapshot until the new one is published.
 
-    def _load_person_faces(self, person: str, path: str) -> None:
-        """Load face encodings for a specific person.
-        
         Args:
-            person: Name of the person
-            path: Path to person's directory
+            people: Names of the people whose folders changed
+
+        Returns:
+            Number of encodings now stored per person
+        """
+        counts = {}
+        with self._database_lock():
+            # Other workers may have cached the images they enrolled
+            self.encoding_cache.refresh()
+            for person in people:
+                counts[person] = self._sync_person(person)
+            self.encoding_cache.save()
+        return counts
+
+    def _sync_person(self, person: str) -> int:
+        """Rebuild the encodings of one person from their folder."""
+        images = self._scan_person(person)
+        encodings: List[np.ndarray] = []
+        pending = []
+        for _, rel_path, stat in images:
+            try:
+                cached = self.encoding_cache.lookup(rel_path, stat)
+            except OSError as e:
+                self.logger.error(f"Error processing {rel_path}: {e}")
+                continue
+            if cached is None:
+                pending.append((person, rel_path, stat))
+            else:
+                encodings.extend(cached)
+        for _, _, face_encodings, _, _ in self._encode_images(pending, 'syncing'):
+            encodings.extend(face_encodings)
+
+        self.encoding_cache.prune((rel_path for _, rel_path, _ in images),
+                                  prefix=os.path.join(person, ''))
+        encodings = self._gallery_encodings(person, encodings)
+        if self._gallery_holds(person, encodings):
+            return len(encodings)
+        count = self.gallery.set_person(person, encodings)
+        self.logger.info(f"Synced {person}: {len(images)} images, {count} encodings")
+        return count
+
+    def _gallery_holds(self, person: str, encodings: List[np.ndarray]) -> bool:
+        """Whether the gallery stores exactly these encodings for a person, in any order."""
+        stored = self.gallery.snapshot.person_vectors(person)
+        if len(stored) != len(encodings):
+            return False
+        if not len(stored):
+            return True
+        rows = np.asarray(encodings, dtype=np.float32).reshape(len(stored), -1)
+        expected = dequantize(*quantize(rows, self.gallery.storage))
+        return np.array_equal(expected[np.lexsort(expected.T)], stored[np.lexsort(stored.T)])
+
+    def _compaction_overrides(self) -> Dict[str, int]:
+        """Prototype counts set per person by `compact`, reread when the file changes."""
+        try:
+            mtime = os.stat(self._compaction_path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if mtime != self._overrides_mtime:
+            try:
+                with open(self._compaction_path) as f:
+                    self._overrides = {str(person): int(k) for person, k in json.load(f).items()}
+            except (OSError, ValueError, AttributeError) as e:
+                self.logger.warning(f"Ignoring unreadable compaction settings: {e}")
+                self._overrides = {}
+            self._overrides_mtime = mtime
+        return self._overrides
+
+    def _save_overrides(self, overrides: Dict[str, int]) -> None:
+        """Atomically write the per-person prototype counts."""
+        tmp_path = f"{self._compaction_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(overrides, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._compaction_path)
+
+    def _prototype_count(self, person: str, count: int) -> Optional[int]:
+        """Number of prototypes a person with `count` encodings is reduced to, None to keep them all."""
+        k = self._compaction_overrides().get(person)
+        if k is None and COMPACT_ABOVE and count > COMPACT_ABOVE:
+            k = COMPACT_PROTOTYPES
+        return k if k and count > k else None
+
+    def _gallery_encodings(self, person: str, encodings: List[np.ndarray]) -> List[np.ndarray]:
+        """The encodings the gallery holds for a person: all of them or their prototypes."""
+        k = self._prototype_count(person, len(encodings))
+        if k is None:
+            return encodings
+        return list(find_prototypes(np.asarray(encodings), k))
+
+    def _compact_if_needed(self, person: str) -> None:
+        """Fold encodings added to a compacted person back into prototypes."""
+        k = self._prototype_count(person, self.encoding_cache.count(os.path.join(person, '')))
+        if k is not None and self.gallery.count(person) > k:
+            self.sync_people([person])
+
+    def compact(self, person: Optional[str] = None, prototypes: Optional[int] = None) -> Dict[str, any]:
+        """Replace the encodings of people by a few prototypes.
+
+        Each person's encodings are clustered and the gallery keeps the
+        cluster centers, so verification compares against a handful of
+        encodings instead of every photo. Enrollment images and their cached
+        encodings are kept; the setting is stored in the database, so it
+        survives restarts and later enrollments are folded in.
+
+        Args:
+            person: Person to compact, every person with a folder if omitted
+            prototypes: Prototypes to keep per person, `compact_prototypes`
+                if omitted; 0 restores every encoding
+
+        Returns:
+            Dictionary with the gallery size, its memory and the mean
+            verification latency before and after, and the encodings per
+            compacted person
+        """
+        if prototypes is None:
+            prototypes = COMPACT_PROTOTYPES
+        before = self.gallery.snapshot
+        if person is None:
+            people = [p for p in before.people if os.path.isdir(os.path.join(self.face_db_path, p))]
+        else:
+            people = [self._person_key(person)]
+
+        with self._database_lock():
+            overrides = dict(self._compaction_overrides())
+            for name in people:
+                if prototypes:
+                    overrides[name] = prototypes
+                else:
+                    overrides.pop(name, None)
+            self._save_overrides(overrides)
+            self.sync_people(people)
+        after = self.gallery.snapshot
+
+        probes = _latency_probes(before, people)
+        return {
+            'encodings': {'before': len(before), 'after': len(after)},
+            'bytes': {'before': before.matrix.nbytes, 'after': after.matrix.nbytes},
+            'verify_ms': {'before': _verify_latency(before, people, probes) * 1000,
+                          'after': _verify_latency(after, people, probes) * 1000},
+            'people': {name: {'before': before.count(name), 'after': after.count(name)}
+                       for name in people}
+        }
+
+    def delete_person(self, person: str) -> bool:
+        """Delete a person's folder and remove them from the gallery.
+
+        Returns:
+            True if the person had a folder or encodings
+        """
+        person = secure_filename(person)
+        person_path = os.path.join(self.face_db_path, person)
+        existed = person in self.gallery or os.path.isdir(person_path)
+        if not person or not existed:
+            return False
+        with self._database_lock():
+            shutil.rmtree(person_path, ignore_errors=True)
+            overrides = self._compaction_overrides()
+            if person in overrides:
+                self._save_overrides({name: k for name, k in overrides.items() if name != person})
+            self.sync_people([person])
+        return True
+
+    def delete_image(self, person: str, filename: str) -> bool:
+        """Delete one enrollment image and drop its encodings from the gallery.
+
+        Returns:
+            True if the image existed
+        """
+        person, filename = secure_filename(person), secure_filename(filename)
+        img_path = os.path.join(self.face_db_path, person, filename)
+        if not person or not filename.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(img_path):
+            return False
+        with self._database_lock():
+            os.remove(img_path)
+            self.sync_people([person])
+        return True
+
+    def list_images(self, person: str) -> List[str]:
+        """File names of a person's enrollment images."""
+        return sorted(os.path.basename(rel_path) for _, rel_path, _ in self._scan_person(secure_filename(person)))
+
+    def _encode_images(self, images: List[Tuple[str, str, Optional[os.stat_result]]],
+                       phase: str) -> Iterator[Tuple[str, str, List[np.ndarray], List[Rejection], Optional[str]]]:
+        """Encode database images on the worker pool and cache the results.
+
+        Args:
+            images: List of (person, database-relative path, stat result)
+            phase: Name of the operation reported in `progress`
+
+        Yields:
+            Tuples of (person, relative path, encodings, faces rejected by
+            the quality gate, error message or None) in input order; failed
+            images are logged and not cached
         """
-        encodings = []
-        for img_file in os.listdir(path):
-            if img_file.lower().endswith(('.png', '.jpg', '.jpeg')):
+        total = len(images)
+        self.progress = {'phase': phase, 'done': 0, 'total': total}
+        if not total:
+            self.progress['phase'] = 'idle'
+            return
+
+        paths = [os.path.join(self.face_db_path, rel_path) for _, rel_path, _ in images]
+        encode = partial(encode_image_file, backend=self.backend, gate=self.quality_gate)
+        workers = min(self.workers, total) if self.backend.multiprocess else 1
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if executor:
+                results = executor.map(encode, paths, chunksize=max(1, total // (workers * 4)))
+            elif self.backend.batch_size > 1:
+                results = encode_image_files_batched(paths, self.backend, self.quality_gate)
+            else:
+                results = map(encode, paths)
+            self.logger.info(f"Encoding {total} images with {max(workers, 1)} workers ({phase})")
+            step = max(1, total // 20)
+
+            for done, ((person, rel_path, stat), img_path, (face_encodings, rejected, error)) in enumerate(
+                    zip(images, paths, results), start=1):
+                self.progress['done'] = done
+                if done % step == 0 or done == total:
+                    self.logger.info(f"Encoded {done}/{total} images ({phase})")
+                if error:
+                    self.logger.error(f"Error processing {img_path}: {error}")
+                else:
+                    self._count_rejections(rejected)
+                    try:
+                        self.encoding_cache.store(rel_path, face_encodings, stat)
+                    except Exception as e:
+                        self.logger.error(f"Error caching encodings for {img_path}: {e}")
+                yield person, rel_path, face_encodings, rejected, error
+        finally:
+            if executor:
+                executor.shutdown()
+            self.progress['phase'] = 'idle'
+
+    def import_images(self, items: Iterable[Tuple[str, str, bytes]]) -> Dict[str, any]:
+        """Enroll many images at once on the worker pool.
+
+        Images are written to the person's folder in the database; images
+        without a detectable face, whose faces all fail the quality gate,
+        that fail to process or that only repeat an enrolled face are
+        removed again.
+
+        Args:
+            items: Iterable of (person, filename, image bytes)
+
+        Returns:
+            Dictionary with the number of imported images, per-image
+            failures and the updated face counts per person
+        """
+        # Held from the first write to the last add, so a sync of the same
+        # folders cannot add the images to the gallery a second time
+        with self._database_lock():
+            images = []
+            failed = []
+            for person, filename, data in items:
+                person, filename = secure_filename(person), secure_filename(filename)
+                if not person or not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    failed.append({'file': filename, 'error': 'Unsupported image'})
+                    continue
+                if person in RESERVED_NAMES:
+                    failed.append({'file': filename, 'error': reserved_name_error(person)})
+                    continue
                 try:
-                    img_path = os.path.join(path, img_file)
-                    image = face_recognition.load_image_file(img_path)
-                    face_encodings = face_recognition.face_encodings(image)
-                    if face_encodings:
-                        encodings.extend(face_encodings)
+                    img_path = self._unique_path(person, filename)
+                    with open(img_path, 'wb') as f:
+                        f.write(data)
+                    images.append((person, os.path.relpath(img_path, self.face_db_path), None))
                 except Exception as e:
-                    self.logger.error(f"Error processing {img_path}: {e}")
-        
-        if encodings:
-            self.known_faces[person] = encodings
+                    self.logger.error(f"Error saving {filename}: {e}")
+                    failed.append({'file': filename, 'error': str(e)})
+
+            imported = 0
+            encodings: Dict[str, List[np.ndarray]] = {}
+            snapshot = self.gallery.snapshot
+            for person, rel_path, face_encodings, rejected, error in self._encode_images(images, 'importing'):
+                if not error and not len(face_encodings):
+                    error = _rejection_message(rejected) if rejected else 'No face detected in image'
+                elif not error and self._is_duplicate(face_encodings, np.concatenate(
+                        [snapshot.person_vectors(person)] + encodings.get(person, []))):
+                    error = 'Near-duplicate of an enrolled face'
+                if error:
+                    failed.append({'file': rel_path, 'error': error})
+                    os.remove(os.path.join(self.face_db_path, rel_path))
+                    self.encoding_cache.discard(rel_path)
+                    continue
+                encodings.setdefault(person, []).append(np.asarray(face_encodings, dtype=np.float32))
+                imported += 1
+
+            for person, person_encodings in encodings.items():
+                self.gallery.add(person, np.concatenate(person_encodings))
+            self.encoding_cache.save()
+            for person in encodings:
+                self._compact_if_needed(person)
+            counts = {person: self.get_face_count(person) for person in encodings}
 
-    def add_face(self, person: str, image_path: str) -> Tuple[bool, str]:
+        return {
+            'imported': imported,
+            'failed': failed,
+            'people': counts
+        }
+
+    def _unique_path(self, person: str, filename: str) -> str:
+        """Return a path in the person's folder that does not exist yet."""
+        person_path = os.path.join(self.face_db_path, person)
+        os.makedirs(person_path, exist_ok=True)
+        stem, ext = os.path.splitext(filename)
+        img_path = os.path.join(person_path, filename)
+        suffix = 1
+        while os.path.exists(img_path):
+            img_path = os.path.join(person_path, f"{stem}_{suffix}{ext}")
+            suffix += 1
+        return img_path
+
+    def add_face(self, person: str, image: ImageSource, filename: Optional[str] = None,
+                 boxes: Optional[List[Location]] = None) -> Tuple[bool, str]:
         """Add a new face to the database.
+
+        Encoded images given with a filename are written to the person's
+        folder once, in the background, after the face has been enrolled.
+        With a face box only the region around it is written, so other
+        people in the photo are not enrolled when the database is rebuilt.
         
         Args:
             person: Name of the person
-            image_path: Path to the image file
+            image: Path, encoded bytes, file-like object or RGB array
+            filename: Name to persist an in-memory image under
+            boxes: Face boxes found upstream, encoded without detection
             
         Returns:
             Tuple of (success, message)
         """
+        error = reserved_name_error(person)
+        if error:
+            return False, error
         try:
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
+            if hasattr(image, 'read'):
+                image = image.read()
+            locations, face_encodings, rejected = self._extract_faces(image, boxes)
             
             if not face_encodings:
-                return False, "No face detected in image"
-            
-            if person not in self.known_faces:
-                self.known_faces[person] = []
+                return False, _rejection_message(rejected) if rejected else "No face detected in image"
             
-            self.known_faces[person].extend(face_encodings)
+            # Enroll under the folder name, so syncs and restarts agree on it
+            person = self._person_key(person)
+            with self._database_lock():
+                if self._is_duplicate(face_encodings, self.gallery.snapshot.person_vectors(person)):
+                    return False, "Near-duplicate of an enrolled face"
+                self.gallery.add(person, face_encodings)
+            if isinstance(image, str):
+                self._cache_image(image, face_encodings)
+            elif filename and isinstance(image, (bytes, bytearray, memoryview)):
+                self._writer.submit(self._persist_image, person, filename, bytes(image),
+                                    face_encodings, locations[0] if boxes else None)
             return True, "Face added successfully"
             
         except Exception as e:
             self.logger.error(f"Error adding face: {e}")
             return False, f"Error processing image: {str(e)}"
 
-    def verify_face(self, person: str, image_path: str) -> Tuple[bool, float]:
+    def _persist_image(self, person: str, filename: str, data: bytes,
+                       encodings: List[np.ndarray], region: Optional[Location] = None) -> None:
+        """Write an enrolled image to the database and cache its encodings.
+
+        Args:
+            person: Name of the person
+            filename: Original filename of the image
+            data: Encoded image bytes
+            encodings: Encodings computed for the image
+            region: Face box to store with a margin instead of the whole
+                image
+        """
+        try:
+            if region is not None:
+                data = _crop_image(data, region, os.path.splitext(filename)[1])
+            # The image is cached before a sync can see it, so the sync finds
+            # it in the gallery already
+            with self._database_lock(), self.metrics.time(STAGE_METRIC, stage='disk'):
+                img_path = self._unique_path(secure_filename(person), secure_filename(filename))
+                tmp_path = f"{img_path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, img_path)
+                self._cache_image(img_path, encodings)
+        except Exception as e:
+            self.logger.error(f"Error saving image for {person}: {e}")
+
+    def _cache_image(self, image_path: str, encodings: List[np.ndarray]) -> None:
+        """Persist encodings for an image stored inside the face database.
+
+        Args:
+            image_path: Path to the image file
+            encodings: Encodings computed for the image
+        """
+        rel_path = os.path.relpath(image_path, self.face_db_path)
+        if rel_path.startswith(os.pardir):
+            return
+        try:
+            self.encoding_cache.store(rel_path, encodings)
+            self._schedule_cache_save()
+            self._compact_if_needed(os.path.dirname(rel_path))
+        except Exception as e:
+            self.logger.error(f"Error caching encodings for {image_path}: {e}")
+
+    def _schedule_cache_save(self) -> None:
+        """Queue a save of the encoding cache on the writer unless one is queued.
+
+        The writer runs its tasks in order, so the save comes after the
+        images queued so far and writes all of their encodings at once
+        instead of rewriting the cache file for every image.
+        """
+        with self._cache_save_lock:
+            if self._cache_save_pending:
+                return
+            self._cache_save_pending = True
+        try:
+            self._writer.submit(self._save_cache)
+        except RuntimeError:
+            self._cache_save_pending = False
+            raise
+
+    def _save_cache(self) -> None:
+        """Write the encoding cache from the writer thread."""
+        with self._cache_save_lock:
+            # Images cached during the save queue the next one
+            self._cache_save_pending = False
+        try:
+            with self.metrics.time(STAGE_METRIC, stage='disk'):
+                self.encoding_cache.save()
+        except Exception as e:
+            self.logger.error(f"Error saving encoding cache: {e}")
+
+    def _is_duplicate(self, encodings: List[np.ndarray], enrolled: np.ndarray) -> bool:
+        """Whether every face of an image is a near-duplicate of an enrolled encoding."""
+        if not self.dedupe_distance or not len(enrolled):
+            return False
+        return not novel_rows(np.asarray(encodings), enrolled, self.dedupe_distance).any()
+
+    def verify_face(self, person: str, image: ImageSource,
+                    rejected: Optional[List[Rejection]] = None,
+                    boxes: Optional[List[Location]] = None) -> Tuple[bool, float]:
         """Verify if a face matches a known person.
         
         Args:
             person: Name of the person to verify against
-            image_path: Path to the image to verify
+            image: Path, encoded bytes, file-like object or RGB array
+            rejected: List the faces the quality gate turned away are
+                added to
+            boxes: Face boxes found upstream, encoded without detection;
+                the first one is verified
             
         Returns:
             Tuple of (match boolean, confidence percentage)
         """
         try:
-            if person not in self.known_faces:
+            # One snapshot serves the whole request without locking
+            gallery = self.gallery.snapshot
+            person = self._person_key(person)
+            if person not in gallery:
                 return False, 0.0
             
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
+            _, face_encodings, gated = self._extract_faces(image, boxes)
+            if rejected is not None:
+                rejected.extend(gated)
             
             if not face_encodings:
                 return False, 0.0
             
-            matches = face_recognition.compare_faces(
-                self.known_faces[person], 
-                face_encodings[0],
-                tolerance=0.6
-            )
-            
-            confidence = (sum(matches) / len(matches)) * 100 if matches else 0.0
-            return confidence >= 80, confidence
+            with self.metrics.time(STAGE_METRIC, stage='match'):
+                distances = gallery.person_distances(person, face_encodings[0])[0]
+            if not len(distances):
+                return False, 0.0
+
+            confidence = float(np.mean(distances <= self.match_threshold) * 100)
+            return confidence >= CONFIDENCE_THRESHOLD, confidence
             
         except Exception as e:
             self.logger.error(f"Error verifying face: {e}")
             return False, 0.0
 
+    def identify_face(self, image: ImageSource, top_k: int = 3,
+                      rejected: Optional[List[Rejection]] = None,
+                      boxes: Optional[List[Location]] = None) -> List[Dict[str, any]]:
+        """Identify every face in an image against the whole gallery.
+        
+        Args:
+            image: Path, encoded bytes, file-like object or RGB array
+            top_k: Number of candidate people to return per face
+            rejected: List the faces the quality gate turned away are
+                added to
+            boxes: Face boxes found upstream, encoded in one pass without
+                detection
+            
+        Returns:
+            List with one entry per detected face, holding its location
+            and the closest known people sorted by distance
+        """
+        try:
+            locations, face_encodings, gated = self._extract_faces(image, boxes)
+            if rejected is not None:
+                rejected.extend(gated)
+            if not locations:
+                return []
+
+            with self.metrics.time(STAGE_METRIC, stage='match'):
+                ranked = self.gallery.identify(
+                    np.asarray(face_encodings), top_k, self.match_threshold
+                )
+            return self._format_faces(locations, ranked)
+            
+        except Exception as e:
+            self.logger.error(f"Error identifying face: {e}")
+            return []
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Work waiting in the background writer and the request pool."""
+        executor = self._executor
+        return {
+            'image_writer': self._writer._work_queue.qsize(),
+            'encode_pool': len(getattr(executor, '_pending_work_items', ())) if executor else 0
+        }
+
+    def _extract_faces(self, image: ImageSource, boxes: Optional[List[Location]] = None) -> Tuple[
+            List[Location], List[np.ndarray], List[Rejection]]:
+        """Detect every face in an image and encode those passing the quality gate.
+
+        Results for encoded bytes are served from the content-hash cache
+        when the same image was processed recently.
+
+        Args:
+            image: Path, encoded bytes, file-like object or RGB array
+            boxes: Face boxes found upstream; detection is skipped
+
+        Returns:
+            Tuple of (face locations, encodings, rejected faces)
+        """
+        key = None
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            key = content_key(image, boxes)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        image = load_image(image)
+        decoded = time.perf_counter() - start
+        locations, encodings, rejected, timings = self.backend.process(image, self.quality_gate, boxes)
+        timings['decode'] = decoded
+        self._record_stages(timings)
+        self._count_rejections(rejected)
+        result = (locations, encodings, rejected)
+        if key:
+            self.result_cache.put(key, result)
+        return result
+
+    def _record_stages(self, timings: Dict[str, float]) -> None:
+        """Add per-stage timings in seconds to the stage histogram."""
+        for stage, seconds in timings.items():
+            self.metrics.observe(STAGE_METRIC, seconds, stage=stage)
+
+    def _count_rejections(self, rejected: List[Rejection]) -> None:
+        """Count the faces the quality gate rejected, by reason."""
+        for _, reason, _ in rejected:
+            self.metrics.inc('face_assist_quality_rejections_total', reason=reason)
+
+    def _format_faces(self, locations: List[Location],
+                      ranked: List[List[Tuple[str, float, float]]]) -> List[Dict[str, any]]:
+        """Pair face locations with their ranked identification candidates."""
+        return [
+            {
+                'location': list(location),
+                'candidates': [
+                    {
+                        'name': person,
+                        'distance': distance,
+                        'confidence': confidence,
+                        'match': distance <= self.match_threshold
+                    }
+                    for person, distance, confidence in candidates
+                ]
+            }
+            for location, candidates in zip(locations, ranked)
+        ]
+
+    def _encode_batch(self, images: List[bytes], boxes: Optional[List[Optional[List[Location]]]] = None) -> List[
+            Tuple[List[Location], List[np.ndarray], List[Rejection], Optional[str]]]:
+        """Decode, detect and encode a batch of images concurrently.
+
+        Args:
+            images: Encoded image bytes
+            boxes: Face boxes found upstream per image, None for the
+                images faces are detected in
+
+        Returns:
+            One (locations, encodings, rejected faces, error) tuple per
+            image, in order; cached images are not sent to the pool
+        """
+        boxes = boxes or [None] * len(images)
+        keys = [content_key(data, image_boxes) for data, image_boxes in zip(images, boxes)]
+        results = []
+        misses = []
+        for i, key in enumerate(keys):
+            cached = self.result_cache.get(key)
+            results.append(cached + (None,) if cached is not None else None)
+            if cached is None:
+                misses.append(i)
+        if not misses:
+            return results
+
+        pending = [images[i] for i in misses]
+        pending_boxes = [boxes[i] for i in misses]
+        encode = partial(encode_image_data, backend=self.backend, gate=self.quality_gate)
+        if not self.backend.multiprocess and len(pending) > 1:
+            encoded = self._encode_batched(pending, pending_boxes)
+        elif self.workers <= 1 or len(pending) <= 1:
+            encoded = [encode(data, locations=image_boxes) for data, image_boxes in zip(pending, pending_boxes)]
+        else:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            futures = [self._executor.submit(encode, data, locations=image_boxes)
+                       for data, image_boxes in zip(pending, pending_boxes)]
+            encoded = [future.result() for future in futures]
+
+        for i, (locations, face_encodings, rejected, error, timings) in zip(misses, encoded):
+            results[i] = (locations, face_encodings, rejected, error)
+            self._record_stages(timings)
+            self._count_rejections(rejected)
+            if not error:
+                self.result_cache.put(keys[i], (locations, face_encodings, rejected))
+        return results
+
+    def _encode_batched(self, images: List[bytes], boxes: List[Optional[List[Location]]]) -> List[Tuple[
+            List[Location], List[np.ndarray], List[Rejection], Optional[str], Dict[str, float]]]:
+        """Decode images, then run them through the backend in batches."""
+        decoded, errors = [], {}
+        for i, data in enumerate(images):
+            start = time.perf_counter()
+            try:
+                decoded.append((i, load_image(data), time.perf_counter() - start))
+            except Exception as e:
+                errors[i] = str(e)
+
+        results = [([], [], [], errors.get(i), {}) for i in range(len(images))]
+        size = self.backend.batch_size
+        for start in range(0, len(decoded), size):
+            chunk = decoded[start:start + size]
+            try:
+                processed = self.backend.process_batch([image for _, image, _ in chunk], self.quality_gate,
+                                                       [boxes[i] for i, _, _ in chunk])
+            except Exception as e:
+                for i, _, _ in chunk:
+                    results[i] = ([], [], [], str(e), {})
+                continue
+            for (i, _, decode_time), (locations, encodings, rejected, timings) in zip(chunk, processed):
+                timings['decode'] = decode_time
+                results[i] = (locations, encodings, rejected, None, timings)
+        return results
+
+    def verify_faces(self, person: str, images: List[bytes],
+                     boxes: Optional[List[Optional[List[Location]]]] = None) -> List[Dict[str, any]]:
+        """Verify a batch of images against one known person.
+
+        The first face of every image is matched against the person's
+        encodings in a single vectorized distance computation.
+
+        Args:
+            person: Name of the person to verify against
+            images: Encoded image bytes
+            boxes: Face boxes found upstream per image, None for the
+                images faces are detected in
+
+        Returns:
+            One result per image, in request order, holding either `match`
+            and `confidence` or an `error`, and the faces the quality gate
+            rejected if there were any
+        """
+        encoded = self._encode_batch(images, boxes)
+        results: List[Dict[str, any]] = [{} for _ in images]
+        probes, probe_slots = [], []
+        for i, (_, face_encodings, rejected, error) in enumerate(encoded):
+            if error:
+                results[i] = {'error': f"Error processing image: {error}"}
+            elif not face_encodings:
+                results[i] = {'error': _rejection_message(rejected) if rejected else 'No face detected in image'}
+            else:
+                probes.append(face_encodings[0])
+                probe_slots.append(i)
+
+        if probes:
+            with self.metrics.time(STAGE_METRIC, stage='match'):
+                distances = self.gallery.person_distances(self._person_key(person), np.asarray(probes))
+            for i, row in zip(probe_slots, distances):
+                confidence = float(np.mean(row <= self.match_threshold) * 100) if len(row) else 0.0
+                results[i] = {
+                    'match': confidence >= CONFIDENCE_THRESHOLD,
+                    'confidence': confidence
+                }
+        for result, (_, _, rejected, _) in zip(results, encoded):
+            if rejected:
+                result['rejected'] = format_rejections(rejected)
+        return results
+
+    def identify_faces(self, images: List[bytes], top_k: int = 3,
+                       boxes: Optional[List[Optional[List[Location]]]] = None) -> List[Dict[str, any]]:
+        """Identify every face in a batch of images.
+
+        All faces from all images are ranked against the gallery in one
+        vectorized step.
+
+        Args:
+            images: Encoded image bytes
+            top_k: Number of candidate people to return per face
+            boxes: Face boxes found upstream per image, None for the
+                images faces are detected in
+
+        Returns:
+            One result per image, in request order, holding either the
+            detected `faces` with their candidates and the `rejected` faces
+            or an `error`
+        """
+        encoded = self._encode_batch(images, boxes)
+        probes = [encoding for _, face_encodings, _, _ in encoded for encoding in face_encodings]
+        ranked = []
+        if probes:
+            with self.metrics.time(STAGE_METRIC, stage='match'):
+                ranked = self.gallery.identify(np.asarray(probes), top_k, self.match_threshold)
+
+        results = []
+        offset = 0
+        for locations, face_encodings, rejected, error in encoded:
+            if error:
+                results.append({'error': f"Error processing image: {error}"})
+                continue
+            count = len(face_encodings)
+            results.append({
+                'faces': self._format_faces(locations, ranked[offset:offset + count]),
+                'rejected': format_rejections(rejected)
+            })
+            offset += count
+        return results
+
     def get_face_count(self, person: str) -> int:
         """Get the number of faces stored for a person.
         
@@ -118,7 +1225,15 @@ class FaceProcessor:
         Returns:
             Number of faces stored
         """
-        return len(self.known_faces.get(person, []))
+        return self.gallery.count(self._person_key(person))
+
+    def has_person(self, person: str) -> bool:
+        """Whether a person has encodings in the gallery."""
+        return self._person_key(person) in self.gallery
+
+    def _person_key(self, person: str) -> str:
+        """Name a person is stored under: their folder name in the database."""
+        return secure_filename(person) or person
 
     def list_people(self) -> List[Dict[str, any]]:
         """Get list of all people in the database with their face counts.
@@ -129,7 +1244,7 @@ class FaceProcessor:
         return [
             {
                 'name': person,
-                'face_count': len(encodings)
+                'face_count': count
             }
-            for person, encodings in self.known_faces.items()
+            for person, count in self.gallery.counts().items()
         ]
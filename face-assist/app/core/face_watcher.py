@@ -0,0 +1,244 @@
+import os
+import fcntl
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Set, Tuple
+
+# inotify event masks from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+class Inotify:
+    def __init__(self):
+        """Minimal inotify binding through libc.
+
+        Raises:
+            OSError: If inotify is not available on this system
+        """
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read(self, timeout: float):
+        """Wait up to timeout seconds and return (wd, mask, name) events."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class FaceDatabaseWatcher:
+    def __init__(self, face_db_path: str, on_change: Callable[[Set[str]], None],
+                 extensions: Tuple[str, ...], debounce: float = 2.0, poll_interval: float = 10.0,
+                 lock_path: Optional[str] = None):
+        """Initialize the watcher of the face database directory.
+
+        Changes are detected with inotify where the kernel supports it and
+        by comparing file sizes and modification times every
+        `poll_interval` seconds otherwise, for example on network shares.
+        The names of the people whose folders changed are collected until
+        no change was seen for `debounce` seconds, so a copy of many photos
+        results in one update per person.
+
+        Args:
+            face_db_path: Path to the face database directory
+            on_change: Called from the watcher thread with the changed people
+            extensions: File name endings of enrollment images
+            debounce: Quiet seconds before changes are reported
+            poll_interval: Seconds between scans when polling
+            lock_path: Lock file that makes only one of several server
+                workers watch the database
+        """
+        self.face_db_path = face_db_path
+        self.on_change = on_change
+        self.extensions = extensions
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.lock_path = lock_path
+        self.logger = logging.getLogger(__name__)
+        self.mode: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start watching in a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='face-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _is_image(self, name: str) -> bool:
+        return name.lower().endswith(self.extensions)
+
+    def _run(self) -> None:
+        lock_file = None
+        if self.lock_path:
+            lock_file = open(self.lock_path, 'a')
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError:
+                    if self._stop.wait(self.poll_interval):
+                        lock_file.close()
+                        return
+        try:
+            inotify = None
+            try:
+                inotify = Inotify()
+                self._watch(inotify)
+            except (OSError, AttributeError) as e:
+                self.logger.info(f"inotify unavailable ({e}), polling the face database")
+            finally:
+                if inotify is not None:
+                    inotify.close()
+            if not self._stop.is_set():
+                self._poll()
+        except Exception as e:
+            self.logger.error(f"Face database watcher stopped: {e}")
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def _report(self, changed: Set[str]) -> None:
+        try:
+            self.on_change(changed)
+        except Exception as e:
+            self.logger.error(f"Error syncing face database: {e}")
+
+    def _watch(self, inotify: Inotify) -> None:
+        """Follow inotify events until stopped; returns early to fall back to polling."""
+        people: Dict[int, str] = {}
+
+        def watch_person(person: str) -> None:
+            path = os.path.join(self.face_db_path, person)
+            try:
+                people[inotify.add_watch(path)] = person
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+
+        root = inotify.add_watch(self.face_db_path)
+        for name in os.listdir(self.face_db_path):
+            if not name.startswith('.') and os.path.isdir(os.path.join(self.face_db_path, name)):
+                watch_person(name)
+        self.mode = 'inotify'
+        self.logger.info(f"Watching {self.face_db_path} with inotify")
+
+        pending: Set[str] = set()
+        last_event = 0.0
+        while not self._stop.is_set():
+            timeout = self.debounce if pending else 1.0
+            for wd, mask, name in inotify.read(timeout):
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost; rescan every person
+                    pending.update(n for n in os.listdir(self.face_db_path) if not n.startswith('.'))
+                elif wd == root:
+                    if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                        return
+                    if not (mask & IN_ISDIR) or name.startswith('.'):
+                        continue
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        watch_person(name)
+                    pending.add(name)
+                elif mask & IN_IGNORED:
+                    people.pop(wd, None)
+                elif wd in people and (self._is_image(name) or mask & (IN_DELETE_SELF | IN_MOVE_SELF)):
+                    pending.add(people[wd])
+                else:
+                    continue
+                last_event = time.monotonic()
+            if pending and time.monotonic() - last_event >= self.debounce:
+                changed, pending = pending, set()
+                self._report(changed)
+
+    def _scan(self) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """Size and modification time of every image, per person."""
+        state = {}
+        for person in os.listdir(self.face_db_path):
+            person_path = os.path.join(self.face_db_path, person)
+            if person.startswith('.') or not os.path.isdir(person_path):
+                continue
+            files = {}
+            for name in os.listdir(person_path):
+                if self._is_image(name):
+                    try:
+                        stat = os.stat(os.path.join(person_path, name))
+                    except FileNotFoundError:
+                        continue
+                    files[name] = (stat.st_size, stat.st_mtime_ns)
+            state[person] = files
+        return state
+
+    def _poll(self) -> None:
+        """Compare scans every poll_interval seconds until stopped."""
+        self.mode = 'polling'
+        self.logger.info(f"Polling {self.face_db_path} every {self.poll_interval} seconds")
+        previous = self._scan()
+        pending: Set[str] = set()
+        while not self._stop.wait(self.poll_interval):
+            try:
+                current = self._scan()
+            except OSError as e:
+                self.logger.error(f"Error scanning face database: {e}")
+                continue
+            changed = {person for person in set(previous) | set(current)
+                       if previous.get(person) != current.get(person)}
+            previous = current
+            if changed:
+                # Wait for one quiet interval so copies in progress settle
+                pending |= changed
+            elif pending:
+                changed, pending = pending, set()
+                self._report(changed)
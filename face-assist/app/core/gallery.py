@@ -0,0 +1,383 @@
+import time
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from .quantization import STORAGE_DTYPES, dequantize, dot, quantize, squared_norms
+from .search_index import ExactIndex
+
+class GallerySnapshot:
+    def __init__(self, matrix: np.ndarray, sq_norms: np.ndarray, labels: np.ndarray,
+                 ids: np.ndarray, people: Tuple[str, ...], person_index: Dict[str, int],
+                 index, generation: int = 0, scales: Optional[np.ndarray] = None):
+        """Immutable view of the gallery at one point in time.
+
+        Snapshots are never modified after they are published, so readers
+        can use one without locking while writers publish newer ones.
+
+        Args:
+            matrix: Encoding matrix of shape (N, dim), in the gallery's
+                storage dtype
+            sq_norms: Squared norm of the encoding every row represents
+            labels: Person index of every row
+            ids: Stable, ascending id of every row
+            people: Person names indexed by label
+            person_index: Mapping from person name to label
+            index: Search index used to narrow identification candidates
+            generation: Number of the publication that produced the snapshot
+            scales: Per-row scale of int8 matrices, None for float storage
+        """
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+        self.labels = labels
+        self.ids = ids
+        self.people = people
+        self.person_index = person_index
+        self.index = index
+        self.generation = generation
+        self.scales = scales
+        self.created = time.time()
+        for array in (matrix, sq_norms, labels, ids, scales):
+            if array is not None:
+                array.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, person: str) -> bool:
+        return person in self.person_index
+
+    def count(self, person: str) -> int:
+        """Number of encodings stored for a person."""
+        label = self.person_index.get(person)
+        if label is None:
+            return 0
+        return int(np.count_nonzero(self.labels == label))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of encodings stored for every person."""
+        totals = np.bincount(self.labels, minlength=len(self.people))
+        return {person: int(totals[i]) for i, person in enumerate(self.people) if totals[i]}
+
+    def distances(self, probes: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Euclidean distances between probes and gallery rows.
+
+        Args:
+            probes: Array of shape (M, dim) or (dim,)
+            rows: Optional row indices to restrict the comparison to
+
+        Returns:
+            Array of shape (M, N) with one row of distances per probe
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        matrix, sq_norms, scales = self.matrix, self.sq_norms, self.scales
+        if rows is not None:
+            matrix = matrix[rows]
+            sq_norms = sq_norms[rows]
+            scales = scales[rows] if scales is not None else None
+
+        sq = (np.einsum('ij,ij->i', probes, probes)[:, None]
+              + sq_norms[None, :]
+              - 2.0 * dot(probes, matrix, scales))
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq)
+
+    def vectors(self) -> np.ndarray:
+        """The encodings as float32, decoded from the stored matrix."""
+        return dequantize(self.matrix, self.scales)
+
+    def person_vectors(self, person: str) -> np.ndarray:
+        """The encodings of one person as float32, empty if unknown."""
+        label = self.person_index.get(person)
+        if label is None:
+            return np.empty((0, self.matrix.shape[1]), dtype=np.float32)
+        rows = np.flatnonzero(self.labels == label)
+        scales = self.scales[rows] if self.scales is not None else None
+        return dequantize(self.matrix[rows], scales)
+
+    def person_distances(self, person: str, probes: np.ndarray) -> np.ndarray:
+        """Distances between probes and every encoding of one person.
+
+        Args:
+            person: Name of the person
+            probes: Array of shape (M, dim) or (dim,)
+
+        Returns:
+            Array of shape (M, K) for the person's K encodings, with K = 0
+            if the person is unknown
+        """
+        probes = np.atleast_2d(probes)
+        label = self.person_index.get(person)
+        if label is None:
+            return np.empty((len(probes), 0), dtype=np.float32)
+        rows = np.flatnonzero(self.labels == label)
+        return self.distances(probes, rows)
+
+    def identify(self, probes: np.ndarray, top_k: int = 3,
+                 tolerance: float = 0.6) -> List[List[Tuple[str, float, float]]]:
+        """Rank known people by their closest encoding to each probe.
+
+        Args:
+            probes: Array of shape (M, dim) or (dim,)
+            top_k: Number of candidates to return per probe
+            tolerance: Distance at or below which an encoding matches
+
+        Returns:
+            For each probe, a list of (person, distance, match percentage)
+            tuples sorted by ascending distance. When the search index
+            narrows the candidates, the match percentage only counts the
+            encodings that were scanned.
+        """
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        if not len(self):
+            return [[] for _ in probes]
+
+        num_people = len(self.people)
+        totals = np.bincount(self.labels, minlength=num_people)
+        candidates = self.index.search(probes)
+        if candidates is None:
+            dists = self.distances(probes)
+
+        results = []
+        for n in range(len(probes)):
+            if candidates is None:
+                row, labels = dists[n], self.labels
+            else:
+                rows = self._rows_for_ids(candidates[n])
+                row, labels = self.distances(probes[n], rows)[0], self.labels[rows]
+            best = np.full(num_people, np.inf, dtype=np.float32)
+            np.minimum.at(best, labels, row)
+            hits = np.bincount(labels, weights=row <= tolerance, minlength=num_people)
+            k = min(top_k, num_people)
+            order = np.argpartition(best, k - 1)[:k]
+            order = order[np.argsort(best[order])]
+            results.append([
+                (self.people[i], float(best[i]), float(hits[i] / totals[i] * 100))
+                for i in order if np.isfinite(best[i])
+            ])
+        return results
+
+    def _rows_for_ids(self, ids: np.ndarray) -> np.ndarray:
+        """Map index candidate ids to rows, skipping ids this snapshot lacks."""
+        rows = np.searchsorted(self.ids, ids)
+        rows = rows[rows < len(self.ids)]
+        return rows[np.isin(self.ids[rows], ids)]
+
+def without_person(snapshot: GallerySnapshot, person: str) -> Tuple[
+        np.ndarray, np.ndarray, np.ndarray, np.ndarray, Tuple[str, ...]]:
+    """Rows of a snapshot that do not belong to a person.
+
+    Args:
+        snapshot: Snapshot to filter
+        person: Name of the person to drop
+
+    Returns:
+        Tuple of (matrix, scales, labels, ids, people) with the person
+        removed and the labels of the people after it shifted down; scales
+        are ones for float storage
+    """
+    scales = snapshot.scales if snapshot.scales is not None else np.ones(len(snapshot), dtype=np.float32)
+    label = snapshot.person_index.get(person)
+    if label is None:
+        return snapshot.matrix, scales, snapshot.labels, snapshot.ids, snapshot.people
+    keep = snapshot.labels != label
+    labels = snapshot.labels[keep]
+    labels = np.where(labels > label, labels - 1, labels).astype(np.int32)
+    people = snapshot.people[:label] + snapshot.people[label + 1:]
+    return snapshot.matrix[keep], scales[keep], labels, snapshot.ids[keep], people
+
+class FaceGallery:
+    def __init__(self, dim: int = 128, capacity: int = 256, index=None, storage: str = 'float32'):
+        """Initialize an empty face gallery.
+
+        Encodings are held in one contiguous float32 matrix with a parallel
+        array of person indices, so a probe can be scored against every
+        known face in a single vectorized distance computation. The gallery
+        is published as immutable snapshots: readers grab the current
+        snapshot without locking, writers build the next one under a lock
+        and swap it in atomically. Appends reuse spare capacity at the end
+        of the backing arrays, which no published snapshot can see.
+
+        Encodings are stored as float32, float16 or int8 codes with one
+        scale per row; distances are computed on the stored form.
+
+        Args:
+            dim: Dimension of the face encodings
+            capacity: Initial number of rows to allocate
+            index: Search index used to narrow identification candidates,
+                exact search if omitted
+            storage: 'float32', 'float16' or 'int8'
+        """
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown gallery storage: {storage}")
+        self.dim = dim
+        self.storage = storage
+        self.index = index if index is not None else ExactIndex()
+        self._matrix = np.empty((capacity, dim), dtype=STORAGE_DTYPES[storage])
+        self._scales = np.ones(capacity, dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._labels = np.empty(capacity, dtype=np.int32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._snapshot = GallerySnapshot(
+            self._matrix[:0], self._sq_norms[:0], self._labels[:0], self._ids[:0],
+            (), {}, self.index, scales=self._scales[:0] if storage == 'int8' else None
+        )
+
+    @property
+    def snapshot(self) -> GallerySnapshot:
+        """The current immutable gallery snapshot."""
+        return self._snapshot
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    def __contains__(self, person: str) -> bool:
+        return person in self.snapshot
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Stored encoding matrix of shape (N, dim)."""
+        return self.snapshot.matrix
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Person index of every row in the encoding matrix."""
+        return self.snapshot.labels
+
+    @property
+    def ids(self) -> np.ndarray:
+        """Stable, ascending id of every row in the encoding matrix."""
+        return self.snapshot.ids
+
+    @property
+    def people(self) -> Tuple[str, ...]:
+        """Person names indexed by label."""
+        return self.snapshot.people
+
+    def add(self, person: str, encodings: Iterable[np.ndarray]) -> int:
+        """Append encodings for a person and publish a new snapshot.
+
+        Args:
+            person: Name of the person
+            encodings: Face encodings to add
+
+        Returns:
+            Number of encodings added
+        """
+        rows = np.asarray(list(encodings), dtype=np.float32).reshape(-1, self.dim)
+        if not len(rows):
+            return 0
+
+        with self._lock:
+            current = self._snapshot
+            people, person_index = current.people, current.person_index
+            label = person_index.get(person)
+            if label is None:
+                label = len(people)
+                people = people + (person,)
+                person_index = {**person_index, person: label}
+
+            start, end = len(current), len(current) + len(rows)
+            if end > len(self._matrix):
+                self._grow(end, start)
+            codes, scales = quantize(rows, self.storage)
+            self._matrix[start:end] = codes
+            self._scales[start:end] = scales if scales is not None else 1.0
+            self._sq_norms[start:end] = squared_norms(codes, scales)
+            self._labels[start:end] = label
+            ids = np.arange(self._next_id, self._next_id + len(rows), dtype=np.int64)
+            self._ids[start:end] = ids
+            self._next_id += len(rows)
+
+            if self.index.needs_training(end):
+                self.index.train(self._ids[:end], dequantize(self._matrix[:end], self._scales[:end]))
+            else:
+                self.index.add(ids, rows)
+            self._publish(end, people, person_index)
+        return len(rows)
+
+    def set_person(self, person: str, encodings: Iterable[np.ndarray]) -> int:
+        """Replace every encoding of a person and publish a new snapshot.
+
+        The remaining rows are copied to new backing arrays, so published
+        snapshots are unaffected. Without encodings the person is removed.
+
+        Args:
+            person: Name of the person
+            encodings: New face encodings of the person, may be empty
+
+        Returns:
+            Number of encodings stored for the person
+        """
+        rows = np.asarray(list(encodings), dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            current = self._snapshot
+            matrix, scales, labels, ids, people = without_person(current, person)
+            removed = current.ids[current.labels == current.person_index[person]] \
+                if person in current else current.ids[:0]
+            new_ids = np.arange(self._next_id, self._next_id + len(rows), dtype=np.int64)
+            self._next_id += len(rows)
+            if len(rows):
+                people = people + (person,)
+            size = len(ids) + len(rows)
+
+            codes, new_scales = quantize(rows, self.storage)
+            capacity = max(size, len(self._matrix))
+            self._matrix = np.empty((capacity, self.dim), dtype=self._matrix.dtype)
+            self._scales = np.ones(capacity, dtype=np.float32)
+            self._sq_norms = np.empty(capacity, dtype=np.float32)
+            self._labels = np.empty(capacity, dtype=np.int32)
+            self._ids = np.empty(capacity, dtype=np.int64)
+            self._matrix[:size] = np.concatenate((matrix, codes))
+            if new_scales is not None:
+                self._scales[:size] = np.concatenate((scales, new_scales))
+            self._sq_norms[:size] = squared_norms(self._matrix[:size], self._scales[:size])
+            self._labels[:size] = np.concatenate((labels, np.full(len(rows), len(people) - 1, dtype=np.int32)))
+            self._ids[:size] = np.concatenate((ids, new_ids))
+
+            self.index.remove(removed)
+            if self.index.needs_training(size):
+                self.index.train(self._ids[:size], dequantize(self._matrix[:size], self._scales[:size]))
+            else:
+                self.index.add(new_ids, rows)
+            self._publish(size, people, {name: i for i, name in enumerate(people)})
+        return len(rows)
+
+    def _publish(self, size: int, people: Tuple[str, ...], person_index: Dict[str, int]) -> None:
+        """Swap in a snapshot over the first size rows of the backing arrays."""
+        self._snapshot = GallerySnapshot(
+            self._matrix[:size], self._sq_norms[:size], self._labels[:size], self._ids[:size],
+            people, person_index, self.index, self._snapshot.generation + 1,
+            self._scales[:size] if self.storage == 'int8' else None
+        )
+
+    def _grow(self, min_capacity: int, size: int) -> None:
+        """Move to larger backing arrays; published snapshots keep the old ones."""
+        capacity = max(min_capacity, 2 * len(self._matrix))
+        for name in ('_matrix', '_scales', '_sq_norms', '_labels', '_ids'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:size] = old[:size]
+            setattr(self, name, new)
+
+    def count(self, person: str) -> int:
+        """Number of encodings stored for a person."""
+        return self.snapshot.count(person)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of encodings stored for every person."""
+        return self.snapshot.counts()
+
+    def distances(self, probes: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """Euclidean distances between probes and gallery rows."""
+        return self.snapshot.distances(probes, rows)
+
+    def person_distances(self, person: str, probes: np.ndarray) -> np.ndarray:
+        """Distances between probes and every encoding of one person."""
+        return self.snapshot.person_distances(person, probes)
+
+    def identify(self, probes: np.ndarray, top_k: int = 3,
+                 tolerance: float = 0.6) -> List[List[Tuple[str, float, float]]]:
+        """Rank known people by their closest encoding to each probe."""
+        return self.snapshot.identify(probes, top_k, tolerance)
@@ -1,19 +1,123 @@
 import os
+import time
+import shutil
 import subprocess
 import logging
+import threading
 from typing import Optional, Tuple, Dict
 import json
 
 class HailoManager:
-    def __init__(self, hailo_path: str = "/opt/hailo"):
+    def __init__(self, hailo_path: str = "/opt/hailo",
+                 device_info_command: str = "hailort-device-info",
+                 device_path: str = "/dev/hailo0",
+                 poll_interval: float = 10.0, max_backoff: float = 300.0):
         """Initialize the Hailo manager.
+
+        Device status is read by a background poller into a cached
+        snapshot, so status requests never fork subprocesses. While the
+        runtime or device is missing the poll interval doubles up to
+        `max_backoff`, and goes back to `poll_interval` once it appears.
         
         Args:
             hailo_path: Path to Hailo installation
+            device_info_command: Name or path of the hailort-device-info tool
+            device_path: Device node of the Hailo accelerator
+            poll_interval: Seconds between status refreshes
+            max_backoff: Longest wait between refreshes while no device is found
         """
         self.hailo_path = hailo_path
+        self.device_info_command = device_info_command
+        self.device_path = device_path
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
         self.logger = logging.getLogger(__name__)
         self._device_info: Optional[Dict] = None
+        self._status: Optional[Dict] = None
+        self._version = 0
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+    def start_polling(self) -> None:
+        """Start the background status poller if it is not running."""
+        if self._poller is not None and self._poller.is_alive():
+            return
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll_loop, name='hailo-poller', daemon=True)
+        self._poller.start()
+
+    def stop_polling(self) -> None:
+        """Stop the background status poller."""
+        self._stop.set()
+        self._wake.set()
+        if self._poller is not None:
+            self._poller.join(5.0)
+
+    def request_refresh(self) -> None:
+        """Ask the poller to refresh the status now."""
+        self._wake.set()
+
+    def _poll_loop(self) -> None:
+        """Refresh the snapshot, backing off while no device is present."""
+        delay = self.poll_interval
+        while not self._stop.is_set():
+            status = self.refresh()
+            if status.get('device_present'):
+                delay = self.poll_interval
+            else:
+                delay = min(delay * 2, self.max_backoff)
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def refresh(self) -> Dict:
+        """Read the runtime and device status and publish it if it changed.
+
+        Returns:
+            The new status snapshot
+        """
+        if not self.is_runtime_installed():
+            status = {'installed': False, 'message': 'Hailo runtime not installed'}
+        else:
+            device_present, device_info = self.check_device()
+            status = {
+                'installed': True,
+                'device_present': device_present,
+                'device_info': device_info,
+                'temperature': self.get_device_temperature() if device_present else None
+            }
+
+        with self._changed:
+            if self._status is None or self._without_meta(self._status) != status:
+                self._version += 1
+                self._changed.notify_all()
+            self._status = dict(status, updated=time.time(), version=self._version)
+            return self._status
+
+    @staticmethod
+    def _without_meta(status: Dict) -> Dict:
+        return {key: value for key, value in status.items() if key not in ('updated', 'version')}
+
+    def status(self) -> Dict:
+        """Return the cached status snapshot, reading it once if still empty."""
+        status = self._status
+        return status if status is not None else self.refresh()
+
+    def wait_for_change(self, version: int, timeout: float) -> Optional[Dict]:
+        """Wait until the status differs from the given version.
+
+        Args:
+            version: Version of the snapshot the caller has seen
+            timeout: Seconds to wait
+
+        Returns:
+            The new snapshot, or None if nothing changed within the timeout
+        """
+        with self._changed:
+            if not self._changed.wait_for(lambda: self._version != version, timeout):
+                return None
+            return self._status
 
     def install_runtime(self, package_path: str) -> Tuple[bool, str]:
         """Install Hailo runtime from package.
@@ -33,6 +137,7 @@ class HailoManager:
                 check=True
             )
             self.logger.info("Hailo runtime installed successfully")
+            self.request_refresh()
             return True, "Installation successful"
         except subprocess.CalledProcessError as e:
             self.logger.error(f"Installation failed: {e.stderr}")
@@ -49,14 +154,15 @@ class HailoManager:
         """
         try:
             # Check if device exists
-            if not os.path.exists("/dev/hailo0"):
+            if not os.path.exists(self.device_path):
                 return False, {"error": "Device not found"}
 
             # Get device info
             result = subprocess.run(
-                ['hailort-device-info'],
+                [self.device_info_command],
                 capture_output=True,
-                text=True
+                text=True,
+                timeout=10
             )
 
             if result.returncode != 0:
@@ -99,9 +205,10 @@ class HailoManager:
         """
         try:
             result = subprocess.run(
-                ['hailort-device-info', '--temperature'],
+                [self.device_info_command, '--temperature'],
                 capture_output=True,
-                text=True
+                text=True,
+                timeout=10
             )
             
             if result.returncode == 0:
@@ -122,11 +229,4 @@ class HailoManager:
         Returns:
             True if runtime is installed, False otherwise
         """
-        try:
-            result = subprocess.run(
-                ['which', 'hailort-device-info'],
-                capture_output=True
-            )
-            return result.returncode == 0
-        except Exception:
-            return False
+        return shutil.which(self.device_info_command) is not None
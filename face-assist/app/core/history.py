@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+import cv2
+import numpy as np
+from .metrics import registry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    camera TEXT,
+    person TEXT,
+    distance REAL,
+    location TEXT,
+    has_crop INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS results_time ON results (timestamp);
+CREATE INDEX IF NOT EXISTS results_person ON results (person, timestamp);
+CREATE INDEX IF NOT EXISTS results_camera ON results (camera, timestamp);
+CREATE TABLE IF NOT EXISTS crops (
+    id INTEGER PRIMARY KEY,
+    jpeg BLOB NOT NULL
+);
+"""
+
+# Share of the face box size added on every side of a stored crop
+CROP_MARGIN = 0.2
+
+registry.describe('face_assist_history_records_total', 'Recognition history records by outcome')
+
+class RecognitionHistory:
+    def __init__(self, path: str, max_size: int, crops: bool = False, max_queue: int = 1000,
+                 batch_size: int = 500, flush_interval: float = 1.0, max_age: float = 0):
+        """Initialize the append-only log of recognitions.
+
+        Records are kept in a SQLite database in WAL mode, indexed by time,
+        person and camera. Callers only put records on a bounded queue; a
+        writer thread inserts them in batches of one transaction each, so
+        recording never waits for the disk and a full queue drops records
+        instead of slowing recognition down. Face crops go to their own
+        table, so queries over the records do not read them.
+
+        When the database outgrows `max_size` bytes the oldest records are
+        deleted and their pages returned to the file system.
+
+        Args:
+            path: Directory of the history database
+            max_size: Largest size of the database in bytes
+            crops: Whether to store a JPEG crop of every face
+            max_queue: Largest number of records waiting to be written
+            batch_size: Largest number of records per transaction
+            flush_interval: Seconds between writes of queued records
+            max_age: Seconds records are kept, 0 to keep them until the
+                size limit removes them
+        """
+        self.path = path
+        self.max_size = max_size
+        self.crops = crops
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+        self.db_path = os.path.join(path, 'history.db')
+        self.dropped = 0
+        self._queue: 'queue.Queue[Tuple]' = queue.Queue(max_queue)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(path, exist_ok=True)
+        self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """Connection of the calling thread."""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            # Only takes effect on a new database, before anything is written
+            db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write what is queued and stop the writer thread."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def record(self, event: Dict, image: Union[np.ndarray, bytes, None] = None) -> None:
+        """Queue a recognition for writing without blocking.
+
+        Args:
+            event: Recognition event with 'timestamp', 'camera', 'person',
+                'distance' and 'location'
+            image: BGR frame or encoded image the face was found in, used
+                for the crop when crops are enabled
+        """
+        crop = None
+        if self.crops and image is not None and event.get('location'):
+            # Only the face region is kept while the record waits
+            crop = _face_region(image, event['location']) if isinstance(image, np.ndarray) else image
+        try:
+            self._queue.put_nowait((
+                event.get('timestamp') or time.time(), event.get('camera'), event.get('person'),
+                event.get('distance'), event.get('location'), crop
+            ))
+        except queue.Full:
+            self.dropped += 1
+            registry.inc('face_assist_history_records_total', outcome='dropped')
+
+    def query(self, person: Optional[str] = None, camera: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 100, cursor: Optional[str] = None) -> Dict[str, any]:
+        """Recognitions, newest first, one page at a time.
+
+        Pages continue from a cursor, the position of the last record of
+        the previous page, so every page is one index range scan however
+        deep it is.
+
+        Args:
+            person: Only records of this person
+            camera: Only records of this camera
+            since: Only records at or after this Unix time
+            until: Only records before this Unix time
+            limit: Largest number of records returned
+            cursor: `next` of the previous page
+
+        Returns:
+            Dictionary with the records and the cursor of the next page,
+            None after the last page
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        clauses, args = [], []
+        if person is not None:
+            clauses.append('person = ?')
+            args.append(person)
+        if camera is not None:
+            clauses.append('camera = ?')
+            args.append(camera)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            args.append(since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            args.append(until)
+        if cursor:
+            timestamp, _, row_id = cursor.partition(':')
+            clauses.append('(timestamp, id) < (?, ?)')
+            args.extend((float(timestamp), int(row_id)))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._db().execute(
+            f"SELECT * FROM results {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            args + [limit + 1]
+        ).fetchall()
+        records = [{
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'camera': row['camera'],
+            'person': row['person'],
+            'distance': row['distance'],
+            'location': json.loads(row['location']) if row['location'] else None,
+            'crop': bool(row['has_crop'])
+        } for row in rows[:limit]]
+        more = len(rows) > limit
+        return {
+            'results': records,
+            'next': f"{records[-1]['timestamp']!r}:{records[-1]['id']}" if more else None
+        }
+
+    def crop(self, record_id: int) -> Optional[bytes]:
+        """JPEG crop stored with a record."""
+        row = self._db().execute('SELECT jpeg FROM crops WHERE id = ?', (record_id,)).fetchone()
+        return bytes(row['jpeg']) if row else None
+
+    def stats(self) -> Dict[str, any]:
+        db = self._db()
+        return {
+            'records': db.execute('SELECT COUNT(*) FROM results').fetchone()[0],
+            'oldest': db.execute('SELECT MIN(timestamp) FROM results').fetchone()[0],
+            'size': self._size(),
+            'max_size': self.max_size,
+            'queued': self._queue.qsize(),
+            'dropped': self.dropped
+        }
+
+    def _size(self) -> int:
+        size = 0
+        for suffix in ('', '-wal'):
+            try:
+                size += os.path.getsize(self.db_path + suffix)
+            except OSError:
+                pass
+        return size
+
+    def _run(self) -> None:
+        """Write queued records in batches and enforce the limits."""
+        last_prune = 0.0
+        while True:
+            stopping = self._stop.wait(self.flush_interval)
+            try:
+                while self._write() == self.batch_size:
+                    pass
+                if stopping or time.monotonic() - last_prune >= 60:
+                    last_prune = time.monotonic()
+                    self._prune()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error writing recognition history: {e}")
+            if stopping:
+                return
+
+    def _write(self) -> int:
+        """Insert up to one batch of queued records; returns how many."""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not batch:
+            return 0
+        crops = [_encode_crop(item[5], item[4]) if item[5] is not None else None for item in batch]
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            for (timestamp, camera, person, distance, location, _), jpeg in zip(batch, crops):
+                row_id = db.execute(
+                    'INSERT INTO results (timestamp, camera, person, distance, location, has_crop) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (timestamp, camera, person, distance,
+                     json.dumps(location) if location else None, jpeg is not None)
+                ).lastrowid
+                if jpeg is not None:
+                    db.execute('INSERT INTO crops (id, jpeg) VALUES (?, ?)', (row_id, jpeg))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        registry.inc('face_assist_history_records_total', len(batch), outcome='written')
+        return len(batch)
+
+    def _prune(self) -> None:
+        """Delete records past the age limit and the oldest ones over the size limit."""
+        db = self._db()
+        if self.max_age:
+            self._delete_before(time.time() - self.max_age)
+        # Move the log into the database so the size counts the records only
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        size = self._size()
+        if self.max_size and size > self.max_size:
+            # Records take space in proportion to their number; going down
+            # to 90% of the limit leaves room before the next prune
+            count = db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            excess = int(count * (size - 0.9 * self.max_size) / size)
+            if excess:
+                self._delete('SELECT id FROM results ORDER BY id LIMIT 1 OFFSET ?', (min(excess, count) - 1,))
+            self._vacuum()
+
+    def _vacuum(self) -> None:
+        """Return the pages of deleted records to the file system."""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # The sqlite3 module steps the pragma once, which frees one page
+            for _ in range(db.execute('PRAGMA freelist_count').fetchone()[0]):
+                db.execute('PRAGMA incremental_vacuum')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def _delete_before(self, timestamp: float) -> int:
+        """Delete the records, and their crops, of recognitions before a time.
+
+        Timestamps come from the events, and workers insert them out of
+        order, so ids are no guide to age here.
+        """
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM crops WHERE id IN (SELECT id FROM results WHERE timestamp < ?)', (timestamp,))
+            deleted = db.execute('DELETE FROM results WHERE timestamp < ?', (timestamp,)).rowcount
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        if deleted:
+            self.logger.info(f"Removed {deleted} expired recognition history records")
+        return deleted
+
+    def _delete(self, last_id_query: str, args: Tuple) -> None:
+        """Delete every record up to the id the query selects."""
+        db = self._db()
+        last_id = db.execute(last_id_query, args).fetchone()[0]
+        if last_id is None:
+            return
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            deleted = db.execute('DELETE FROM results WHERE id <= ?', (last_id,)).rowcount
+            db.execute('DELETE FROM crops WHERE id <= ?', (last_id,))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self.logger.info(f"Removed {deleted} old recognition history records")
+
+def _face_region(frame: np.ndarray, location: List[int]) -> np.ndarray:
+    """Copy of the face box of a (top, right, bottom, left) location plus a margin."""
+    top, right, bottom, left = location
+    margin_y = int((bottom - top) * CROP_MARGIN)
+    margin_x = int((right - left) * CROP_MARGIN)
+    return frame[max(top - margin_y, 0):bottom + margin_y, max(left - margin_x, 0):right + margin_x].copy()
+
+def _encode_crop(image: Union[np.ndarray, bytes], location: List[int]) -> Optional[bytes]:
+    """JPEG of a face region, cut from an encoded image if needed."""
+    if isinstance(image, (bytes, bytearray)):
+        frame = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return None
+        image = _face_region(frame, location)
+    if not image.size:
+        return None
+    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return jpeg.tobytes() if ok else None
@@ -0,0 +1,452 @@
+import os
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+# Face location as (top, right, bottom, left)
+Location = Tuple[int, int, int, int]
+
+# Face turned away by a quality gate: location, reason and measured value
+Rejection = Tuple[Location, str, float]
+
+# Result of processing one image: locations, encodings, rejected faces and
+# stage timings
+Processed = Tuple[List[Location], List[np.ndarray], List[Rejection], Dict[str, float]]
+
+# Extra border around a face box before it is cropped for the embedder
+CROP_MARGIN = 0.1
+
+def clamp_locations(locations: List[Location], shape: Tuple[int, ...]) -> Tuple[List[Location], List[Rejection]]:
+    """Fit face boxes supplied with an image inside it.
+
+    Args:
+        locations: Face boxes as (top, right, bottom, left)
+        shape: Shape of the image array
+
+    Returns:
+        Tuple of (clamped locations, boxes that do not overlap the image,
+        rejected as 'outside')
+    """
+    height, width = shape[:2]
+    clamped, outside = [], []
+    for location in locations:
+        top, right, bottom, left = (int(round(value)) for value in location)
+        top, bottom = max(0, top), min(height, bottom)
+        left, right = max(0, left), min(width, right)
+        if bottom <= top or right <= left:
+            outside.append((tuple(location), 'outside', 0.0))
+        else:
+            clamped.append((top, right, bottom, left))
+    return clamped, outside
+
+class InferenceBackend:
+    """Detection and embedding engine used by the face processor.
+
+    Subclasses implement `detect` and `embed`; `embed_batch` can be
+    overridden to run several faces through the model at once.
+    """
+
+    # Identifier used in settings and to keep encodings of different
+    # backends apart on disk
+    name = 'base'
+    # Dimension of the encodings the backend produces
+    embedding_dim = 128
+    # Euclidean distance at or below which two encodings are the same person
+    match_threshold = 0.6
+    # Whether encoding throughput scales with worker processes; backends
+    # that batch and pool sessions themselves run in the calling process
+    multiprocess = True
+    # Largest number of images processed in one process_batch call
+    batch_size = 1
+
+    @property
+    def cache_suffix(self) -> str:
+        """Suffix of the encoding cache and index files of this backend."""
+        return f"-{self.name}"
+
+    def settings(self) -> Dict[str, any]:
+        """Backend settings as a dictionary."""
+        return {'backend': self.name, 'embedding_dim': self.embedding_dim}
+
+    def warmup(self) -> None:
+        """Load models ahead of the first request."""
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        """Find faces in an RGB image."""
+        raise NotImplementedError
+
+    def embed(self, image: np.ndarray, locations: List[Location]) -> List[np.ndarray]:
+        """Compute one encoding per face location."""
+        raise NotImplementedError
+
+    def embed_batch(self, items: List[Tuple[np.ndarray, List[Location]]]) -> List[List[np.ndarray]]:
+        """Compute encodings for the faces of several images."""
+        return [self.embed(image, locations) if locations else [] for image, locations in items]
+
+    def process(self, image: np.ndarray, gate=None, locations: Optional[List[Location]] = None) -> Processed:
+        """Detect faces and encode them.
+
+        Args:
+            image: RGB image array
+            gate: QualityGate faces must pass to be encoded
+            locations: Face boxes found upstream; detection is skipped and
+                only these are encoded, after clamping them to the image
+
+        Returns:
+            Tuple of (face locations, encodings, rejected faces, stage
+            timings in seconds)
+        """
+        start = time.perf_counter()
+        timings = {}
+        if locations is None:
+            locations, rejected = self.detect(image), []
+            timings['detect'] = time.perf_counter() - start
+        else:
+            locations, rejected = clamp_locations(locations, image.shape)
+        detected = time.perf_counter()
+        if gate is not None and locations:
+            locations, gated = gate.split(image, locations)
+            rejected.extend(gated)
+            timings['quality'] = time.perf_counter() - detected
+            detected = time.perf_counter()
+        encodings = self.embed(image, locations) if locations else []
+        timings['encode'] = time.perf_counter() - detected
+        return locations, encodings, rejected, timings
+
+    def process_batch(self, images: List[np.ndarray], gate=None,
+                      locations: Optional[List[Optional[List[Location]]]] = None) -> List[Processed]:
+        """Detect faces in every image, then encode all faces in one batch.
+
+        The encode time of the batch is split evenly over its images.
+        Images with supplied face boxes in `locations` skip detection.
+        """
+        start = time.perf_counter()
+        items, rejections, timings = [], [], []
+        for n, image in enumerate(images):
+            boxes = locations[n] if locations else None
+            if boxes is None:
+                found, rejected = self.detect(image), []
+            else:
+                found, rejected = clamp_locations(boxes, image.shape)
+            now = time.perf_counter()
+            timing = {'detect': now - start} if boxes is None else {}
+            if gate is not None and found:
+                found, gated = gate.split(image, found)
+                rejected.extend(gated)
+                timing['quality'] = time.perf_counter() - now
+                now = time.perf_counter()
+            items.append((image, found))
+            rejections.append(rejected)
+            timings.append(timing)
+            start = now
+        encodings = self.embed_batch(items) if items else []
+        share = (time.perf_counter() - start) / max(1, len(items))
+        for timing in timings:
+            timing['encode'] = share
+        return [
+            (found, face_encodings, rejected, timing)
+            for (_, found), face_encodings, rejected, timing in zip(items, encodings, rejections, timings)
+        ]
+
+class SessionPool:
+    def __init__(self, model_path: str, size: int = 2, threads: int = 1):
+        """Initialize a pool of ONNX Runtime sessions for one model.
+
+        Sessions are created on demand up to `size` and each is warmed up
+        with a dummy input when created, so concurrent requests run on
+        separate sessions instead of queueing behind one.
+
+        Args:
+            model_path: Path to the .onnx model
+            size: Maximum number of sessions
+            threads: Intra-op threads per session
+        """
+        self.model_path = model_path
+        self.size = max(1, size)
+        self.threads = threads
+        self.logger = logging.getLogger(__name__)
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.input_name = None
+        self.input_shape = None
+        self.output_shapes = None
+        self._create()
+
+    @property
+    def channels_first(self) -> bool:
+        """Whether the model expects NCHW rather than NHWC input."""
+        return self.input_shape[1] in (1, 3)
+
+    @property
+    def image_size(self) -> Tuple[int, int]:
+        """Input (width, height) of the model."""
+        if self.channels_first:
+            return self.input_shape[3], self.input_shape[2]
+        return self.input_shape[2], self.input_shape[1]
+
+    @property
+    def dynamic_batch(self) -> bool:
+        """Whether the model accepts more than one image per run."""
+        return not isinstance(self.input_shape[0], int) or self.input_shape[0] != 1
+
+    def _create(self) -> None:
+        """Create and warm up one session and put it in the pool."""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(self.model_path, sess_options=options,
+                                       providers=['CPUExecutionProvider'])
+        model_input = session.get_inputs()[0]
+        if self.input_name is None:
+            self.input_name = model_input.name
+            self.input_shape = [dim if isinstance(dim, int) and dim > 0 else None
+                                for dim in model_input.shape]
+            self.output_shapes = [output.shape for output in session.get_outputs()]
+
+        warmup_shape = [dim or 1 for dim in self.input_shape]
+        session.run(None, {self.input_name: np.zeros(warmup_shape, dtype=np.float32)})
+        self._created += 1
+        self._idle.put(session)
+
+    def warmup(self) -> None:
+        """Create every session of the pool up front."""
+        with self._lock:
+            while self._created < self.size:
+                self._create()
+
+    @contextmanager
+    def session(self):
+        """Borrow a session, creating one if none is idle and the pool has room."""
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._create()
+            session = self._idle.get()
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def run(self, batch: np.ndarray) -> List[np.ndarray]:
+        """Run a batch through a pooled session."""
+        with self.session() as session:
+            return session.run(None, {self.input_name: batch})
+
+class OnnxBackend(InferenceBackend):
+    name = 'onnx'
+    multiprocess = False
+
+    def __init__(self, embedder_path: str, detector_path: Optional[str] = None,
+                 fallback_detector: Optional[InferenceBackend] = None,
+                 sessions: int = 2, batch_size: int = 8, threads: int = 1,
+                 match_threshold: float = 1.0, score_threshold: float = 0.7,
+                 registry=None):
+        """Initialize the ONNX Runtime CPU backend.
+
+        The embedder takes aligned RGB face crops, normalized to [-1, 1],
+        and returns one vector per face (ArcFace/FaceNet style); vectors
+        are L2-normalized. The optional detector uses the UltraFace output
+        layout of per-anchor `scores` (N, 2) and corner `boxes` (N, 4) in
+        relative coordinates; without it, faces are found by the fallback
+        detector.
+
+        Args:
+            embedder_path: Path to the embedder .onnx model
+            detector_path: Optional path to an UltraFace-style detector
+            fallback_detector: Backend whose detect() is used without a
+                detector model
+            sessions: Sessions per model for concurrent requests
+            batch_size: Largest number of faces per embedder run
+            threads: Intra-op threads per session
+            match_threshold: Distance between normalized encodings at or
+                below which two faces are the same person
+            score_threshold: Lowest detector score kept
+            registry: ModelRegistry that loads the session pools, so they
+                count against its memory budget; the backend keeps its
+                own pools if omitted
+        """
+        if detector_path is None and fallback_detector is None:
+            raise ValueError("ONNX backend needs a detector model or a fallback detector")
+        self.embedder_path = embedder_path
+        self.detector_path = detector_path
+        self.fallback_detector = fallback_detector
+        self.sessions = sessions
+        self.batch_size = batch_size
+        self.threads = threads
+        self.match_threshold = match_threshold
+        self.score_threshold = score_threshold
+        self.registry = registry
+        self._embedder: Optional[SessionPool] = None
+        self._detector: Optional[SessionPool] = None
+        self._lock = threading.Lock()
+        self.embedding_dim = self.embedder.output_shapes[0][-1]
+
+    def __getstate__(self):
+        # Sessions cannot be pickled; a copy creates its own on first use
+        state = self.__dict__.copy()
+        state['_embedder'] = state['_detector'] = state['registry'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def cache_suffix(self) -> str:
+        stem = os.path.splitext(os.path.basename(self.embedder_path))[0]
+        return f"-{self.name}-{stem}"
+
+    @property
+    def embedder(self) -> SessionPool:
+        if self.registry is not None:
+            return self.registry.get_pool(os.path.basename(self.embedder_path))
+        with self._lock:
+            if self._embedder is None:
+                self._embedder = SessionPool(self.embedder_path, self.sessions, self.threads)
+            return self._embedder
+
+    @property
+    def detector(self) -> Optional[SessionPool]:
+        if self.detector_path is None:
+            return None
+        if self.registry is not None:
+            return self.registry.get_pool(os.path.basename(self.detector_path))
+        with self._lock:
+            if self._detector is None:
+                self._detector = SessionPool(self.detector_path, self.sessions, self.threads)
+            return self._detector
+
+    def settings(self) -> Dict[str, any]:
+        settings = super().settings()
+        settings.update({
+            'embedder': os.path.basename(self.embedder_path),
+            'detector': (os.path.basename(self.detector_path) if self.detector_path
+                         else self.fallback_detector.settings()),
+            'sessions': self.sessions,
+            'batch_size': self.batch_size,
+            'match_threshold': self.match_threshold
+        })
+        return settings
+
+    def warmup(self) -> None:
+        self.embedder.warmup()
+        if self.detector is not None:
+            self.detector.warmup()
+
+    def _prepare(self, pool: SessionPool, images: List[np.ndarray], mean: float,
+                 scale: float) -> np.ndarray:
+        """Resize and normalize RGB images into one input batch."""
+        width, height = pool.image_size
+        batch = np.stack([
+            cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            for image in images
+        ]).astype(np.float32)
+        batch = (batch - mean) / scale
+        if pool.channels_first:
+            batch = batch.transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch)
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        if self.detector is None:
+            return self.fallback_detector.detect(image)
+
+        height, width = image.shape[:2]
+        outputs = self.detector.run(self._prepare(self.detector, [image], 127.0, 128.0))
+        scores = next(out for out in outputs if out.shape[-1] == 2)[0][:, 1]
+        boxes = next(out for out in outputs if out.shape[-1] == 4)[0]
+        keep = scores >= self.score_threshold
+        scores, boxes = scores[keep], boxes[keep] * [width, height, width, height]
+        rects = [[float(x1), float(y1), float(x2 - x1), float(y2 - y1)] for x1, y1, x2, y2 in boxes]
+        picked = cv2.dnn.NMSBoxes(rects, scores.tolist(), self.score_threshold, 0.3)
+        locations = []
+        for i in np.asarray(picked).reshape(-1):
+            x1, y1, x2, y2 = boxes[i]
+            locations.append((max(0, int(y1)), min(width, int(x2)),
+                              min(height, int(y2)), max(0, int(x1))))
+        return locations
+
+    def _crop(self, image: np.ndarray, location: Location) -> np.ndarray:
+        """Cut a face out of the image with a small margin."""
+        top, right, bottom, left = location
+        margin_y = int((bottom - top) * CROP_MARGIN)
+        margin_x = int((right - left) * CROP_MARGIN)
+        height, width = image.shape[:2]
+        return image[max(0, top - margin_y):min(height, bottom + margin_y),
+                     max(0, left - margin_x):min(width, right + margin_x)]
+
+    def embed(self, image: np.ndarray, locations: List[Location]) -> List[np.ndarray]:
+        return self.embed_batch([(image, locations)])[0]
+
+    def embed_batch(self, items: List[Tuple[np.ndarray, List[Location]]]) -> List[List[np.ndarray]]:
+        crops = [self._crop(image, location) for image, locations in items for location in locations]
+        vectors = []
+        step = self.batch_size if self.embedder.dynamic_batch else 1
+        for start in range(0, len(crops), step):
+            batch = self._prepare(self.embedder, crops[start:start + step], 127.5, 127.5)
+            vectors.append(self.embedder.run(batch)[0].reshape(len(batch), -1))
+
+        results = []
+        if vectors:
+            embeddings = np.concatenate(vectors).astype(np.float64)
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        offset = 0
+        for _, locations in items:
+            results.append(list(embeddings[offset:offset + len(locations)]) if locations else [])
+            offset += len(locations)
+        return results
+
+def create_backend(kind: str, fallback: InferenceBackend, models_path: str,
+                   embedder_model: str = '', detector_model: str = '',
+                   sessions: int = 2, batch_size: int = 8, threads: int = 1,
+                   match_threshold: float = 1.0, registry=None) -> InferenceBackend:
+    """Create the configured inference backend.
+
+    Args:
+        kind: 'dlib' or 'onnx'
+        fallback: dlib backend, returned for 'dlib', used for detection by
+            the ONNX backend without a detector model, and returned when
+            the requested backend cannot be created
+        models_path: Directory uploaded models are stored in
+        embedder_model: File name of the embedder model
+        detector_model: File name of the optional detector model
+        sessions: Sessions per model
+        batch_size: Largest number of faces per embedder run
+        threads: Intra-op threads per session
+        match_threshold: Match distance for the ONNX backend
+        registry: ModelRegistry the ONNX backend loads its models from
+
+    Returns:
+        The requested backend, or the fallback if it failed to load
+    """
+    logger = logging.getLogger(__name__)
+    if kind == 'dlib':
+        return fallback
+    try:
+        if kind == 'hailo':
+            raise ValueError("Inference on the Hailo accelerator is not supported, use dlib or onnx")
+        if kind != 'onnx':
+            raise ValueError(f"Unknown inference backend: {kind}")
+        if not embedder_model:
+            raise ValueError(f"No embedder model configured for the {kind} backend")
+        backend = OnnxBackend(
+            os.path.join(models_path, embedder_model),
+            os.path.join(models_path, detector_model) if detector_model else None,
+            fallback_detector=fallback, sessions=sessions, batch_size=batch_size,
+            threads=threads, match_threshold=match_threshold, registry=registry
+        )
+        logger.info(f"Using {kind} inference backend with {embedder_model}")
+        return backend
+    except Exception as e:
+        logger.error(f"Error creating {kind} backend, falling back to dlib: {e}")
+        return fallback
@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    files TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    cancel INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority, created);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+class JobCancelled(Exception):
+    """Raised inside a running job when it was cancelled."""
+
+class JobContext:
+    def __init__(self, queue: 'JobQueue', job_id: str):
+        """Handle a running job uses to report progress and yield the CPU."""
+        self.queue = queue
+        self.job_id = job_id
+        self._checked = 0.0
+
+    def checkpoint(self, done: Optional[int] = None, total: Optional[int] = None) -> None:
+        """Record progress, wait for foreground requests and honor cancellation.
+
+        Handlers call this between units of work. It returns once no
+        latency-sensitive request is running in this process, or after
+        the queue's yield limit, and raises JobCancelled if the job was
+        cancelled meanwhile.
+        """
+        self.queue._yield_to_foreground()
+        now = time.monotonic()
+        if done is not None or now - self._checked >= 1.0:
+            self._checked = now
+            if self.queue._check_cancel(self.job_id, done, total):
+                raise JobCancelled()
+
+class JobQueue:
+    def __init__(self, path: str, token: str, workers: int = 1, max_yield: float = 2.0,
+                 nice: int = 10, retention: float = 24 * 3600):
+        """Initialize the persistent background job queue.
+
+        Jobs are rows of a SQLite table next to a spool directory with their
+        uploaded files, so they survive restarts and every server worker
+        sees every job. Each worker process runs `workers` threads that
+        claim queued jobs in priority order, lowest value first. Jobs left
+        running by a process that no longer exists are queued again.
+
+        Job threads run at a lower CPU priority and pause between units of
+        work while verify and identify requests are running in the same
+        process, so recognition keeps its latency during enrollment.
+
+        Args:
+            path: Directory of the job database and spool
+            token: Identifies the current server start, see SERVER_TOKEN_ENV
+            workers: Job threads in this process
+            max_yield: Longest pause in seconds a job makes for foreground
+                requests at one checkpoint
+            nice: Niceness added to job threads, 0 to keep the default
+            retention: Seconds finished jobs are kept before they are deleted
+        """
+        self.path = path
+        self.token = token
+        self.workers = workers
+        self.max_yield = max_yield
+        self.nice = nice
+        self.retention = retention
+        self.logger = logging.getLogger(__name__)
+        self.db_path = os.path.join(path, 'jobs.db')
+        self.spool_path = os.path.join(path, 'spool')
+        self._handlers: Dict[str, Callable] = {}
+        self._priorities: Dict[str, int] = {}
+        self._local = threading.local()
+        self._wake = threading.Condition()
+        self._foreground = 0
+        self._idle = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        os.makedirs(self.spool_path, exist_ok=True)
+        self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """Connection of the calling thread."""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that holds the database lock from the start."""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def register(self, kind: str, handler: Callable[[Dict, List[str], JobContext], Dict],
+                 priority: int) -> None:
+        """Register the handler that runs jobs of a kind.
+
+        Args:
+            kind: Name of the job kind
+            handler: Called with the job parameters, the paths of its spooled
+                files and a JobContext; returns the JSON result of the job
+            priority: Default priority of the kind, lower runs first
+        """
+        self._handlers[kind] = handler
+        self._priorities[kind] = priority
+
+    def start(self) -> None:
+        """Queue jobs orphaned by dead processes again and start the job threads."""
+        if self._threads:
+            return
+        self._recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, kind: str, params: Dict, files: Sequence[Tuple[str, bytes]] = (),
+               priority: Optional[int] = None) -> Dict[str, any]:
+        """Queue a job.
+
+        Args:
+            kind: Registered job kind
+            params: JSON parameters passed to the handler
+            files: Uploaded (filename, data) pairs, written to the job's spool
+                directory and passed to the handler in the same order
+            priority: Priority overriding the kind's default, lower runs first
+
+        Returns:
+            The queued job
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        spool = os.path.join(self.spool_path, job_id)
+        names = []
+        if files:
+            os.makedirs(spool)
+            for i, (name, data) in enumerate(files):
+                # Prefixed so uploads with the same name stay apart
+                file_path = os.path.join(spool, f"{i:06d}_{os.path.basename(name)}")
+                with open(file_path, 'wb') as f:
+                    f.write(data)
+                names.append(os.path.basename(file_path))
+        with self._transaction() as db:
+            db.execute(
+                'INSERT INTO jobs (id, kind, state, priority, params, files, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, 'queued', self._priorities[kind] if priority is None else priority,
+                 json.dumps(params), json.dumps(names), time.time())
+            )
+        with self._wake:
+            self._wake.notify()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, any]]:
+        """Status of a job, with its result once it finished."""
+        row = self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'kind': row['kind'],
+            'state': row['state'],
+            'priority': row['priority'],
+            'params': json.loads(row['params']),
+            'created': row['created'],
+            'started': row['started'],
+            'finished': row['finished']
+        }
+        if row['progress']:
+            job['progress'] = json.loads(row['progress'])
+        if row['state'] == 'queued':
+            job['position'] = self._db().execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (priority < ? OR "
+                "(priority = ? AND created < ?))", (row['priority'], row['priority'], row['created'])
+            ).fetchone()[0]
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def list_jobs(self, state: Optional[str] = None, limit: int = 50) -> List[Dict[str, any]]:
+        """Most recent jobs, optionally only those in one state."""
+        if state:
+            rows = self._db().execute('SELECT id FROM jobs WHERE state = ? ORDER BY created DESC LIMIT ?',
+                                      (state, limit)).fetchall()
+        else:
+            rows = self._db().execute('SELECT id FROM jobs ORDER BY created DESC LIMIT ?',
+                                      (limit,)).fetchall()
+        return [job for job in (self.get(row['id']) for row in rows) if job]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, any]]:
+        """Cancel a job.
+
+        Queued jobs are cancelled at once; running jobs stop at their next
+        checkpoint. Finished jobs are left as they are.
+
+        Returns:
+            The job, or None if it does not exist
+        """
+        with self._transaction() as db:
+            cancelled = db.execute(
+                "UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+                (time.time(), job_id)
+            ).rowcount
+            if not cancelled:
+                db.execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND state = 'running'", (job_id,))
+        if cancelled:
+            self._remove_spool(job_id)
+        return self.get(job_id)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in every state."""
+        rows = self._db().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = {state: 0 for state in JOB_STATES}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def begin_foreground(self) -> None:
+        """Mark a latency-sensitive request as running in this process."""
+        with self._idle:
+            self._foreground += 1
+
+    def end_foreground(self) -> None:
+        with self._idle:
+            self._foreground -= 1
+            if not self._foreground:
+                self._idle.notify_all()
+
+    def _yield_to_foreground(self) -> None:
+        with self._idle:
+            if self._foreground:
+                self._idle.wait_for(lambda: not self._foreground, self.max_yield)
+
+    def _check_cancel(self, job_id: str, done: Optional[int], total: Optional[int]) -> bool:
+        """Store progress and return whether the job was cancelled."""
+        db = self._db()
+        if done is not None:
+            db.execute('UPDATE jobs SET progress = ? WHERE id = ?',
+                       (json.dumps({'done': done, 'total': total}), job_id))
+        row = db.execute('SELECT cancel FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row['cancel'])
+
+    def _owner(self) -> str:
+        return f"{self.token}:{os.getpid()}"
+
+    def _recover(self) -> None:
+        """Queue running jobs of processes that no longer exist again."""
+        with self._transaction() as db:
+            for row in db.execute("SELECT id, owner FROM jobs WHERE state = 'running'").fetchall():
+                token, _, pid = (row['owner'] or '').rpartition(':')
+                if token == self.token and pid.isdigit() and _process_alive(int(pid)):
+                    continue
+                db.execute("UPDATE jobs SET state = 'queued', owner = NULL, started = NULL "
+                           "WHERE id = ?", (row['id'],))
+                self.logger.info(f"Requeued interrupted job {row['id']}")
+
+    def _cleanup(self) -> None:
+        """Delete finished jobs older than the retention period."""
+        with self._transaction() as db:
+            expired = [row['id'] for row in db.execute(
+                'SELECT id FROM jobs WHERE finished < ?', (time.time() - self.retention,)).fetchall()]
+            db.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in expired])
+        for job_id in expired:
+            self._remove_spool(job_id)
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Take the next queued job this process has a handler for."""
+        kinds = tuple(self._handlers)
+        if not kinds:
+            return None
+        with self._transaction() as db:
+            row = db.execute(
+                f"SELECT * FROM jobs WHERE state = 'queued' AND kind IN ({','.join('?' * len(kinds))}) "
+                "ORDER BY priority, created LIMIT 1", kinds
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET state = 'running', started = ?, owner = ? WHERE id = ?",
+                       (time.time(), self._owner(), row['id']))
+        return row
+
+    def _finish(self, job_id: str, state: str, result: Optional[Dict] = None,
+                error: Optional[str] = None) -> None:
+        with self._transaction() as db:
+            db.execute('UPDATE jobs SET state = ?, result = ?, error = ?, finished = ? WHERE id = ?',
+                       (state, json.dumps(result) if result is not None else None, error,
+                        time.time(), job_id))
+        self._remove_spool(job_id)
+
+    def _remove_spool(self, job_id: str) -> None:
+        shutil.rmtree(os.path.join(self.spool_path, job_id), ignore_errors=True)
+
+    def _run(self) -> None:
+        """Claim and run jobs until stopped."""
+        if self.nice:
+            try:
+                # Niceness is per thread on Linux, and inherited by processes forked from it
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(),
+                               os.getpriority(os.PRIO_PROCESS, 0) + self.nice)
+            except (AttributeError, OSError) as e:
+                self.logger.debug(f"Cannot lower job thread priority: {e}")
+        last_sweep = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() - last_sweep > 60:
+                    last_sweep = time.monotonic()
+                    self._recover()
+                    self._cleanup()
+                row = self._claim()
+            except sqlite3.Error as e:
+                self.logger.error(f"Error reading job queue: {e}")
+                row = None
+            if row is None:
+                # Jobs submitted by other processes are found by polling
+                with self._wake:
+                    self._wake.wait(1.0)
+                continue
+            self._execute(row)
+
+    def _execute(self, row: sqlite3.Row) -> None:
+        job_id = row['id']
+        spool = os.path.join(self.spool_path, job_id)
+        files = [os.path.join(spool, name) for name in json.loads(row['files'])]
+        context = JobContext(self, job_id)
+        try:
+            context.checkpoint()
+            result = self._handlers[row['kind']](json.loads(row['params']), files, context)
+            self._finish(job_id, 'done', result)
+        except JobCancelled:
+            self._finish(job_id, 'cancelled')
+            self.logger.info(f"Cancelled job {job_id}")
+        except Exception as e:
+            self.logger.error(f"Job {job_id} ({row['kind']}) failed: {e}")
+            self._finish(job_id, 'failed', error=str(e))
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,363 @@
+import os
+import json
+import math
+import time
+import cProfile
+import pstats
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# Latency buckets in seconds, from a cache hit to a slow CNN detection
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render labels in Prometheus text format."""
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _format_value(value: float) -> str:
+    """Render a sample value at full precision, integral values without a fraction."""
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return 'NaN' if math.isnan(value) else repr(value)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        """Initialize a cumulative histogram.
+
+        Args:
+            buckets: Ascending upper bounds of the buckets
+        """
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Record one observation."""
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def state(self) -> Dict[str, any]:
+        """Bucket counts, count, sum and max as JSON-ready data."""
+        with self._lock:
+            return {'buckets': list(self.buckets), 'counts': list(self.counts),
+                    'count': self.count, 'sum': self.sum, 'max': self.max}
+
+    def merge(self, state: Dict[str, any]) -> None:
+        """Add the observations of a histogram with the same buckets."""
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, state['counts'])]
+            self.count += state['count']
+            self.sum += state['sum']
+            self.max = max(self.max, state['max'])
+
+    def cumulative(self) -> List[int]:
+        """Observations at or below each bucket bound."""
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+class MetricsRegistry:
+    def __init__(self):
+        """Initialize an empty registry of counters, histograms and gauges."""
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], Union[float, Dict[Labels, float]]]] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self._shared_path: Optional[str] = None
+        self._token = ''
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def describe(self, name: str, help_text: str) -> None:
+        """Set the help text shown for a metric."""
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        """Increase a counter."""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record an observation in a histogram."""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Context manager observing the duration of its block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name: str, callback: Callable[[], Union[float, Dict[Labels, float]]]) -> None:
+        """Register a gauge read at render time.
+
+        Args:
+            name: Metric name
+            callback: Returns the value, or a mapping from label tuples
+                such as (('stream', 'door'),) to values
+        """
+        self._gauges[name] = callback
+
+    def share(self, path: str, token: str, interval: float = 5.0) -> None:
+        """Sum the metrics of several server workers.
+
+        Every worker writes its counters, histograms and gauge readings to
+        its own file in `path` every `interval` seconds and whenever it
+        renders, and reads the files of the other workers of the same
+        server start. Counters and histograms are summed, including those
+        of workers that exited, so totals never go back when a worker is
+        replaced. Gauges are reported per live worker with a `worker` label
+        holding its process id.
+
+        Args:
+            path: Directory the workers' metric files are kept in
+            token: Identifier of the running server; files of earlier runs
+                are removed
+            interval: Seconds between writes of this worker's file
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if not name.startswith(f"{token}-"):
+                try:
+                    os.remove(os.path.join(path, name))
+                except OSError:
+                    pass
+        self._shared_path = path
+        self._token = token
+        threading.Thread(target=self._publish_loop, args=(interval,), name='metrics-publisher',
+                         daemon=True).start()
+
+    def _publish_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self._publish()
+            except Exception as e:
+                self.logger.error(f"Error writing metrics: {e}")
+
+    def _publish(self) -> Dict[str, any]:
+        """Write this worker's metrics to its file and return them."""
+        with self._lock:
+            counters = [[name, labels, value] for name, series in self._counters.items()
+                        for labels, value in series.items()]
+            histograms = [[name, labels, histogram] for name, series in self._histograms.items()
+                          for labels, histogram in series.items()]
+        state = {
+            'pid': os.getpid(),
+            'counters': counters,
+            'histograms': [[name, labels, histogram.state()] for name, labels, histogram in histograms],
+            'gauges': [[name, labels, value] for name, series in self._read_gauges().items()
+                       for labels, value in series.items()]
+        }
+        path = os.path.join(self._shared_path, f"{self._token}-{os.getpid()}.json")
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+        return state
+
+    def _read_gauges(self) -> Dict[str, Dict[Labels, float]]:
+        """Current value of every gauge, by label set."""
+        gauges = {}
+        for name, callback in self._gauges.items():
+            try:
+                value = callback()
+            except Exception as e:
+                self.logger.error(f"Error reading gauge {name}: {e}")
+                continue
+            gauges[name] = dict(value) if isinstance(value, dict) else {(): value}
+        return gauges
+
+    def _collect(self) -> Tuple[Dict[str, Dict[Labels, float]], Dict[str, Dict[Labels, Histogram]],
+                                Dict[str, Dict[Labels, float]]]:
+        """Counters, histograms and gauges of this worker, or summed over every worker if shared."""
+        if not self._shared_path:
+            with self._lock:
+                counters = {name: dict(series) for name, series in self._counters.items()}
+                histograms = {name: dict(series) for name, series in self._histograms.items()}
+            return counters, histograms, self._read_gauges()
+
+        states = [self._publish()]
+        for name in os.listdir(self._shared_path):
+            if (name.startswith(f"{self._token}-") and name.endswith('.json')
+                    and name != f"{self._token}-{os.getpid()}.json"):
+                try:
+                    with open(os.path.join(self._shared_path, name)) as f:
+                        states.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    self.logger.warning(f"Ignoring unreadable metrics file {name}: {e}")
+
+        counters, histograms, gauges = {}, {}, {}
+        for state in states:
+            for name, labels, value in state['counters']:
+                series = counters.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                series[key] = series.get(key, 0.0) + value
+            for name, labels, histogram_state in state['histograms']:
+                series = histograms.setdefault(name, {})
+                key = tuple(map(tuple, labels))
+                if key not in series:
+                    series[key] = Histogram(tuple(histogram_state['buckets']))
+                series[key].merge(histogram_state)
+            if _alive(state['pid']):
+                worker = ('worker', str(state['pid']))
+                for name, labels, value in state['gauges']:
+                    gauges.setdefault(name, {})[tuple(sorted(list(map(tuple, labels)) + [worker]))] = value
+        return counters, histograms, gauges
+
+    def summary(self, name: str, label: str) -> Dict[str, Dict[str, float]]:
+        """Count, mean and max milliseconds of a histogram per label value."""
+        series = self._collect()[1].get(name, {})
+        result = {}
+        for labels, histogram in series.items():
+            value = dict(labels).get(label, '')
+            if histogram.count:
+                result[value] = {
+                    'count': histogram.count,
+                    'mean_ms': histogram.sum / histogram.count * 1000,
+                    'max_ms': histogram.max * 1000
+                }
+        return result
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        counters, histograms, gauges = self._collect()
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, 'counter')
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, 'histogram')
+            for labels, histogram in sorted(series.items()):
+                for bound, count in zip(histogram.buckets, histogram.cumulative()):
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for name, series in sorted(gauges.items()):
+            self._header(lines, name, 'gauge')
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+def _alive(pid: int) -> bool:
+    """Whether a process with this id is running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class RequestProfiler:
+    def __init__(self, output_dir: str):
+        """Initialize an opt-in cProfile hook for API requests.
+
+        Once armed, the next N requests are profiled one at a time (requests
+        arriving while another is being profiled are skipped) and the
+        combined statistics are written as a .prof file, which tools such as
+        snakeviz or flameprof turn into a flame graph.
+
+        Args:
+            output_dir: Directory the profile files are written to
+        """
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.last_profile: Optional[str] = None
+        self._stats: Optional[pstats.Stats] = None
+        self._active: Optional[cProfile.Profile] = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def arm(self, requests: int) -> None:
+        """Profile the next `requests` requests."""
+        with self._lock:
+            self.remaining = requests
+            self._stats = None
+
+    def status(self) -> Dict[str, any]:
+        return {'remaining': self.remaining, 'last_profile': self.last_profile}
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling the current request if armed and idle."""
+        with self._lock:
+            if self.remaining <= 0 or self._active is not None:
+                return None
+            self._active = cProfile.Profile()
+        self._active.enable()
+        return self._active
+
+    def stop(self, profile: cProfile.Profile) -> None:
+        """Stop profiling and dump the statistics after the last request."""
+        profile.disable()
+        with self._lock:
+            self._active = None
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.remaining -= 1
+            if self.remaining > 0:
+                return
+            stats, self._stats = self._stats, None
+
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+            stats.dump_stats(path)
+            self.last_profile = path
+            self.logger.info(f"Wrote request profile to {path}")
+        except Exception as e:
+            self.logger.error(f"Error writing profile: {e}")
+
+# Registry shared by the face processor and the API
+registry = MetricsRegistry()
@@ -0,0 +1,212 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence
+from .encoding_cache import file_hash
+from .inference import SessionPool
+
+class ModelRegistry:
+    def __init__(self, models_path: str, memory_budget: int,
+                 formats: Sequence[str] = ('.onnx', '.tflite'),
+                 sessions: int = 2, threads: int = 1):
+        """Initialize the registry of uploaded models.
+
+        The models directory is indexed once; afterwards it is only
+        rescanned when its modification time changes, and content hashes
+        are only recomputed for files whose size or modification time
+        changed. Session pools are loaded on first use and kept in LRU
+        order. Loading a model evicts the least recently used ones until
+        the estimated memory of the loaded pools fits the budget. Models
+        load outside the registry lock, so requests for loaded models are
+        not held up; concurrent requests for a model that is loading wait
+        for the same load.
+
+        Args:
+            models_path: Directory uploaded models are stored in
+            memory_budget: Bytes loaded session pools may use in total
+            formats: File extensions of models to index
+            sessions: Sessions per loaded model
+            threads: Intra-op threads per session
+        """
+        self.models_path = models_path
+        self.memory_budget = memory_budget
+        self.formats = tuple(formats)
+        self.sessions = sessions
+        self.threads = threads
+        self.logger = logging.getLogger(__name__)
+        self.evictions = deque(maxlen=50)
+        self._models: Dict[str, Dict] = {}
+        self._loaded: OrderedDict = OrderedDict()
+        # Loads in progress, resolved with the pool or the load error
+        self._loading: Dict[str, Future] = {}
+        self._dir_mtime: Optional[int] = None
+        self._lock = threading.RLock()
+        self.refresh()
+
+    def _estimate(self, info: Dict) -> int:
+        """Memory a loaded pool is expected to use: the weights once per session."""
+        return info['size'] * self.sessions
+
+    @property
+    def memory_used(self) -> int:
+        """Estimated bytes used by the loaded pools and the ones being loaded."""
+        with self._lock:
+            return sum(self._estimate(self._models[name]) for name in list(self._loaded) + list(self._loading)
+                       if name in self._models)
+
+    def refresh(self, force: bool = False) -> None:
+        """Re-index the models directory if it changed since the last scan."""
+        try:
+            mtime = os.stat(self.models_path).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            if not force and mtime == self._dir_mtime:
+                return
+            self._dir_mtime = mtime
+            names = [name for name in os.listdir(self.models_path) if name.endswith(self.formats)]
+            for name in set(self._models) - set(names):
+                self.unload(name, reason='deleted')
+                del self._models[name]
+            for name in names:
+                self._index(name)
+
+    def register(self, name: str) -> Dict:
+        """Index a model that was just written and return its entry."""
+        with self._lock:
+            self.unload(name, reason='replaced')
+            self._index(name)
+            return dict(self._models[name])
+
+    def _index(self, name: str) -> None:
+        """Create or update the entry of one model file."""
+        path = os.path.join(self.models_path, name)
+        stat = os.stat(path)
+        info = self._models.get(name)
+        if info and info['size'] == stat.st_size and info['mtime'] == stat.st_mtime_ns:
+            return
+        if info and name in self._loaded:
+            self.unload(name, reason='replaced')
+        try:
+            digest = file_hash(path)
+        except OSError as e:
+            self.logger.error(f"Error hashing model {name}: {e}")
+            digest = None
+        self._models[name] = {
+            'name': name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': digest,
+            'input_shape': info['input_shape'] if info and info['hash'] == digest else None,
+            'state': 'unloaded',
+            'loads': 0,
+            'evictions': 0,
+            'last_used': None,
+            'error': None
+        }
+
+    def list_models(self) -> List[Dict]:
+        """Entries of every indexed model, sorted by name."""
+        self.refresh()
+        with self._lock:
+            return [
+                dict(info, memory=self._estimate(info) if name in self._loaded else 0)
+                for name, info in sorted(self._models.items())
+            ]
+
+    def status(self) -> Dict[str, any]:
+        """Memory budget, usage and recent evictions."""
+        with self._lock:
+            return {
+                'memory_budget': self.memory_budget,
+                'memory_used': self.memory_used,
+                'loaded': list(self._loaded),
+                'evictions': list(self.evictions)
+            }
+
+    def get_pool(self, name: str) -> SessionPool:
+        """Return the session pool of a model, loading it on first use.
+
+        Raises:
+            KeyError: If the model is not in the models directory
+            ValueError: If the model cannot be loaded or exceeds the budget
+        """
+        with self._lock:
+            pool = self._loaded.get(name)
+            if pool is not None:
+                self._loaded.move_to_end(name)
+                self._models[name]['last_used'] = time.time()
+                return pool
+
+            loading = self._loading.get(name)
+            if loading is None:
+                info = self._models.get(name)
+                if info is None:
+                    self.refresh()
+                    info = self._models.get(name)
+                    if info is None:
+                        raise KeyError(f"Model not found: {name}")
+                if not name.endswith('.onnx'):
+                    raise ValueError(f"Only ONNX models can be loaded: {name}")
+                needed = self._estimate(info)
+                if needed > self.memory_budget:
+                    raise ValueError(f"Model {name} needs about {needed} bytes, "
+                                     f"more than the {self.memory_budget} byte budget")
+                while self._loaded and self.memory_used + needed > self.memory_budget:
+                    self.unload(next(iter(self._loaded)), reason='memory budget')
+                # Reserve the model's memory while it loads
+                self._loading[name] = Future()
+                state, info['state'] = info['state'], 'loading'
+        if loading is not None:
+            return loading.result()
+
+        pool = failure = None
+        try:
+            pool = SessionPool(os.path.join(self.models_path, name), self.sessions, self.threads)
+        except ImportError as e:
+            # A missing runtime says nothing about the model, so its state is kept
+            error = ValueError(f"Cannot load model {name}: ONNX Runtime is not installed ({e})")
+        except Exception as e:
+            failure = str(e)
+            error = ValueError(f"Error loading model {name}: {e}")
+
+        with self._lock:
+            loading = self._loading.pop(name)
+            # A model replaced or deleted while it loaded is not kept
+            current = self._models.get(name) is info
+            if current and pool is not None:
+                self._loaded[name] = pool
+                info.update(state='loaded', error=None, input_shape=pool.input_shape,
+                            last_used=time.time(), loads=info['loads'] + 1)
+            elif current and failure:
+                info.update(state='error', error=failure)
+            elif current:
+                info['state'] = state
+        if pool is None:
+            loading.set_exception(error)
+            raise error
+        loading.set_result(pool)
+        self.logger.info(f"Loaded model {name}")
+        return pool
+
+    def unload(self, name: str, reason: str = 'requested') -> bool:
+        """Drop the session pool of a model.
+
+        Requests still running on the pool finish on it; its memory is
+        released once they are done.
+
+        Returns:
+            True if the model was loaded
+        """
+        with self._lock:
+            if self._loaded.pop(name, None) is None:
+                return False
+            info = self._models[name]
+            info['state'] = 'evicted'
+            info['evictions'] += 1
+            self.evictions.append({'name': name, 'reason': reason, 'time': time.time()})
+        self.logger.info(f"Unloaded model {name} ({reason})")
+        return True
@@ -0,0 +1,175 @@
+import math
+import cv2
+import numpy as np
+import face_recognition
+from typing import Dict, List, Optional, Tuple
+from .inference import Location, Rejection
+
+# Width faces are scaled to before scoring sharpness, so the score does not
+# depend on how large the face appears in the image
+SHARPNESS_WIDTH = 112
+
+class QualityGate:
+    def __init__(self, min_size: int = 0, min_sharpness: float = 0.0,
+                 min_brightness: float = 0.0, max_brightness: float = 255.0,
+                 min_contrast: float = 0.0, max_yaw: float = 0.0, max_roll: float = 0.0):
+        """Initialize the checks faces must pass before they are encoded.
+
+        Checks run cheapest first and a face is rejected at the first one
+        it fails: box size, then brightness, contrast and sharpness of the
+        face region, then head pose from facial landmarks. Every check is
+        disabled by a limit of 0 (255 for `max_brightness`). Instances are
+        plain data, so they can be handed to worker processes.
+
+        Args:
+            min_size: Smallest face box side in pixels
+            min_sharpness: Lowest variance of the Laplacian of the face
+                scaled to SHARPNESS_WIDTH pixels wide; blurry faces score low
+            min_brightness: Lowest mean gray level of the face
+            max_brightness: Highest mean gray level of the face
+            min_contrast: Lowest standard deviation of the face's gray levels
+            max_yaw: Largest head turn in degrees
+            max_roll: Largest head tilt in degrees
+        """
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any check is active."""
+        return bool(self.min_size or self._checks_pixels or self._checks_pose)
+
+    @property
+    def _checks_pixels(self) -> bool:
+        return bool(self.min_sharpness or self.min_brightness or self.max_brightness < 255
+                    or self.min_contrast)
+
+    @property
+    def _checks_pose(self) -> bool:
+        return bool(self.max_yaw or self.max_roll)
+
+    def settings(self) -> Dict[str, any]:
+        """Gate limits as a dictionary."""
+        return {
+            'min_size': self.min_size,
+            'min_sharpness': self.min_sharpness,
+            'min_brightness': self.min_brightness,
+            'max_brightness': self.max_brightness,
+            'min_contrast': self.min_contrast,
+            'max_yaw': self.max_yaw,
+            'max_roll': self.max_roll
+        }
+
+    def assess(self, image: np.ndarray, location: Location) -> Optional[Tuple[str, float]]:
+        """Check one face.
+
+        Args:
+            image: RGB image array
+            location: Face location as (top, right, bottom, left)
+
+        Returns:
+            None if the face passes, otherwise the reason ('small', 'dark',
+            'bright', 'low_contrast', 'blurry', 'yaw' or 'roll') and the
+            measured value
+        """
+        top, right, bottom, left = location
+        size = min(bottom - top, right - left)
+        if size < max(self.min_size, 1):
+            return 'small', float(size)
+
+        if self._checks_pixels:
+            face = image[max(top, 0):bottom, max(left, 0):right]
+            if not face.size:
+                return 'small', 0.0
+            gray = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY) if face.ndim == 3 else face
+            brightness = float(gray.mean())
+            if brightness < self.min_brightness:
+                return 'dark', brightness
+            if brightness > self.max_brightness:
+                return 'bright', brightness
+            if self.min_contrast:
+                contrast = float(gray.std())
+                if contrast < self.min_contrast:
+                    return 'low_contrast', contrast
+            if self.min_sharpness:
+                sharpness = sharpness_score(gray)
+                if sharpness < self.min_sharpness:
+                    return 'blurry', sharpness
+
+        if self._checks_pose:
+            pose = head_pose(image, location)
+            if pose is not None:
+                yaw, roll = pose
+                if self.max_yaw and yaw > self.max_yaw:
+                    return 'yaw', yaw
+                if self.max_roll and roll > self.max_roll:
+                    return 'roll', roll
+        return None
+
+    def split(self, image: np.ndarray, locations: List[Location]) -> Tuple[List[Location], List[Rejection]]:
+        """Separate the faces worth encoding from the rejected ones.
+
+        Args:
+            image: RGB image array
+            locations: Detected face locations
+
+        Returns:
+            Tuple of (accepted locations, (location, reason, value) of
+            every rejected face)
+        """
+        accepted, rejected = [], []
+        for location in locations:
+            verdict = self.assess(image, location)
+            if verdict is None:
+                accepted.append(location)
+            else:
+                rejected.append((location,) + verdict)
+        return accepted, rejected
+
+def sharpness_score(gray: np.ndarray) -> float:
+    """Variance of the Laplacian of a grayscale face at a fixed width."""
+    height, width = gray.shape[:2]
+    scaled = cv2.resize(gray, (SHARPNESS_WIDTH, max(1, round(height * SHARPNESS_WIDTH / width))),
+                        interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(scaled, cv2.CV_64F).var())
+
+def head_pose(image: np.ndarray, location: Location) -> Optional[Tuple[float, float]]:
+    """Estimate the head turn and tilt of a face from its landmarks.
+
+    Uses the five-point landmark model. Roll is the angle of the line
+    through the eyes; yaw follows from how far the nose tip sits off the
+    middle of the eyes, taking the nose to stand out half the eye distance.
+
+    Args:
+        image: RGB image array
+        location: Face location as (top, right, bottom, left)
+
+    Returns:
+        Tuple of (yaw, roll) in degrees, both non-negative, or None if the
+        landmarks are unusable
+    """
+    landmarks = face_recognition.face_landmarks(image, [location], model='small')
+    if not landmarks:
+        return None
+    marks = landmarks[0]
+    try:
+        first = np.mean(marks['left_eye'], axis=0)
+        second = np.mean(marks['right_eye'], axis=0)
+        nose = np.mean(marks['nose_tip'], axis=0)
+    except KeyError:
+        return None
+    eyes = second - first
+    if eyes[0] < 0:
+        eyes = -eyes
+    distance = float(np.hypot(*eyes))
+    if not distance:
+        return None
+    roll = abs(math.degrees(math.atan2(eyes[1], eyes[0])))
+    offset = abs(float(np.dot(nose - (first + second) / 2, eyes))) / distance
+    yaw = math.degrees(math.atan(2 * offset / distance))
+    return yaw, roll
@@ -0,0 +1,153 @@
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+
+# Storage modes of gallery encodings and the dtype of their stored codes
+STORAGE_DTYPES = {
+    'float32': np.dtype(np.float32),
+    'float16': np.dtype(np.float16),
+    'int8': np.dtype(np.int8)
+}
+
+# Rows converted to float32 at a time when scoring compact codes
+DOT_BLOCK_ROWS = 4096
+
+def quantize(rows: np.ndarray, storage: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert encodings to the codes stored for a storage mode.
+
+    int8 codes use one scale per vector: the largest absolute value maps
+    to 127, so every vector keeps its full code range.
+
+    Args:
+        rows: Array of shape (N, dim)
+        storage: 'float32', 'float16' or 'int8'
+
+    Returns:
+        Tuple of (codes, per-row float32 scales or None for float modes)
+    """
+    rows = np.asarray(rows, dtype=np.float32)
+    dtype = STORAGE_DTYPES[storage]
+    if storage != 'int8':
+        return rows.astype(dtype), None
+    peak = np.abs(rows).max(axis=1) if rows.size else np.empty(len(rows), dtype=np.float32)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(rows / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Float32 encodings represented by stored codes."""
+    rows = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        rows = rows * scales[:, None]
+    return rows
+
+def squared_norms(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Squared norm of the encoding every code row represents."""
+    sq = np.zeros(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), DOT_BLOCK_ROWS):
+        block = dequantize(codes[start:start + DOT_BLOCK_ROWS],
+                           None if scales is None else scales[start:start + DOT_BLOCK_ROWS])
+        sq[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+    return sq
+
+def dot(probes: np.ndarray, codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Inner products between float32 probes and stored codes.
+
+    float32 codes go straight to BLAS. Compact codes are widened one block
+    of rows at a time, so scoring reads the compact matrix once and never
+    materializes a float32 copy of the whole gallery.
+
+    Args:
+        probes: Array of shape (M, dim)
+        codes: Stored codes of shape (N, dim)
+        scales: Per-row scales of int8 codes
+
+    Returns:
+        Array of shape (M, N)
+    """
+    if codes.dtype == np.float32:
+        return probes @ codes.T
+    out = np.empty((len(probes), len(codes)), dtype=np.float32)
+    for start in range(0, len(codes), DOT_BLOCK_ROWS):
+        block = codes[start:start + DOT_BLOCK_ROWS].astype(np.float32)
+        out[:, start:start + len(block)] = probes @ block.T
+    if scales is not None:
+        out *= scales[None, :]
+    return out
+
+def evaluate(encodings: np.ndarray, labels: np.ndarray, threshold: float,
+             modes: Sequence[str] = tuple(STORAGE_DTYPES), max_probes: int = 1000,
+             seed: int = 0, block: int = 64) -> Dict[str, Dict[str, float]]:
+    """Compare the match decisions of each storage mode with float64.
+
+    Every probe is a gallery encoding scored against all other rows, so
+    the check uses the distances that occur in the current gallery. A
+    verify decision disagrees when a mode and float64 differ on whether
+    the probe's closest encoding of a person is within the threshold; an
+    identify decision disagrees when the closest person differs.
+
+    Args:
+        encodings: Gallery encodings of shape (N, dim)
+        labels: Person index of every row
+        threshold: Distance at or below which encodings match
+        modes: Storage modes to evaluate
+        max_probes: Largest number of rows used as probes
+        seed: Seed for picking the probe rows
+        block: Probes scored at a time, bounds the memory used
+
+    Returns:
+        Per mode: bytes per encoding, verify and identify disagreement
+        rates and the largest absolute distance error
+    """
+    encodings = np.asarray(encodings, dtype=np.float64)
+    labels = np.asarray(labels)
+    probe_rows = np.arange(len(encodings))
+    if len(probe_rows) > max_probes:
+        rng = np.random.default_rng(seed)
+        probe_rows = np.sort(rng.choice(probe_rows, max_probes, replace=False))
+
+    # Columns grouped by person, so per-person minima are one reduceat
+    order = np.argsort(labels, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(labels[order]) != 0]) if len(order) else order
+    exact_sq = (encodings ** 2).sum(axis=1)
+    stored = {mode: quantize(encodings, mode) for mode in modes}
+    stored_sq = {mode: squared_norms(*stored[mode]) for mode in modes}
+
+    def decisions(dists: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        dists[np.arange(len(rows)), rows] = np.inf  # leave the probe itself out
+        best = np.minimum.reduceat(dists[:, order], starts, axis=1)
+        return best <= threshold, best.argmin(axis=1)
+
+    totals = {mode: {'verify': 0, 'identify': 0, 'error': 0.0} for mode in modes}
+    pairs = 0
+    for begin in range(0, len(probe_rows), block):
+        rows = probe_rows[begin:begin + block]
+        probes = encodings[rows]
+        exact = np.sqrt(np.maximum(
+            (probes ** 2).sum(axis=1)[:, None] + exact_sq[None, :] - 2.0 * probes @ encodings.T, 0.0))
+        exact_match, exact_top = decisions(exact, rows)
+        finite = np.isfinite(exact)
+        pairs += exact_match.size
+        # Probes stay float32, as they do when requests are matched
+        query = probes.astype(np.float32)
+        for mode in modes:
+            codes, scales = stored[mode]
+            dists = np.sqrt(np.maximum(
+                np.einsum('ij,ij->i', query, query)[:, None] + stored_sq[mode][None, :]
+                - 2.0 * dot(query, codes, scales), 0.0)).astype(np.float64)
+            match, top = decisions(dists, rows)
+            totals[mode]['verify'] += int(np.count_nonzero(match != exact_match))
+            totals[mode]['identify'] += int(np.count_nonzero(top != exact_top))
+            if finite.any():
+                totals[mode]['error'] = max(totals[mode]['error'],
+                                            float(np.abs(dists - exact)[finite].max()))
+
+    report = {}
+    for mode in modes:
+        codes, scales = stored[mode]
+        report[mode] = {
+            'bytes_per_encoding': codes.shape[1] * codes.dtype.itemsize + (4 if scales is not None else 0),
+            'verify_disagreement': totals[mode]['verify'] / pairs if pairs else 0.0,
+            'identify_disagreement': totals[mode]['identify'] / len(probe_rows) if len(probe_rows) else 0.0,
+            'max_distance_error': totals[mode]['error']
+        }
+    return report
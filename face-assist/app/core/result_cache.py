@@ -0,0 +1,79 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+def content_key(data: bytes, boxes: Optional[List[Tuple[int, ...]]] = None) -> str:
+    """Cache key for encoded image bytes and the face boxes supplied with them."""
+    digest = hashlib.sha256(data)
+    if boxes:
+        digest.update(repr([tuple(box) for box in boxes]).encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 30.0):
+        """Initialize a bounded LRU cache with per-entry expiry.
+
+        The cache holds detection and encoding results keyed by image
+        content. Those do not depend on the gallery, so matches are always
+        recomputed against the current gallery and enrollments never see a
+        stale answer.
+
+        Args:
+            max_entries: Maximum number of entries kept, 0 disables caching
+            ttl: Seconds an entry stays valid after it was stored
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if absent or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entries if full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry; counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
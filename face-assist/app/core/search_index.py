@@ -0,0 +1,284 @@
+import os
+import logging
+import numpy as np
+from typing import List, Optional, Tuple
+
+INDEX_FILENAME = '.index.npz'
+
+def _squared_distances(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Squared Euclidean distances between rows of data and centroids."""
+    sq = (np.einsum('ij,ij->i', data, data)[:, None]
+          + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+          - 2.0 * data @ centroids.T)
+    return np.maximum(sq, 0.0, out=sq)
+
+def _nearest_centroid(data: np.ndarray, centroids: np.ndarray,
+                      chunk_size: int = 8192) -> np.ndarray:
+    """Index of the closest centroid for every row of data."""
+    assignment = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        assignment[start:start + len(chunk)] = _squared_distances(chunk, centroids).argmin(axis=1)
+    return assignment
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Cluster data with Lloyd's algorithm.
+
+    Args:
+        data: Array of shape (N, dim)
+        k: Number of clusters, at most N
+        iterations: Number of refinement passes
+        seed: Seed for centroid initialization
+
+    Returns:
+        Array of shape (k, dim) holding the cluster centroids
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroid(data, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack([
+            np.bincount(assignment, weights=data[:, j], minlength=k)
+            for j in range(data.shape[1])
+        ], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points so every cell stays usable
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+class ExactIndex:
+    """Brute-force search; every gallery row is a candidate."""
+
+    kind = 'exact'
+
+    def __len__(self) -> int:
+        return 0
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        pass
+
+    def remove(self, ids: np.ndarray) -> None:
+        pass
+
+    def train(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        pass
+
+    def assign(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        pass
+
+    def needs_training(self, gallery_size: int) -> bool:
+        return False
+
+    def search(self, probes: np.ndarray) -> Optional[List[np.ndarray]]:
+        """Return None to signal that the whole gallery must be scanned."""
+        return None
+
+    def save(self) -> None:
+        pass
+
+class IVFIndex:
+    """Inverted-file index over k-means coarse cells.
+
+    Each encoding is filed under its nearest centroid. A query only scans
+    the encodings in its `nprobe` closest cells, so `nprobe` trades recall
+    for latency: higher values visit more cells and approach exact search.
+
+    Centroids and cell lists are published together as one immutable
+    state, so searches never lock and never mix two versions. Writers are
+    expected to be serialized by the owning gallery.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim: int = 128, nprobe: int = 8, min_size: int = 5000,
+                 nlist: Optional[int] = None, path: Optional[str] = None):
+        """Initialize the IVF index, loading trained cells from path if present.
+
+        Args:
+            dim: Dimension of the indexed vectors
+            nprobe: Number of cells scanned per query
+            min_size: Gallery size below which exact search is used
+            nlist: Number of cells, derived from the gallery size if omitted
+            path: File the trained cells are persisted to
+        """
+        self.dim = dim
+        self.path = path
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.nlist = nlist
+        self.trained_size = 0
+        # (centroids, cell lists, number of indexed ids)
+        self._state: Tuple[Optional[np.ndarray], Tuple[np.ndarray, ...], int] = (None, (), 0)
+        self.logger = logging.getLogger(__name__)
+        if path:
+            self.load()
+
+    def __len__(self) -> int:
+        return self._state[2]
+
+    @property
+    def centroids(self) -> Optional[np.ndarray]:
+        return self._state[0]
+
+    @property
+    def is_trained(self) -> bool:
+        return self._state[0] is not None
+
+    def needs_training(self, gallery_size: int) -> bool:
+        """Whether the coarse cells should be (re)built for this gallery size."""
+        if not gallery_size or gallery_size < self.min_size:
+            return False
+        return not self.is_trained or gallery_size > 4 * self.trained_size
+
+    def train(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Learn coarse cells from the gallery and file every vector.
+
+        Args:
+            ids: Gallery ids of the vectors
+            vectors: Array of shape (N, dim)
+        """
+        nlist = self.nlist or int(np.clip(np.sqrt(len(vectors)), 16, 1024))
+        nlist = min(nlist, len(vectors))
+        # k-means converges on a sample; 64 points per cell is plenty
+        rng = np.random.default_rng(0)
+        sample_size = min(len(vectors), 64 * nlist)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = kmeans(sample, nlist)
+        self._state = self._filed(centroids, self._empty_lists(nlist), 0, ids, vectors)
+        self.trained_size = len(vectors)
+        self.logger.info(f"Trained IVF index with {nlist} cells over {len(vectors)} encodings")
+        self.save()
+
+    def assign(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """File all vectors under the current centroids, replacing old lists."""
+        centroids = self.centroids
+        if centroids is None:
+            return
+        self._state = self._filed(centroids, self._empty_lists(len(centroids)), 0, ids, vectors)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        """Insert vectors into their nearest cells.
+
+        Args:
+            ids: Gallery ids of the vectors
+            vectors: Array of shape (M, dim)
+        """
+        centroids, lists, size = self._state
+        if centroids is None or not len(ids):
+            return
+        self._state = self._filed(centroids, lists, size, ids, vectors)
+
+    @staticmethod
+    def _empty_lists(nlist: int) -> Tuple[np.ndarray, ...]:
+        return (np.empty(0, dtype=np.int64),) * nlist
+
+    @staticmethod
+    def _filed(centroids: np.ndarray, lists: Tuple[np.ndarray, ...], size: int,
+               ids: np.ndarray, vectors: np.ndarray) -> Tuple[np.ndarray, Tuple[np.ndarray, ...], int]:
+        """Return a new state with vectors filed under their nearest cells."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return centroids, lists, size
+        cells = _nearest_centroid(np.asarray(vectors, dtype=np.float32), centroids)
+        lists = list(lists)
+        for cell in np.unique(cells):
+            lists[cell] = np.concatenate((lists[cell], ids[cells == cell]))
+        return centroids, tuple(lists), size + len(ids)
+
+    def remove(self, ids: np.ndarray) -> None:
+        """Delete vectors from the index by gallery id."""
+        centroids, lists, size = self._state
+        if centroids is None or not len(ids):
+            return
+        lists = list(lists)
+        for cell, members in enumerate(lists):
+            keep = ~np.isin(members, ids)
+            if not keep.all():
+                size -= int(np.count_nonzero(~keep))
+                lists[cell] = members[keep]
+        self._state = (centroids, tuple(lists), size)
+
+    def search(self, probes: np.ndarray) -> Optional[List[np.ndarray]]:
+        """Collect candidate ids from the closest cells of every probe.
+
+        Args:
+            probes: Array of shape (M, dim)
+
+        Returns:
+            One sorted array of candidate ids per probe, or None when the
+            index is not in use and the whole gallery must be scanned
+        """
+        centroids, lists, size = self._state
+        if centroids is None or size < self.min_size:
+            return None
+        probes = np.atleast_2d(np.asarray(probes, dtype=np.float32))
+        nprobe = min(self.nprobe, len(centroids))
+        dists = _squared_distances(probes, centroids)
+        cells = np.argpartition(dists, nprobe - 1, axis=1)[:, :nprobe]
+        return [
+            np.sort(np.concatenate([lists[cell] for cell in row]))
+            for row in cells
+        ]
+
+    def save(self) -> None:
+        """Persist the coarse cells; assignments are cheap to recompute."""
+        if not self.is_trained or not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, centroids=self.centroids,
+                         trained_size=np.int64(self.trained_size))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.logger.error(f"Error saving search index: {e}")
+
+    def load(self) -> bool:
+        """Load previously trained cells from the index file.
+
+        Returns:
+            True if cells were loaded
+        """
+        path = self.path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                centroids = data['centroids'].astype(np.float32)
+                trained_size = int(data['trained_size'])
+            if centroids.ndim != 2 or centroids.shape[1] != self.dim:
+                raise ValueError(f"unexpected centroid shape {centroids.shape}")
+            self.trained_size = trained_size
+            self._state = (centroids, self._empty_lists(len(centroids)), 0)
+            return True
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable search index {path}: {e}")
+            return False
+
+def create_index(kind: str, dim: int = 128, nprobe: int = 8, min_size: int = 5000,
+                 path: Optional[str] = None):
+    """Create a search index by name.
+
+    Args:
+        kind: 'exact' for brute force, 'ivf' for an IVF index, or 'auto' for
+            an IVF index that falls back to exact search below min_size
+        dim: Dimension of the indexed vectors
+        nprobe: Number of IVF cells scanned per query
+        min_size: Gallery size at which IVF search takes over ('auto' only)
+        path: File the IVF cells are persisted to
+
+    Returns:
+        Search index instance
+    """
+    if kind == 'exact':
+        return ExactIndex()
+    if kind == 'ivf':
+        return IVFIndex(dim, nprobe, min_size=0, path=path)
+    if kind == 'auto':
+        return IVFIndex(dim, nprobe, min_size=min_size, path=path)
+    raise ValueError(f"Unknown search index: {kind}")
@@ -0,0 +1,330 @@
+import os
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .gallery import FaceGallery, GallerySnapshot, without_person
+from .quantization import STORAGE_DTYPES, dequantize, quantize, squared_norms
+
+# Layout of the header file, one int64 per field
+HEADER_FIELDS = ('magic', 'token', 'generation', 'epoch', 'count', 'dim', 'segment', 'next_id', 'storage')
+STORAGE_CODES = {storage: code for code, storage in enumerate(STORAGE_DTYPES)}
+HEADER_MAGIC = 0x46414741  # "FAGA"
+
+def token_value(token: str) -> int:
+    """Fold a server token string into a signed int64 for the header."""
+    return int.from_bytes(hashlib.sha256(token.encode()).digest()[:8], 'little', signed=True)
+
+class SharedFaceGallery(FaceGallery):
+    def __init__(self, path: str, dim: int = 128, capacity: int = 1024, index=None,
+                 storage: str = 'float32'):
+        """Initialize a face gallery shared by several worker processes.
+
+        The encodings live in a memory-mapped segment file inside `path`,
+        so every worker maps the same pages instead of holding its own
+        copy. A small header file holds a generation counter that is
+        bumped after every write; readers compare it with the generation
+        of their snapshot on every access and remap only when it changed.
+
+        Rows are only ever appended to a segment. Growing the gallery or
+        replacing its contents writes a new segment file, so snapshots of
+        other processes keep pointing at data that never changes. Writers
+        serialize on an flock; readers take no lock. Each writer stores
+        the rows, then the person names, then the count and finally the
+        generation, and readers load them in the opposite order.
+
+        The search index is not shared: every process files the rows it
+        maps into its own index, which costs little next to the matrix.
+
+        Args:
+            path: Directory holding the header, person names and segments
+            dim: Dimension of the face encodings
+            capacity: Rows allocated for a new segment
+            index: Search index, kept per process and fed from the segment
+            storage: 'float32', 'float16' or 'int8'
+        """
+        super().__init__(dim=dim, capacity=0, index=index, storage=storage)
+        self.path = path
+        self.initial_capacity = capacity
+        self.logger = logging.getLogger(__name__)
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, 'lock'), 'a+')
+        self._file_lock_depth = 0
+        self._thread_lock = threading.RLock()
+        header_path = os.path.join(path, 'header')
+        header_size = 8 * len(HEADER_FIELDS)
+        with self.file_lock():
+            # A missing header, or one written by a different layout, starts empty
+            if not os.path.exists(header_path) or os.path.getsize(header_path) != header_size:
+                with open(header_path, 'wb') as f:
+                    f.write(b'\0' * header_size)
+        self._header = np.memmap(header_path, dtype=np.int64, mode='r+', shape=(len(HEADER_FIELDS),))
+        self._segment = -1
+        self._generation = -1
+        self._epoch = -1
+        self._indexed = 0
+        self._people: Tuple[str, ...] = ()
+
+    def _get(self, field: str) -> int:
+        return int(self._header[HEADER_FIELDS.index(field)])
+
+    def _set(self, field: str, value: int) -> None:
+        self._header[HEADER_FIELDS.index(field)] = value
+
+    @contextmanager
+    def file_lock(self):
+        """Hold the cross-process writer lock; reentrant within a process."""
+        with self._thread_lock:
+            if self._file_lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+                if self._file_lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def attach(self, token: str) -> bool:
+        """Use the shared contents if they were published for this server.
+
+        Args:
+            token: Identifier of the running server, shared by its workers
+
+        Returns:
+            True if the gallery was already loaded by another worker
+        """
+        with self.file_lock():
+            if (self._get('magic') != HEADER_MAGIC or self._get('token') != token_value(token)
+                    or self._get('dim') != self.dim or self._get('storage') != STORAGE_CODES[self.storage]):
+                return False
+            self._sync()
+            return True
+
+    def replace(self, encodings: Dict[str, List[np.ndarray]], token: str) -> int:
+        """Publish a new gallery made of the given encodings.
+
+        Args:
+            encodings: Encodings per person
+            token: Identifier of the running server
+
+        Returns:
+            Number of encodings published
+        """
+        people = tuple(person for person, rows in encodings.items() if len(rows))
+        rows = [np.asarray(encodings[person], dtype=np.float32).reshape(-1, self.dim) for person in people]
+        matrix = np.concatenate(rows) if rows else np.empty((0, self.dim), dtype=np.float32)
+        codes, scales = quantize(matrix, self.storage)
+        labels = np.repeat(np.arange(len(people), dtype=np.int32), [len(r) for r in rows])
+        with self.file_lock():
+            self._set('magic', HEADER_MAGIC)
+            self._set('token', token_value(token))
+            self._set('dim', self.dim)
+            self._set('storage', STORAGE_CODES[self.storage])
+            self._write_segment(codes, scales, labels, np.arange(len(matrix), dtype=np.int64), people)
+        return len(matrix)
+
+    def set_person(self, person: str, encodings: Iterable[np.ndarray]) -> int:
+        """Replace every encoding of a person and publish it to every worker.
+
+        Args:
+            person: Name of the person
+            encodings: New face encodings of the person, may be empty
+
+        Returns:
+            Number of encodings stored for the person
+        """
+        rows = np.asarray(list(encodings), dtype=np.float32).reshape(-1, self.dim)
+        with self.file_lock():
+            if self._get('magic') != HEADER_MAGIC:
+                raise RuntimeError("Shared gallery is not initialized")
+            self._sync()
+            matrix, scales, labels, ids, people = without_person(self._snapshot, person)
+            codes, new_scales = quantize(rows, self.storage)
+            next_id = self._get('next_id')
+            if len(rows):
+                people = people + (person,)
+            self._write_segment(
+                np.concatenate((matrix, codes)),
+                np.concatenate((scales, new_scales if new_scales is not None
+                                else np.ones(len(rows), dtype=np.float32))),
+                np.concatenate((labels, np.full(len(rows), len(people) - 1, dtype=np.int32))),
+                np.concatenate((ids, np.arange(next_id, next_id + len(rows), dtype=np.int64))),
+                people
+            )
+        return len(rows)
+
+    def _write_segment(self, matrix: np.ndarray, scales: Optional[np.ndarray], labels: np.ndarray,
+                       ids: np.ndarray, people: Tuple[str, ...]) -> None:
+        """Publish the given rows in a new segment; the file lock must be held."""
+        count = len(matrix)
+        segment = self._get('segment') + 1
+        arrays = self._create_segment(segment, max(self.initial_capacity, 2 * count))
+        arrays[0][:count] = matrix
+        arrays[1][:count] = squared_norms(matrix, scales)
+        arrays[2][:count] = labels
+        arrays[3][:count] = ids
+        arrays[4][:count] = scales if scales is not None else 1.0
+        self._write_people(people)
+
+        self._set('segment', segment)
+        self._set('next_id', max(self._get('next_id'), int(ids.max()) + 1 if count else 0))
+        # Rows moved or disappeared, so every process must refile its search index
+        self._set('epoch', self._get('epoch') + 1)
+        self._set('count', count)
+        self._set('generation', self._get('generation') + 1)
+        self._header.flush()
+        # Also drops segments left behind by a crashed writer
+        for name in os.listdir(self.path):
+            if name.startswith('segment.') and name != f"segment.{segment}":
+                self._remove_segment(int(name.split('.')[1]))
+        self._sync()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"segment.{segment}")
+
+    def _segment_layout(self, capacity: int) -> List[Tuple[str, np.dtype, Tuple[int, ...]]]:
+        return [
+            ('matrix', STORAGE_DTYPES[self.storage], (capacity, self.dim)),
+            ('sq_norms', np.dtype(np.float32), (capacity,)),
+            ('labels', np.dtype(np.int32), (capacity,)),
+            ('ids', np.dtype(np.int64), (capacity,)),
+            ('scales', np.dtype(np.float32), (capacity,))
+        ]
+
+    def _map_segment(self, segment: int, capacity: Optional[int] = None) -> List[np.ndarray]:
+        """Map the arrays stored in a segment file, sized from the file if needed."""
+        if capacity is None:
+            row_size = sum(dtype.itemsize * int(np.prod(shape))
+                           for _, dtype, shape in self._segment_layout(1))
+            capacity = os.path.getsize(self._segment_path(segment)) // row_size
+        arrays = []
+        offset = 0
+        for _, dtype, shape in self._segment_layout(capacity):
+            arrays.append(np.memmap(self._segment_path(segment), dtype=dtype, mode='r+',
+                                    offset=offset, shape=shape))
+            offset += dtype.itemsize * int(np.prod(shape))
+        return arrays
+
+    def _create_segment(self, segment: int, capacity: int) -> List[np.ndarray]:
+        """Create an empty segment file with room for `capacity` rows."""
+        size = sum(dtype.itemsize * int(np.prod(shape))
+                   for _, dtype, shape in self._segment_layout(capacity))
+        with open(self._segment_path(segment), 'wb') as f:
+            f.truncate(size)
+        return self._map_segment(segment, capacity)
+
+    def _remove_segment(self, segment: int) -> None:
+        """Unlink an old segment; processes that still map it keep their view."""
+        try:
+            os.remove(self._segment_path(segment))
+        except FileNotFoundError:
+            pass
+
+    def _write_people(self, people: Tuple[str, ...]) -> None:
+        tmp_path = os.path.join(self.path, 'people.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(list(people), f)
+        os.replace(tmp_path, os.path.join(self.path, 'people.json'))
+
+    def _read_people(self) -> Tuple[str, ...]:
+        with open(os.path.join(self.path, 'people.json')) as f:
+            return tuple(json.load(f))
+
+    @property
+    def snapshot(self) -> GallerySnapshot:
+        """The current snapshot, refreshed if another process published."""
+        if self._get('generation') != self._generation:
+            with self._thread_lock:
+                try:
+                    self._sync()
+                except (OSError, ValueError) as e:
+                    # A writer replaced the segment mid-read; keep the last
+                    # consistent snapshot and retry on the next access
+                    self.logger.debug(f"Deferring gallery refresh: {e}")
+        return self._snapshot
+
+    def _sync(self) -> None:
+        """Map the latest published state and publish a local snapshot."""
+        generation = self._get('generation')
+        if generation == self._generation or self._get('magic') != HEADER_MAGIC:
+            return
+        epoch = self._get('epoch')
+        count = self._get('count')
+        segment = self._get('segment')
+        if segment != self._segment:
+            self._matrix, self._sq_norms, self._labels, self._ids, self._scales = self._map_segment(segment)
+            self._segment = segment
+        self._people = self._read_people()
+
+        matrix, ids, scales = self._matrix[:count], self._ids[:count], self._scales[:count]
+        if epoch != self._epoch:
+            self.index.assign(ids, dequantize(matrix, scales))
+            self._epoch = epoch
+        elif count > self._indexed:
+            self.index.add(ids[self._indexed:], dequantize(matrix[self._indexed:], scales[self._indexed:]))
+        if self.index.needs_training(count):
+            self.index.train(ids, dequantize(matrix, scales))
+        self._indexed = count
+
+        self._snapshot = GallerySnapshot(
+            matrix, self._sq_norms[:count], self._labels[:count], ids,
+            self._people, {person: i for i, person in enumerate(self._people)},
+            self.index, generation, scales if self.storage == 'int8' else None
+        )
+        self._generation = generation
+
+    def add(self, person: str, encodings: Iterable[np.ndarray]) -> int:
+        """Append encodings for a person and publish them to every worker.
+
+        Args:
+            person: Name of the person
+            encodings: Face encodings to add
+
+        Returns:
+            Number of encodings added
+        """
+        rows = np.asarray(list(encodings), dtype=np.float32).reshape(-1, self.dim)
+        if not len(rows):
+            return 0
+
+        with self.file_lock():
+            if self._get('magic') != HEADER_MAGIC:
+                raise RuntimeError("Shared gallery is not initialized")
+            self._sync()
+            people = self._people
+            label = people.index(person) if person in people else None
+            if label is None:
+                label = len(people)
+                people = people + (person,)
+                self._write_people(people)
+
+            start, end = self._get('count'), self._get('count') + len(rows)
+            if end > len(self._matrix):
+                segment = self._get('segment') + 1
+                arrays = self._create_segment(segment, max(end, 2 * len(self._matrix)))
+                for new, old in zip(arrays, (self._matrix, self._sq_norms, self._labels, self._ids, self._scales)):
+                    new[:start] = old[:start]
+                old_segment = self._segment
+                self._matrix, self._sq_norms, self._labels, self._ids, self._scales = arrays
+                self._segment = segment
+                self._set('segment', segment)
+                self._remove_segment(old_segment)
+
+            next_id = self._get('next_id')
+            codes, scales = quantize(rows, self.storage)
+            self._matrix[start:end] = codes
+            self._scales[start:end] = scales if scales is not None else 1.0
+            self._sq_norms[start:end] = squared_norms(codes, scales)
+            self._labels[start:end] = label
+            self._ids[start:end] = np.arange(next_id, next_id + len(rows))
+            self._set('next_id', next_id + len(rows))
+            self._set('count', end)
+            self._set('generation', self._get('generation') + 1)
+            self._header.flush()
+            self._sync()
+        return len(rows)
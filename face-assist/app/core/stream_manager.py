@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional
+import cv2
+import numpy as np
+
+# Width frames are shrunk to before comparing them in the motion gate
+MOTION_WIDTH = 160
+
+def recognition_event(camera: str, face: Dict[str, any]) -> Dict[str, any]:
+    """Event describing one face identified in a frame from a camera."""
+    best = face['candidates'][0] if face['candidates'] else None
+    matched = best is not None and best['match']
+    return {
+        'camera': camera,
+        'timestamp': time.time(),
+        'person': best['name'] if matched else None,
+        'distance': best['distance'] if best else None,
+        'location': face['location'],
+        'candidates': face['candidates']
+    }
+
+class CameraStream:
+    def __init__(self, name: str, url: str, face_processor, fps: float = 2.0,
+                 motion_threshold: float = 4.0, top_k: int = 1,
+                 on_event: Optional[Callable[[Dict, Optional[np.ndarray]], None]] = None):
+        """Initialize a camera stream pipeline.
+
+        Frames flow through a bounded pipeline: a reader thread decodes
+        frames at the sampling rate into a single slot, and a worker thread
+        takes the latest frame through the motion gate, detection, encoding
+        and gallery match. When the worker falls behind, the frame waiting
+        in the slot is replaced and counted as dropped instead of queued.
+
+        Args:
+            name: Unique name of the stream, used as the camera id in events
+            url: MJPEG/HTTP or RTSP URL, or a local video file
+            face_processor: FaceProcessor used to identify faces
+            fps: Frames sampled per second
+            motion_threshold: Mean absolute pixel difference (0-255) between
+                sampled frames below which a frame is skipped as static,
+                0 to disable the gate
+            top_k: Number of candidate people reported per face
+            on_event: Callback invoked with every recognition event and the
+                BGR frame it was found in
+        """
+        self.name = name
+        self.url = url
+        self.face_processor = face_processor
+        self.fps = fps
+        self.motion_threshold = motion_threshold
+        self.top_k = top_k
+        self.on_event = on_event
+        self.logger = logging.getLogger(__name__)
+        self.events = deque(maxlen=100)
+        self.state = 'stopped'
+        self.last_error: Optional[str] = None
+        self.stats = {
+            'frames_read': 0,
+            'frames_sampled': 0,
+            'frames_dropped': 0,
+            'frames_static': 0,
+            'frames_processed': 0,
+            'faces_detected': 0
+        }
+        self._slot: Optional[np.ndarray] = None
+        self._slot_ready = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def is_file(self) -> bool:
+        return os.path.isfile(self.url)
+
+    def config(self) -> Dict[str, any]:
+        """Settings needed to recreate the stream."""
+        return {
+            'name': self.name,
+            'url': self.url,
+            'fps': self.fps,
+            'motion_threshold': self.motion_threshold,
+            'top_k': self.top_k
+        }
+
+    def status(self) -> Dict[str, any]:
+        """Current state, settings and pipeline counters."""
+        return dict(self.config(), state=self.state, error=self.last_error, **self.stats)
+
+    def start(self) -> None:
+        """Start the reader and worker threads."""
+        self._stop.clear()
+        self.state = 'connecting'
+        self._threads = [
+            threading.Thread(target=self._read_loop, name=f'stream-read-{self.name}', daemon=True),
+            threading.Thread(target=self._process_loop, name=f'stream-proc-{self.name}', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the pipeline and wait for its threads to exit."""
+        self._stop.set()
+        with self._slot_ready:
+            self._slot_ready.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        self.state = 'stopped'
+
+    def _read_loop(self) -> None:
+        """Decode sampled frames into the slot, reconnecting on failure."""
+        backoff = 1.0
+        while not self._stop.is_set():
+            capture = cv2.VideoCapture(self.url)
+            if not capture.isOpened():
+                self.last_error = 'Unable to open stream'
+                self.state = 'reconnecting'
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+
+            self.state = 'running'
+            self.last_error = None
+            backoff = 1.0
+            ended = self._read_frames(capture)
+            capture.release()
+            if ended:
+                self.state = 'ended'
+                break
+            if not self._stop.is_set():
+                self.last_error = 'Stream interrupted'
+                self.state = 'reconnecting'
+        with self._slot_ready:
+            self._slot_ready.notify_all()
+
+    def _read_frames(self, capture) -> bool:
+        """Read from an open capture until it fails or the stream stops.
+
+        Frames between samples are grabbed without being decoded. Local
+        files are paced at their native frame rate so sampling behaves as
+        it would on a live camera.
+
+        Returns:
+            True if a local file reached its end
+        """
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        file_fps = capture.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        frame_delay = 1.0 / file_fps if file_fps and file_fps > 0 else 0.0
+        next_sample = time.monotonic()
+
+        while not self._stop.is_set():
+            if not capture.grab():
+                return self.is_file
+            self.stats['frames_read'] += 1
+            now = time.monotonic()
+            if now >= next_sample:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    return self.is_file
+                next_sample = now + interval
+                self.stats['frames_sampled'] += 1
+                with self._slot_ready:
+                    if self._slot is not None:
+                        self.stats['frames_dropped'] += 1
+                    self._slot = frame
+                    self._slot_ready.notify()
+            if frame_delay:
+                self._stop.wait(frame_delay)
+        return False
+
+    def _process_loop(self) -> None:
+        """Run the latest frame through motion gate, detection and matching."""
+        previous = None
+        while True:
+            with self._slot_ready:
+                while self._slot is None and not self._stop.is_set() and self.state != 'ended':
+                    self._slot_ready.wait(1.0)
+                if self._stop.is_set() or self._slot is None:
+                    return
+                frame, self._slot = self._slot, None
+
+            try:
+                small = cv2.resize(frame, (MOTION_WIDTH, max(1, frame.shape[0] * MOTION_WIDTH // frame.shape[1])),
+                                   interpolation=cv2.INTER_AREA)
+                gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+                if previous is not None and self.motion_threshold > 0:
+                    if float(cv2.absdiff(gray, previous).mean()) < self.motion_threshold:
+                        self.stats['frames_static'] += 1
+                        continue
+                previous = gray
+
+                faces = self.face_processor.identify_face(
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), self.top_k
+                )
+                self.stats['frames_processed'] += 1
+                self.stats['faces_detected'] += len(faces)
+                for face in faces:
+                    self._emit(face, frame)
+            except Exception as e:
+                self.logger.error(f"Error processing frame from {self.name}: {e}")
+                self.last_error = str(e)
+
+    def _emit(self, face: Dict[str, any], frame: Optional[np.ndarray] = None) -> None:
+        """Record a recognition event for one detected face."""
+        event = recognition_event(self.name, face)
+        self.events.append(event)
+        if self.on_event:
+            try:
+                self.on_event(event, frame)
+            except Exception as e:
+                self.logger.error(f"Error delivering event from {self.name}: {e}")
+
+class RemoteStream:
+    def __init__(self, status: Dict[str, any], events: List[Dict] = ()):
+        """Read-only view of a stream that runs in another worker process.
+
+        Args:
+            status: Last status published by the worker running the stream
+            events: Most recent recognition events of the stream
+        """
+        self.name = status['name']
+        self._status = status
+        self.events = deque(events, maxlen=100)
+
+    def config(self) -> Dict[str, any]:
+        return {key: self._status[key] for key in ('name', 'url', 'fps', 'motion_threshold', 'top_k')}
+
+    def status(self) -> Dict[str, any]:
+        return dict(self._status)
+
+class StreamManager:
+    def __init__(self, face_processor, config_path: Optional[str] = None,
+                 coordinate: bool = False, sync_interval: float = 2.0):
+        """Initialize the stream manager and restart saved streams.
+
+        When several server workers share the config file, `coordinate`
+        makes sure streams run in one of them only. The workers compete for
+        an flock; the holder leads, runs every stream in the config file and
+        publishes their status and events to a status file. The others
+        edit the config file and read the status file instead. The leader
+        picks up config changes and the others retry the lock every
+        `sync_interval` seconds, so streams move to another worker when the
+        leader exits.
+
+        Args:
+            face_processor: FaceProcessor shared by all streams
+            config_path: JSON file the stream list is persisted to
+            coordinate: Whether other processes manage the same streams
+            sync_interval: Seconds between leader election and config checks
+        """
+        self.face_processor = face_processor
+        self.config_path = config_path
+        self.sync_interval = sync_interval
+        self.logger = logging.getLogger(__name__)
+        # Called with every event and its BGR frame in the process running the streams
+        self.listeners: List[Callable[[Dict, Optional[np.ndarray]], None]] = []
+        self._streams: Dict[str, CameraStream] = {}
+        self._lock = threading.Lock()
+        self.coordinated = bool(coordinate and config_path)
+        self.is_leader = not self.coordinated
+        if not self.coordinated:
+            self._load()
+            return
+        self._status_path = f"{config_path}.status"
+        self._leader_file = open(f"{config_path}.leader", 'a')
+        self._config_mtime: Optional[int] = None
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        threading.Thread(target=self._coordinate_loop, name='stream-coordinator', daemon=True).start()
+
+    def _load(self) -> None:
+        """Start every stream saved in the config file."""
+        for config in self._read_config():
+            try:
+                self.add(**config, persist=False)
+            except Exception as e:
+                self.logger.error(f"Error loading stream {config.get('name')}: {e}")
+
+    def _read_config(self) -> List[Dict[str, any]]:
+        """Stream settings saved in the config file."""
+        if not self.config_path or not os.path.exists(self.config_path):
+            return []
+        try:
+            with open(self.config_path) as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error loading streams: {e}")
+            return []
+
+    def _write_config(self, configs: List[Dict[str, any]]) -> None:
+        """Replace the config file atomically."""
+        tmp_path = f"{self.config_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(configs, f, indent=2)
+        os.replace(tmp_path, self.config_path)
+
+    def _save(self) -> None:
+        """Persist the current stream list."""
+        if not self.config_path:
+            return
+        try:
+            self._write_config([stream.config() for stream in self._streams.values()])
+        except Exception as e:
+            self.logger.error(f"Error saving streams: {e}")
+
+    def _edit_config(self, edit: Callable[[List[Dict[str, any]]], List[Dict[str, any]]]) -> None:
+        """Read, change and write the config file under a lock shared by the workers."""
+        with open(f"{self.config_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._write_config(edit(self._read_config()))
+
+    def _coordinate_loop(self) -> None:
+        """Compete for leadership and, while leading, follow the config file."""
+        while True:
+            if not self.is_leader:
+                try:
+                    fcntl.flock(self._leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    self.is_leader = True
+                    self.logger.info(f"Running camera streams in worker {os.getpid()}")
+                except OSError:
+                    pass
+            if self.is_leader:
+                try:
+                    self._reconcile()
+                    self._publish_status()
+                except Exception as e:
+                    self.logger.error(f"Error syncing streams: {e}")
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def _reconcile(self) -> None:
+        """Start and stop streams so they match the config file."""
+        with self._sync_lock:
+            self._apply_config()
+
+    def _apply_config(self) -> None:
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+        wanted = {config['name']: config for config in self._read_config()}
+        with self._lock:
+            stale = [stream for name, stream in self._streams.items()
+                     if stream.config() != wanted.get(name)]
+            for stream in stale:
+                del self._streams[stream.name]
+        for stream in stale:
+            stream.stop()
+            self.logger.info(f"Stopped stream {stream.name}")
+        for name, config in wanted.items():
+            if name not in self._streams:
+                self._start(config)
+
+    def _publish_status(self) -> None:
+        """Write the status and recent events of every stream for the other workers."""
+        streams = [dict(stream.status(), events=list(stream.events))
+                   for stream in list(self._streams.values())]
+        tmp_path = f"{self._status_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'leader': os.getpid(), 'updated': time.time(), 'streams': streams}, f)
+        os.replace(tmp_path, self._status_path)
+
+    def _remote_streams(self) -> Dict[str, RemoteStream]:
+        """Streams as last published by the leader, plus ones it has not started yet."""
+        try:
+            with open(self._status_path) as f:
+                published = {status['name']: status for status in json.load(f)['streams']}
+        except (OSError, ValueError, KeyError):
+            published = {}
+        streams = {}
+        for config in self._read_config():
+            status = published.get(config['name'])
+            if status is None or RemoteStream(status).config() != config:
+                streams[config['name']] = RemoteStream(dict(
+                    config, state='pending', error=None,
+                    **{counter: 0 for counter in ('frames_read', 'frames_sampled', 'frames_dropped',
+                                                  'frames_static', 'frames_processed', 'faces_detected')}
+                ))
+            else:
+                events = status.pop('events', [])
+                streams[config['name']] = RemoteStream(status, events)
+        return streams
+
+    def _dispatch(self, event: Dict, frame: Optional[np.ndarray] = None) -> None:
+        """Forward an event to every registered listener."""
+        for listener in self.listeners:
+            listener(event, frame)
+
+    def _start(self, config: Dict[str, any]) -> CameraStream:
+        """Create and start a stream in this process."""
+        stream = CameraStream(config['name'], config['url'], self.face_processor,
+                              config.get('fps', 2.0), config.get('motion_threshold', 4.0),
+                              config.get('top_k', 1), on_event=self._dispatch)
+        with self._lock:
+            self._streams[stream.name] = stream
+        stream.start()
+        self.logger.info(f"Started stream {stream.name}")
+        return stream
+
+    def add(self, name: str, url: str, fps: float = 2.0, motion_threshold: float = 4.0,
+            top_k: int = 1, persist: bool = True):
+        """Create and start a stream.
+
+        When coordinated, the stream is added to the config file and
+        started by the leader, which may be another worker.
+
+        Raises:
+            ValueError: If a stream with the same name exists
+        """
+        if self.coordinated:
+            config = {'name': name, 'url': url, 'fps': fps,
+                      'motion_threshold': motion_threshold, 'top_k': top_k}
+
+            def edit(configs):
+                if any(existing['name'] == name for existing in configs):
+                    raise ValueError(f"Stream {name} already exists")
+                return configs + [config]
+
+            self._edit_config(edit)
+            if self.is_leader:
+                self._reconcile()
+                return self._streams.get(name) or self._remote_streams()[name]
+            return self._remote_streams()[name]
+
+        with self._lock:
+            if name in self._streams:
+                raise ValueError(f"Stream {name} already exists")
+            stream = CameraStream(name, url, self.face_processor, fps, motion_threshold,
+                                  top_k, on_event=self._dispatch)
+            self._streams[name] = stream
+            stream.start()
+            if persist:
+                self._save()
+        self.logger.info(f"Started stream {name}")
+        return stream
+
+    def remove(self, name: str) -> bool:
+        """Stop and forget a stream.
+
+        Returns:
+            True if the stream existed
+        """
+        if self.coordinated:
+            found = []
+
+            def edit(configs):
+                found.extend(config for config in configs if config['name'] == name)
+                return [config for config in configs if config['name'] != name]
+
+            self._edit_config(edit)
+            if self.is_leader:
+                self._reconcile()
+            return bool(found)
+
+        with self._lock:
+            stream = self._streams.pop(name, None)
+            if stream is None:
+                return False
+            self._save()
+        stream.stop()
+        self.logger.info(f"Stopped stream {name}")
+        return True
+
+    def get(self, name: str):
+        if not self.is_leader:
+            return self._remote_streams().get(name)
+        return self._streams.get(name)
+
+    def list_streams(self) -> List[Dict[str, any]]:
+        """Status of every stream."""
+        if not self.is_leader:
+            return [stream.status() for stream in self._remote_streams().values()]
+        return [stream.status() for stream in list(self._streams.values())]
+
+    def stop_all(self) -> None:
+        """Stop every stream without forgetting it."""
+        if self.coordinated:
+            self._stop.set()
+        for stream in list(self._streams.values()):
+            stream.stop()
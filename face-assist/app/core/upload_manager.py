@@ -0,0 +1,273 @@
+import os
+import json
+import fcntl
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import BinaryIO, Dict, Optional, Tuple
+from werkzeug.utils import secure_filename
+
+# Bytes read from the request body per write
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Name of the staging directory created inside every destination directory
+STAGING_DIRNAME = '.uploads'
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        """Error with the HTTP status the API should answer with.
+
+        Args:
+            message: Description of the problem
+            status: HTTP status code
+        """
+        super().__init__(message)
+        self.status = status
+
+def copy_stream(stream: BinaryIO, out: BinaryIO, limit: int, hasher=None) -> int:
+    """Copy a stream in chunks, failing as soon as it exceeds a limit.
+
+    Args:
+        stream: Source to read from
+        out: Destination to write to
+        limit: Largest number of bytes accepted
+        hasher: Optional hashlib object updated with the data
+
+    Returns:
+        Number of bytes copied
+
+    Raises:
+        UploadError: If the stream is larger than the limit
+    """
+    copied = 0
+    while True:
+        chunk = stream.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if copied > limit:
+            raise UploadError('Upload exceeds the allowed size', 413)
+        out.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+
+def save_stream(stream: BinaryIO, dest_dir: str, filename: str, max_size: int) -> Tuple[str, str]:
+    """Stream a single-request upload to disk and move it into place atomically.
+
+    Args:
+        stream: Request or file stream to read
+        dest_dir: Directory the file is stored in
+        filename: Sanitized name of the stored file
+        max_size: Largest accepted size in bytes
+
+    Returns:
+        Tuple of (final path, SHA-256 hex digest)
+    """
+    staging = os.path.join(dest_dir, STAGING_DIRNAME)
+    os.makedirs(staging, exist_ok=True)
+    tmp_path = os.path.join(staging, f"{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            copy_stream(stream, f, max_size, hasher)
+            f.flush()
+            os.fsync(f.fileno())
+        path = os.path.join(dest_dir, filename)
+        os.replace(tmp_path, path)
+        return path, hasher.hexdigest()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class UploadManager:
+    def __init__(self, targets: Dict[str, Dict], expiry: float = 24 * 3600):
+        """Initialize the manager of resumable chunked uploads.
+
+        Every upload is staged as a .part file with a JSON sidecar in the
+        `.uploads` directory of its destination, so it survives restarts
+        and the final rename stays on one filesystem. Chunks must be sent
+        at the current offset; the size cap is enforced while data is
+        written and the content is hashed on the way to disk.
+
+        Args:
+            targets: Upload kinds mapped to their settings: `dir`
+                (destination directory), `max_size` (bytes) and
+                `extensions` (accepted file name endings)
+            expiry: Seconds after the last write before an unfinished
+                upload is discarded
+        """
+        self.targets = targets
+        self.expiry = expiry
+        self.logger = logging.getLogger(__name__)
+        # Running hash of every upload with the offset it covers
+        self._hashers: Dict[str, Tuple[int, any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _staging(self, kind: str) -> str:
+        path = os.path.join(self.targets[kind]['dir'], STAGING_DIRNAME)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _find(self, upload_id: str) -> Tuple[Dict, str]:
+        """Load the metadata of an upload and the path of its .part file."""
+        if not upload_id.isalnum():
+            raise UploadError('Upload not found', 404)
+        for kind in self.targets:
+            meta_path = os.path.join(self._staging(kind), f"{upload_id}.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    return json.load(f), meta_path[:-len('.json')] + '.part'
+        raise UploadError('Upload not found', 404)
+
+    def _upload_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, kind: str, filename: str, size: int, sha256: Optional[str] = None) -> Dict:
+        """Start a new upload.
+
+        Args:
+            kind: Upload kind, a key of `targets`
+            filename: Name the finished file is stored under
+            size: Total size of the file in bytes
+            sha256: Optional expected SHA-256 hex digest, checked on completion
+
+        Returns:
+            Status of the new upload
+        """
+        self.cleanup()
+        target = self.targets.get(kind)
+        if target is None:
+            raise UploadError(f'Unknown upload kind: {kind}')
+        filename = secure_filename(filename or '')
+        if not filename or not filename.endswith(tuple(target['extensions'])):
+            raise UploadError('Unsupported file format')
+        if size <= 0:
+            raise UploadError('Upload size must be positive')
+        if size > target['max_size']:
+            raise UploadError('File too large', 413)
+
+        upload_id = uuid.uuid4().hex
+        meta = {
+            'id': upload_id,
+            'kind': kind,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created': time.time()
+        }
+        staging = self._staging(kind)
+        open(os.path.join(staging, f"{upload_id}.part"), 'wb').close()
+        with open(os.path.join(staging, f"{upload_id}.json"), 'w') as f:
+            json.dump(meta, f)
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return dict(meta, offset=0)
+
+    def status(self, upload_id: str) -> Dict:
+        """Metadata and current offset of an upload."""
+        meta, part_path = self._find(upload_id)
+        return dict(meta, offset=os.path.getsize(part_path))
+
+    def _hasher(self, upload_id: str, part_path: str):
+        """Running hash of the data received so far.
+
+        The hash is rebuilt from the .part file after a restart or when
+        another server worker appended chunks since this one last did.
+        """
+        size = os.path.getsize(part_path)
+        offset, hasher = self._hashers.get(upload_id, (None, None))
+        if offset != size:
+            hasher = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+            self._hashers[upload_id] = (size, hasher)
+        return hasher
+
+    def append(self, upload_id: str, offset: int, stream: BinaryIO) -> Dict:
+        """Write a chunk at the given offset.
+
+        Args:
+            upload_id: Id of the upload
+            offset: Offset the chunk starts at, must equal the bytes received
+            stream: Chunk data
+
+        Returns:
+            Status of the upload after the write
+        """
+        with self._upload_lock(upload_id):
+            meta, part_path = self._find(upload_id)
+            with open(part_path, 'ab') as f:
+                # Other server workers may receive chunks of the same upload
+                fcntl.flock(f, fcntl.LOCK_EX)
+                current = os.fstat(f.fileno()).st_size
+                if offset != current:
+                    raise UploadError(f'Offset mismatch, upload is at {current}', 409)
+                hasher = self._hasher(upload_id, part_path).copy()
+                try:
+                    copy_stream(stream, f, meta['size'] - current, hasher)
+                except Exception:
+                    # Keep only the data that was received before the failure
+                    f.flush()
+                    self._hashers.pop(upload_id, None)
+                    raise
+                f.flush()
+                offset = os.fstat(f.fileno()).st_size
+                self._hashers[upload_id] = (offset, hasher)
+            return dict(meta, offset=offset)
+
+    def complete(self, upload_id: str) -> Dict:
+        """Verify a fully received upload and move it into place.
+
+        Returns:
+            Metadata with the final `path` and `sha256` of the file
+        """
+        with self._upload_lock(upload_id):
+            meta, part_path = self._find(upload_id)
+            received = os.path.getsize(part_path)
+            if received != meta['size']:
+                raise UploadError(f"Upload incomplete, received {received} of {meta['size']} bytes", 409)
+            digest = self._hasher(upload_id, part_path).hexdigest()
+            if meta['sha256'] and digest != meta['sha256']:
+                self._discard(upload_id, part_path)
+                raise UploadError('Checksum mismatch, upload discarded', 422)
+
+            with open(part_path, 'rb') as f:
+                os.fsync(f.fileno())
+            path = os.path.join(self.targets[meta['kind']]['dir'], meta['filename'])
+            os.replace(part_path, path)
+            self._discard(upload_id, part_path)
+            self.logger.info(f"Completed upload of {meta['filename']}")
+            return dict(meta, path=path, sha256=digest, offset=received)
+
+    def cancel(self, upload_id: str) -> None:
+        """Discard an upload and its data."""
+        with self._upload_lock(upload_id):
+            _, part_path = self._find(upload_id)
+            self._discard(upload_id, part_path)
+
+    def _discard(self, upload_id: str, part_path: str) -> None:
+        for path in (part_path, part_path[:-len('.part')] + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+
+    def cleanup(self) -> None:
+        """Discard unfinished uploads that have not been written to recently."""
+        now = time.time()
+        for kind in self.targets:
+            staging = self._staging(kind)
+            for name in os.listdir(staging):
+                if not name.endswith('.part'):
+                    continue
+                part_path = os.path.join(staging, name)
+                try:
+                    if now - os.path.getmtime(part_path) > self.expiry:
+                        self._discard(name[:-len('.part')], part_path)
+                except OSError as e:
+                    self.logger.error(f"Error removing stale upload {name}: {e}")
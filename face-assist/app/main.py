@@ -1,37 +1,94 @@
 from flask import Flask
+import argparse
 import logging
 import os
-from api.routes import api, web
-from config.default_config import (
+import uuid
+from .config.default_config import (
     API_HOST, API_PORT, LOG_LEVEL,
-    MODELS_PATH, FACES_PATH, RESULTS_PATH
+    MODELS_PATH, FACES_PATH, RESULTS_PATH,
+    SERVER_WORKERS, SERVER_THREADS, SERVER_TIMEOUT, SERVER_TOKEN_ENV
 )
 
-def create_app():
-    """Create and configure the Flask application"""
+def create_app(processor=None):
+    """Create and configure the Flask application
+
+    Args:
+        processor: Face processor to serve instead of one on the add-on's
+            face database, for benchmarks and tests; see
+            routes.init_services
+    """
     # Initialize Flask app
     app = Flask(__name__)
     
     # Configure logging
     logging.basicConfig(
         level=getattr(logging, LOG_LEVEL),
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
     )
     
     # Ensure required directories exist
-    for path in [MODELS_PATH, FACES_PATH, RESULTS_PATH]:
-        os.makedirs(path, exist_ok=True)
+    if processor is None:
+        for path in [MODELS_PATH, FACES_PATH, RESULTS_PATH]:
+            os.makedirs(path, exist_ok=True)
     
+    # Services are created here so every server worker loads models and
+    # the gallery after it was forked, not once in the parent
+    from .api import routes
+    routes.init_services(processor)
+
     # Register blueprints
-    app.register_blueprint(web)
-    app.register_blueprint(api, url_prefix='/api')
+    app.register_blueprint(routes.web)
+    app.register_blueprint(routes.api, url_prefix='/api')
     
     return app
 
+def serve(workers: int = SERVER_WORKERS, threads: int = SERVER_THREADS) -> None:
+    """Run the application on a gunicorn server with several worker processes.
+
+    Each worker serves requests on a pool of threads. The workers share
+    one face gallery, so an enrollment in one worker is visible to all.
+
+    Args:
+        workers: Number of worker processes
+        threads: Request threads per worker
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                'bind': f"{API_HOST}:{API_PORT}",
+                'workers': workers,
+                'worker_class': 'gthread',
+                'threads': threads,
+                'timeout': SERVER_TIMEOUT,
+                'graceful_timeout': 30,
+                'loglevel': LOG_LEVEL.lower(),
+                # Heartbeat files on tmpfs, so a slow disk cannot stall workers
+                'worker_tmp_dir': '/dev/shm' if os.path.isdir('/dev/shm') else None
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return create_app()
+
+    # A fresh token tells the workers that a gallery left by an earlier
+    # run is stale and must be loaded again
+    os.environ[SERVER_TOKEN_ENV] = uuid.uuid4().hex
+    Server().run()
+
 def main():
     """Main entry point for the application"""
-    app = create_app()
-    app.run(host=API_HOST, port=API_PORT)
+    parser = argparse.ArgumentParser(description='Face Assist API server')
+    parser.add_argument('--dev', action='store_true',
+                        help='Run the single-process Flask development server')
+    args = parser.parse_args()
+
+    if args.dev:
+        app = create_app()
+        app.run(host=API_HOST, port=API_PORT)
+    else:
+        serve()
 
 if __name__ == '__main__':
     main()
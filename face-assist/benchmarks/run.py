@@ -0,0 +1,281 @@
+"""Benchmark enrollment, verification and identification on CPU.
+
+Builds a synthetic face database for every requested gallery size and
+measures cold-start load time, gallery match latency, verify_face and
+identify_face latency, add_face throughput, HTTP throughput through the
+Flask app with concurrent clients and peak RSS. Results are written as
+JSON so runs can be compared over time.
+
+Run from the add-on directory:
+
+    python -m benchmarks.run --sizes 100 1000 10000 --output bench.json
+
+Without --probe, requests use a generated image that contains no face, so
+the request numbers cover decoding and detection only. Pass a photo with
+one face to measure the full path including encoding and matching.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from .synthetic import SAMPLE_SCALE, build_face_db, probe_image, synthetic_encodings
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds."""
+    if not latencies:
+        return {'count': 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        'count': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max())
+    }
+
+def measure(func: Callable[[int], None], iterations: int) -> List[float]:
+    """Call func(i) for every iteration and return the latencies in seconds."""
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def environment() -> Dict[str, any]:
+    """Describe the machine and code the benchmark ran on."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+
+def bench_match(gallery, size: int, per_person: int, iterations: int, seed: int) -> Dict[str, any]:
+    """Time gallery matching alone with synthetic probes of known people."""
+    encodings, labels = synthetic_encodings(size, per_person, seed)
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.integers(0, size, iterations)
+    probes = encodings[rows] + rng.normal(0.0, SAMPLE_SCALE, (iterations, encodings.shape[1]))
+    people = [f"person_{labels[row]:06d}" for row in rows]
+
+    verify = measure(lambda i: gallery.person_distances(people[i], probes[i]), iterations)
+    identify = measure(lambda i: gallery.identify(probes[i], 3), iterations)
+    return {'verify': summarize(verify), 'identify': summarize(identify)}
+
+def bench_add_face(processor, probe: bytes, iterations: int) -> Dict[str, any]:
+    """Enroll the probe repeatedly and time enrollment and persistence."""
+    # The same probe would otherwise be rejected as a near-duplicate
+    processor.dedupe_distance = 0
+    added = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        success, _ = processor.add_face('bench_enroll', probe, f"bench_{i}.jpg")
+        added += success
+    enrolled = time.perf_counter() - start
+    # Wait for the background writer to persist every image
+    processor._writer.submit(lambda: None).result()
+    persisted = time.perf_counter() - start
+    return {
+        'count': iterations,
+        'succeeded': added,
+        'enroll_per_second': iterations / enrolled if enrolled else 0.0,
+        'persist_per_second': iterations / persisted if persisted else 0.0
+    }
+
+def multipart(fields: Dict[str, str], files: Dict[str, bytes]) -> Tuple[bytes, str]:
+    """Encode a multipart/form-data body once so clients can reuse it."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, data in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def bench_http(processor, probe: bytes, person: str, concurrency: List[int],
+               requests: int) -> Dict[str, any]:
+    """Drive /api/verify through a threaded server with concurrent clients."""
+    from werkzeug.serving import make_server
+    from app.main import create_app
+
+    server = make_server('127.0.0.1', 0, create_app(processor), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/api/verify"
+    body, content_type = multipart({'person': person}, {'image': probe})
+
+    def post(_):
+        req = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                response.read()
+            ok = True
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    results = {}
+    try:
+        for clients in concurrency:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                outcomes = list(pool.map(post, range(requests)))
+            elapsed = time.perf_counter() - start
+            results[str(clients)] = dict(
+                summarize([latency for latency, _ in outcomes]),
+                errors=sum(not ok for _, ok in outcomes),
+                requests_per_second=requests / elapsed if elapsed else 0.0
+            )
+    finally:
+        server.shutdown()
+    return results
+
+def bench_size(size: int, args, probe: bytes, workdir: str) -> Dict[str, any]:
+    """Run every benchmark against a synthetic gallery of one size."""
+    from app.core.face_processor import FaceProcessor
+    from app.core.result_cache import ResultCache
+
+    face_db_path = os.path.join(workdir, f"faces_{size}")
+    shutil.rmtree(face_db_path, ignore_errors=True)
+    os.makedirs(face_db_path)
+    start = time.perf_counter()
+    people = build_face_db(face_db_path, size, args.per_person, args.seed)
+    result = {'size': size, 'people': people, 'build_seconds': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    processor = FaceProcessor(face_db_path, workers=args.workers)
+    result['cold_start_seconds'] = time.perf_counter() - start
+    result['rss_after_load_mb'] = peak_rss_mb()
+    if not args.result_cache:
+        processor.result_cache = ResultCache(0)
+
+    try:
+        result['match'] = bench_match(processor.gallery, size, args.per_person,
+                                      args.iterations, args.seed)
+        person = 'person_000000'
+        result['verify_face'] = summarize(measure(
+            lambda i: processor.verify_face(person, probe), args.iterations))
+        result['identify_face'] = summarize(measure(
+            lambda i: processor.identify_face(probe), args.iterations))
+        result['add_face'] = bench_add_face(processor, probe, args.enroll)
+        if args.concurrency:
+            result['http_verify'] = bench_http(processor, probe, person,
+                                               args.concurrency, args.requests)
+    finally:
+        processor._writer.shutdown(wait=True)
+        if processor._executor is not None:
+            processor._executor.shutdown(wait=True)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Gallery sizes in encodings (default: 100 1000 10000)')
+    parser.add_argument('--per-person', type=int, default=5,
+                        help='Encodings per synthetic person (default: 5)')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='Calls per latency measurement (default: 200)')
+    parser.add_argument('--enroll', type=int, default=50,
+                        help='Number of add_face calls (default: 50)')
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 4, 8],
+                        help='HTTP client counts, none to skip the HTTP benchmark')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='HTTP requests per concurrency level (default: 200)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Encoding worker processes (default: 1)')
+    parser.add_argument('--probe', help='Photo with one face used as the request image')
+    parser.add_argument('--result-cache', action='store_true',
+                        help='Keep the recognition result cache enabled')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--workdir', help='Directory for the synthetic databases (default: temporary)')
+    parser.add_argument('--output', help='JSON file to write, stdout if omitted')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.probe:
+        with open(args.probe, 'rb') as f:
+            probe = f.read()
+    else:
+        probe = probe_image(seed=args.seed)
+
+    from app.config.default_config import (
+        DETECTION_MODEL, DETECTION_MAX_WIDTH, SEARCH_INDEX, INDEX_NPROBE
+    )
+    report = {
+        'environment': environment(),
+        'settings': {
+            'per_person': args.per_person,
+            'iterations': args.iterations,
+            'enroll': args.enroll,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'workers': args.workers,
+            'probe': os.path.basename(args.probe) if args.probe else 'synthetic (no face)',
+            'result_cache': args.result_cache,
+            'seed': args.seed,
+            'detection_model': DETECTION_MODEL,
+            'detection_max_width': DETECTION_MAX_WIDTH,
+            'search_index': SEARCH_INDEX,
+            'index_nprobe': INDEX_NPROBE
+        },
+        'results': []
+    }
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='face-assist-bench-')
+    try:
+        for size in args.sizes:
+            print(f"Benchmarking gallery of {size} encodings", file=sys.stderr)
+            report['results'].append(bench_size(size, args, probe, workdir))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
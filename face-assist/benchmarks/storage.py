@@ -0,0 +1,88 @@
+"""Check the accuracy and size of the gallery storage modes.
+
+Scores every probe encoding against the rest of a gallery once in float64
+and once per storage mode, and reports how often the verify and identify
+decisions of each mode differ from float64, the largest distance error and
+the bytes stored per encoding. Results are printed as JSON.
+
+Run from the add-on directory against a synthetic gallery:
+
+    python -m benchmarks.storage --size 100000 --per-person 5
+
+or against the encoding cache of a real face database:
+
+    python -m benchmarks.storage --faces /share/face-assist/faces
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import List, Optional, Tuple
+import numpy as np
+
+from .run import environment
+from .synthetic import synthetic_encodings
+
+def cached_encodings(face_db_path: str, filename: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Encodings of a face database's encoding cache and the person of every row."""
+    from app.core.encoding_cache import CACHE_FILENAME, EncodingCache
+
+    cache = EncodingCache(face_db_path, filename or CACHE_FILENAME)
+    encodings, labels = cache.encodings()
+    if not len(encodings):
+        raise SystemExit(f"No cached encodings in {cache.path}")
+    return encodings, labels
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--faces', help='Face database whose cached encodings are checked')
+    parser.add_argument('--cache-file',
+                        help='Encoding cache file name in the database (default: .encodings.npz)')
+    parser.add_argument('--size', type=int, default=10000,
+                        help='Synthetic gallery size in encodings (default: 10000)')
+    parser.add_argument('--per-person', type=int, default=5,
+                        help='Encodings per synthetic person (default: 5)')
+    parser.add_argument('--threshold', type=float, default=0.6,
+                        help='Match distance threshold (default: 0.6)')
+    parser.add_argument('--probes', type=int, default=1000,
+                        help='Largest number of probe encodings (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--output', help='JSON file to write, stdout if omitted')
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    from app.core.quantization import evaluate
+
+    if args.faces:
+        encodings, labels = cached_encodings(args.faces, args.cache_file)
+        source = os.path.abspath(args.faces)
+    else:
+        encodings, labels = synthetic_encodings(args.size, args.per_person, args.seed)
+        source = 'synthetic'
+    print(f"Checking {len(encodings)} encodings of {len(np.unique(labels))} people", file=sys.stderr)
+
+    report = {
+        'environment': environment(),
+        'settings': {
+            'source': source,
+            'encodings': len(encodings),
+            'threshold': args.threshold,
+            'probes': min(args.probes, len(encodings)),
+            'seed': args.seed
+        },
+        'modes': evaluate(encodings, labels, args.threshold, max_probes=args.probes, seed=args.seed)
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import io
+import os
+import numpy as np
+from PIL import Image
+from typing import Tuple
+
+# Spread of the per-person centroids and of encodings around them, chosen so
+# that distances between people average about 0.9 and within a person about
+# 0.4, close to what dlib encodings of real faces look like.
+CENTROID_SCALE = 0.056
+SAMPLE_SCALE = 0.025
+
+def synthetic_encodings(size: int, per_person: int, seed: int = 0,
+                        dim: int = 128) -> Tuple[np.ndarray, np.ndarray]:
+    """Generate clustered face encodings.
+
+    Args:
+        size: Total number of encodings
+        per_person: Encodings generated around each person's centroid
+        seed: Seed of the random generator
+        dim: Dimension of the encodings
+
+    Returns:
+        Tuple of (encodings of shape (size, dim), person index of every row)
+    """
+    rng = np.random.default_rng(seed)
+    people = max(1, -(-size // per_person))
+    centroids = rng.normal(0.0, CENTROID_SCALE, (people, dim))
+    labels = np.arange(size) // per_person
+    encodings = centroids[labels] + rng.normal(0.0, SAMPLE_SCALE, (size, dim))
+    return encodings, labels
+
+def placeholder_image() -> bytes:
+    """Small PNG written in place of every synthetic enrollment image."""
+    buf = io.BytesIO()
+    Image.new('RGB', (8, 8), (128, 128, 128)).save(buf, format='PNG')
+    return buf.getvalue()
+
+def probe_image(width: int = 640, height: int = 480, seed: int = 0) -> bytes:
+    """JPEG used as the request image when no real face photo is given.
+
+    It contains no face, so it exercises decoding and detection but not
+    encoding or matching.
+    """
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+def build_face_db(face_db_path: str, size: int, per_person: int, seed: int = 0) -> int:
+    """Write a face database whose encodings are all in the encoding cache.
+
+    Every encoding gets its own placeholder image file, and the encoding
+    cache is filled in so that loading the database reads the cache
+    instead of running detection, as on a restart of a real installation.
+
+    Args:
+        face_db_path: Empty directory to create the database in
+        size: Total number of encodings
+        per_person: Images per person
+        seed: Seed of the random generator
+
+    Returns:
+        Number of people written
+    """
+    from app.core.encoding_cache import EncodingCache
+
+    encodings, labels = synthetic_encodings(size, per_person, seed)
+    data = placeholder_image()
+    cache = EncodingCache(face_db_path)
+    for i, (encoding, label) in enumerate(zip(encodings, labels)):
+        person = f"person_{label:06d}"
+        person_path = os.path.join(face_db_path, person)
+        os.makedirs(person_path, exist_ok=True)
+        rel_path = os.path.join(person, f"{i:07d}.png")
+        with open(os.path.join(face_db_path, rel_path), 'wb') as f:
+            f.write(data)
+        cache.store(rel_path, [encoding])
+    cache.save()
+    return int(labels[-1]) + 1 if size else 0
@@ -43,19 +43,59 @@ document.addEventListener('DOMContentLoaded', () => {
     const modelInput = document.getElementById('modelInput');
     const modelsList = document.getElementById('modelsList');
 
-    const uploadModel = async (file) => {
-        const formData = new FormData();
-        formData.append('model', file);
+    // Models are sent in chunks so an interrupted upload resumes where it stopped
+    const CHUNK_SIZE = 4 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+
+    const sendChunks = async (upload, file) => {
+        let offset = upload.offset;
+        let retries = 0;
+        while (offset < file.size) {
+            try {
+                const response = await fetch(`/api/uploads/${upload.id}`, {
+                    method: 'PATCH',
+                    headers: { 'Upload-Offset': String(offset) },
+                    body: file.slice(offset, offset + CHUNK_SIZE)
+                });
+                const data = await response.json();
+                if (!response.ok && response.status !== 409) {
+                    throw new Error(data.error);
+                }
+                if (response.ok) {
+                    offset = data.offset;
+                    retries = 0;
+                    continue;
+                }
+            } catch (error) {
+                if (++retries > MAX_RETRIES) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            }
+            // Ask the server how much arrived before sending the rest
+            const status = await fetch(`/api/uploads/${upload.id}`);
+            offset = (await status.json()).offset;
+        }
+    };
 
+    const uploadModel = async (file) => {
         try {
-            const response = await fetch('/api/models/upload', {
+            const response = await fetch('/api/uploads', {
                 method: 'POST',
-                body: formData
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ kind: 'model', filename: file.name, size: file.size })
             });
+            const upload = await response.json();
+            if (!response.ok) {
+                showToast(upload.error, 'error');
+                return;
+            }
 
-            const data = await response.json();
+            await sendChunks(upload, file);
+            const completed = await fetch(`/api/uploads/${upload.id}/complete`, { method: 'POST' });
+            const data = await completed.json();
             
-            if (response.ok) {
+            if (completed.ok) {
                 showToast('Model uploaded successfully');
                 loadModels();
             } else {
@@ -118,13 +158,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: formData
             });
 
-            const data = await response.json();
+            let job = await response.json();
+            if (!response.ok) {
+                showToast(job.error, 'error');
+                return;
+            }
+
+            // Enrollment runs in the background; wait for the job to finish
+            while (job.state === 'queued' || job.state === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = await (await fetch(`/api/jobs/${job.id}`)).json();
+            }
             
-            if (response.ok) {
+            if (job.state === 'done') {
                 showToast('Face added successfully');
                 loadFaces();
             } else {
-                showToast(data.error, 'error');
+                showToast(job.error || `Enrollment ${job.state}`, 'error');
             }
         } catch (error) {
             showToast('Error uploading face', 'error');
@@ -241,6 +291,26 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Hailo status, pushed by the server whenever it changes
+    const hailoStatus = document.getElementById('hailoStatus');
+
+    const showHailoStatus = (status) => {
+        if (!status.installed) {
+            hailoStatus.textContent = 'Hailo: runtime not installed';
+            hailoStatus.className = 'hailo-status offline';
+        } else if (!status.device_present) {
+            hailoStatus.textContent = 'Hailo: device not found';
+            hailoStatus.className = 'hailo-status offline';
+        } else {
+            const temperature = status.temperature !== null ? ` (${status.temperature}°C)` : '';
+            hailoStatus.textContent = `Hailo: online${temperature}`;
+            hailoStatus.className = 'hailo-status online';
+        }
+    };
+
+    const hailoEvents = new EventSource('/api/hailo/events');
+    hailoEvents.onmessage = (e) => showHailoStatus(JSON.parse(e.data));
+
     // Initialize
     loadModels();
     loadFaces();
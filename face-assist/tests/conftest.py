@@ -0,0 +1,70 @@
+import io
+import time
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+from typing import List
+from app.core.face_processor import FaceProcessor
+from app.core.inference import InferenceBackend, Location
+
+class FakeBackend(InferenceBackend):
+    """Finds one face in the middle of every image and derives its encoding from the pixels.
+
+    Different images get encodings far apart, the same image always gets
+    the same one, and `delay` slows encoding down like a real model.
+    """
+
+    name = 'test'
+    multiprocess = False
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+
+    def detect(self, image: np.ndarray) -> List[Location]:
+        height, width = image.shape[:2]
+        return [(height // 8, width - width // 8, height - height // 8, width // 8)]
+
+    def embed(self, image: np.ndarray, locations: List[Location]) -> List[np.ndarray]:
+        time.sleep(self.delay)
+        encodings = []
+        for top, right, bottom, left in locations:
+            seed = zlib.crc32(np.ascontiguousarray(image[top:bottom, left:right]).tobytes())
+            encodings.append(np.random.default_rng(seed).normal(0.0, 0.1, self.embedding_dim))
+        return encodings
+
+def face_image(seed: int, size: int = 96) -> bytes:
+    """PNG of random noise, which passes the default quality gate."""
+    pixels = np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format='PNG')
+    return buf.getvalue()
+
+def wait_for(condition, timeout: float = 10.0, interval: float = 0.05) -> bool:
+    """Poll until condition() is true or the timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+@pytest.fixture
+def faces_path(tmp_path):
+    path = tmp_path / 'faces'
+    path.mkdir()
+    return str(path)
+
+@pytest.fixture
+def make_processor(faces_path):
+    """Create face processors on the test database with the fake backend."""
+    processors = []
+
+    def make(delay: float = 0.0, **kwargs) -> FaceProcessor:
+        processor = FaceProcessor(faces_path, workers=1, backend=FakeBackend(delay), **kwargs)
+        processors.append(processor)
+        return processor
+
+    yield make
+    for processor in processors:
+        processor._writer.shutdown(wait=True)
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+from app.core.encoding_cache import EncodingCache
+
+@pytest.fixture
+def image(faces_path):
+    """Write an image file in the database and return its relative path."""
+    def write(rel_path: str, data: bytes = b'image') -> str:
+        path = os.path.join(faces_path, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return rel_path
+    return write
+
+def stat(faces_path, rel_path):
+    return os.stat(os.path.join(faces_path, rel_path))
+
+def test_saved_encodings_are_found_after_a_restart(faces_path, image):
+    rel_path = image('alice/a.png')
+    encodings = np.random.default_rng(0).normal(size=(2, 128))
+    cache = EncodingCache(faces_path)
+    cache.store(rel_path, encodings)
+    cache.save()
+
+    reloaded = EncodingCache(faces_path)
+    np.testing.assert_array_equal(reloaded.lookup(rel_path, stat(faces_path, rel_path)), encodings)
+
+def test_changed_image_misses_and_touched_image_hits(faces_path, image):
+    cache = EncodingCache(faces_path)
+    cache.store(image('alice/a.png'), [np.ones(128)])
+    cache.store(image('alice/b.png'), [np.ones(128)])
+
+    image('alice/a.png', b'other')
+    path = os.path.join(faces_path, 'alice/b.png')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+
+    assert cache.lookup('alice/a.png', stat(faces_path, 'alice/a.png')) is None
+    assert cache.lookup('alice/b.png', stat(faces_path, 'alice/b.png')) is not None
+
+def test_prune_drops_deleted_images_of_one_person(faces_path, image):
+    cache = EncodingCache(faces_path)
+    for rel_path in ('alice/a.png', 'alice/b.png', 'bob/a.png'):
+        cache.store(image(rel_path), [np.ones(128)])
+
+    assert cache.prune(['alice/a.png'], prefix='alice/') == 1
+    cache.save()
+    assert sorted(EncodingCache(faces_path)._entries) == ['alice/a.png', 'bob/a.png']
+
+def test_shared_saves_merge_entries_of_other_workers(faces_path, image):
+    first = EncodingCache(faces_path, shared=True)
+    second = EncodingCache(faces_path, shared=True)
+    first.store(image('alice/a.png'), [np.ones(128)])
+    first.save()
+    second.store(image('bob/a.png'), [np.zeros(128)])
+    second.save()
+
+    encodings, labels = EncodingCache(faces_path).encodings()
+    assert len(encodings) == 2 and sorted(labels) == [0, 1]
+
+def test_discarded_entry_is_not_restored_by_a_merge(faces_path, image):
+    first = EncodingCache(faces_path, shared=True)
+    first.store(image('alice/a.png'), [np.ones(128)])
+    first.save()
+    second = EncodingCache(faces_path, shared=True)
+    second.discard('alice/a.png')
+    second.save()
+
+    assert len(EncodingCache(faces_path)) == 0
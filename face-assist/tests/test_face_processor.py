@@ -0,0 +1,122 @@
+import os
+import threading
+import numpy as np
+from app.config.default_config import SERVER_TOKEN_ENV
+from app.core import face_processor
+from app.core.encoding_cache import EncodingCache
+from app.core.face_processor import IMAGE_EXTENSIONS
+from app.core.face_watcher import FaceDatabaseWatcher
+from .conftest import face_image, wait_for
+
+def import_items():
+    return ([('bob', f'bob{i}.png', face_image(i)) for i in range(6)]
+            + [('alice', f'alice{i}.png', face_image(100 + i)) for i in range(10)])
+
+def watch(processor, faces_path):
+    """Start a watcher that syncs the processor and records every sync."""
+    synced = []
+    watcher = FaceDatabaseWatcher(faces_path, lambda people: synced.append(processor.sync_people(people)),
+                                  IMAGE_EXTENSIONS, debounce=0.1, poll_interval=0.1)
+    watcher.start()
+    return watcher, synced
+
+def drain_writer(processor):
+    """Wait for the queued image writes and the cache save they queue."""
+    for _ in range(2):
+        processor._writer.submit(lambda: None).result()
+
+def test_import_while_watching(make_processor, faces_path):
+    # Encoding takes longer than the watcher's debounce, so it syncs mid-import
+    processor = make_processor(delay=0.05)
+    watcher, synced = watch(processor, faces_path)
+    try:
+        result = processor.import_images(import_items())
+        assert wait_for(lambda: synced)
+        generation = processor.gallery.snapshot.generation
+        assert not wait_for(lambda: processor.gallery.snapshot.generation != generation, timeout=1.0)
+    finally:
+        watcher.stop()
+
+    assert result['imported'] == 16
+    assert result['people'] == {'alice': 10, 'bob': 6}
+    assert processor.gallery.counts() == {'alice': 10, 'bob': 6}
+
+def test_import_while_another_worker_watches(make_processor, faces_path, tmp_path, monkeypatch):
+    monkeypatch.setenv(SERVER_TOKEN_ENV, 'test')
+    shared_path = str(tmp_path / 'gallery')
+    importer = make_processor(delay=0.05, shared_path=shared_path)
+    syncer = make_processor(shared_path=shared_path)
+    watcher, synced = watch(syncer, faces_path)
+    try:
+        result = importer.import_images(import_items())
+        assert wait_for(lambda: synced)
+    finally:
+        watcher.stop()
+
+    assert result['people'] == {'alice': 10, 'bob': 6}
+    assert importer.gallery.counts() == syncer.gallery.counts() == {'alice': 10, 'bob': 6}
+
+def test_sync_of_unchanged_folder_keeps_snapshot(make_processor):
+    processor = make_processor()
+    processor.import_images(import_items())
+    generation = processor.gallery.snapshot.generation
+
+    assert processor.sync_people(['alice', 'bob', 'carol']) == {'alice': 10, 'bob': 6, 'carol': 0}
+    assert processor.gallery.snapshot.generation == generation
+
+def test_sync_picks_up_copied_and_deleted_images(make_processor, faces_path):
+    processor = make_processor()
+    processor.import_images(import_items())
+    os.remove(os.path.join(faces_path, 'bob', 'bob0.png'))
+    with open(os.path.join(faces_path, 'alice', 'copied.png'), 'wb') as f:
+        f.write(face_image(1000))
+
+    assert processor.sync_people(['alice', 'bob']) == {'alice': 11, 'bob': 5}
+    assert processor.gallery.counts() == {'alice': 11, 'bob': 5}
+
+def test_enrollment_is_not_synced_again(make_processor, faces_path):
+    processor = make_processor()
+    processor.import_images(import_items())
+
+    assert processor.add_face('alice', face_image(2000), 'new.png') == (True, 'Face added successfully')
+    drain_writer(processor)
+    generation = processor.gallery.snapshot.generation
+
+    assert 'new.png' in processor.list_images('alice')
+    assert processor.sync_people(['alice']) == {'alice': 11}
+    assert processor.gallery.snapshot.generation == generation
+
+def test_encoding_cache_keeps_float64_encodings(make_processor, monkeypatch):
+    monkeypatch.setattr(face_processor, 'GALLERY_STORAGE', 'int8')
+    processor = make_processor()
+    processor.import_images(import_items())
+    encodings, labels = processor.encoding_cache.encodings()
+
+    assert encodings.dtype == np.float64 and encodings.shape == (16, 128)
+    assert sorted(np.bincount(labels)) == [6, 10]
+    assert not np.array_equal(np.sort(encodings, axis=0), np.sort(processor.gallery.snapshot.vectors(), axis=0))
+
+def test_queued_enrollments_share_one_cache_save(make_processor, faces_path, monkeypatch):
+    processor = make_processor()
+    saves = []
+    save = processor.encoding_cache.save
+    monkeypatch.setattr(processor.encoding_cache, 'save', lambda: saves.append(save()))
+    release = threading.Event()
+    processor._writer.submit(release.wait)
+    for i in range(5):
+        assert processor.add_face('carol', face_image(3000 + i), f'carol{i}.png')[0]
+    release.set()
+    drain_writer(processor)
+
+    assert len(saves) == 1
+    assert len(EncodingCache(faces_path, os.path.basename(processor.encoding_cache.path))) == 5
+
+def test_reserved_names_are_not_enrolled(make_processor, faces_path):
+    processor = make_processor()
+
+    assert processor.add_face('progress', face_image(4000), 'p.png') == (
+        False, "'progress' is a reserved name, choose another name for the person")
+    result = processor.import_images([('import', 'i.png', face_image(4001)), ('dave', 'd.png', face_image(4002))])
+    assert result['imported'] == 1 and result['failed'][0]['file'] == 'i.png'
+    assert processor.gallery.counts() == {'dave': 1}
+    assert not os.path.exists(os.path.join(faces_path, 'import'))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic import synthetic_encodings
+from app.core.gallery import FaceGallery
+from app.core.quantization import STORAGE_DTYPES
+from app.core.search_index import IVFIndex
+
+def people_gallery(encodings, labels, **kwargs) -> FaceGallery:
+    gallery = FaceGallery(**kwargs)
+    for label in np.unique(labels):
+        gallery.add(f'person{label}', encodings[labels == label])
+    return gallery
+
+def test_identify_ranks_the_closest_person_first():
+    encodings, labels = synthetic_encodings(60, 5)
+    gallery = people_gallery(encodings, labels)
+
+    results = gallery.identify(encodings[[7, 33]] + 0.001, top_k=2)
+    assert [ranked[0][0] for ranked in results] == ['person1', 'person6']
+    assert all(len(ranked) == 2 for ranked in results)
+
+def test_published_snapshot_is_unaffected_by_writes():
+    gallery = FaceGallery()
+    gallery.add('alice', np.ones((2, 128)))
+    snapshot = gallery.snapshot
+    gallery.add('alice', np.zeros((3, 128)))
+    gallery.set_person('bob', np.ones((1, 128)))
+    gallery.set_person('alice', [])
+
+    assert snapshot.counts() == {'alice': 2}
+    np.testing.assert_array_equal(snapshot.vectors(), np.ones((2, 128)))
+    assert gallery.counts() == {'bob': 1}
+
+@pytest.mark.parametrize('storage', sorted(STORAGE_DTYPES))
+def test_storage_modes_keep_distances_close(storage):
+    encodings, labels = synthetic_encodings(200, 5)
+    exact = people_gallery(encodings, labels).distances(encodings[:20])
+    stored = people_gallery(encodings, labels, storage=storage).distances(encodings[:20])
+
+    assert np.abs(stored - exact).max() < 0.02
+
+def test_ivf_search_finds_nearly_every_exact_match():
+    encodings, labels = synthetic_encodings(3000, 5)
+    exact = people_gallery(encodings, labels)
+    ivf = people_gallery(encodings, labels, index=IVFIndex(nprobe=8, min_size=1000))
+    probes = encodings[::30] + np.random.default_rng(1).normal(0, 0.01, (100, 128))
+
+    assert ivf.index.is_trained
+    expected = [ranked[0][0] for ranked in exact.identify(probes, top_k=1)]
+    found = [ranked[0][0] for ranked in ivf.identify(probes, top_k=1)]
+    assert np.mean(np.array(expected) == np.array(found)) >= 0.95
@@ -0,0 +1,61 @@
+import time
+import pytest
+from app.core.history import RecognitionHistory
+
+@pytest.fixture
+def history(tmp_path):
+    history = RecognitionHistory(str(tmp_path / 'history'), 10 * 1024 * 1024, flush_interval=0.05)
+    yield history
+    history.stop()
+
+def event(timestamp, person='alice', camera='door'):
+    return {'timestamp': timestamp, 'person': person, 'camera': camera, 'distance': 0.3,
+            'location': [10, 60, 60, 10]}
+
+def write(history, events):
+    history.start()
+    for item in events:
+        history.record(item)
+    history.stop()
+
+def test_pages_follow_the_cursor_newest_first(history):
+    # Equal timestamps must not repeat or skip records between pages
+    write(history, [event(1000.0 + i // 3) for i in range(10)])
+
+    seen, cursor = [], None
+    while True:
+        page = history.query(limit=4, cursor=cursor)
+        seen.extend(record['id'] for record in page['results'])
+        cursor = page['next']
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 10
+    timestamps = [record['timestamp'] for record in history.query(limit=10)['results']]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+def test_filters_by_person_camera_and_time(history):
+    write(history, [event(1000.0, 'alice', 'door'), event(1001.0, 'bob', 'door'),
+                    event(1002.0, 'alice', 'yard'), event(1003.0, 'alice', 'door')])
+
+    def timestamps(**filters):
+        return [record['timestamp'] for record in history.query(**filters)['results']]
+
+    assert timestamps(person='alice') == [1003.0, 1002.0, 1000.0]
+    assert timestamps(camera='yard') == [1002.0]
+    assert timestamps(person='alice', since=1001.0, until=1003.0) == [1002.0]
+    with pytest.raises(ValueError):
+        history.query(cursor='not-a-cursor')
+
+def test_records_past_the_age_limit_are_pruned(tmp_path):
+    history = RecognitionHistory(str(tmp_path / 'history'), 0, flush_interval=0.05, max_age=3600)
+    now = time.time()
+    write(history, [event(now - 7200), event(now - 60)])
+
+    assert [record['timestamp'] for record in history.query()['results']] == [now - 60]
+
+def test_full_queue_drops_records(tmp_path):
+    history = RecognitionHistory(str(tmp_path / 'history'), 0, max_queue=2)
+    for i in range(5):
+        history.record(event(1000.0 + i))
+
+    assert history.dropped == 3 and history.stats()['queued'] == 2
@@ -0,0 +1,90 @@
+import pytest
+from app.core.job_queue import JobQueue
+from .conftest import wait_for
+
+@pytest.fixture
+def make_queue(tmp_path):
+    """Create job queues on one database, stopped at teardown."""
+    queues = []
+
+    def make(token: str = 'test', **kwargs) -> JobQueue:
+        queue = JobQueue(str(tmp_path / 'jobs'), token, nice=0, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+def finished(queue, job_id):
+    return lambda: queue.get(job_id)['state'] in ('done', 'failed', 'cancelled')
+
+def test_jobs_run_in_priority_order_with_their_files(make_queue):
+    queue = make_queue()
+    ran = []
+
+    def handler(params, files, job):
+        with open(files[0], 'rb') as f:
+            ran.append((params['name'], f.read()))
+        return {'name': params['name']}
+
+    queue.register('test', handler, priority=10)
+    low = queue.submit('test', {'name': 'low'}, [('a.png', b'low')], priority=20)
+    high = queue.submit('test', {'name': 'high'}, [('a.png', b'high')])
+    assert queue.get(low['id'])['position'] == 1
+    queue.start()
+
+    assert wait_for(finished(queue, low['id']))
+    assert ran == [('high', b'high'), ('low', b'low')]
+    assert queue.get(high['id'])['result'] == {'name': 'high'}
+    assert queue.counts()['done'] == 2
+
+def test_failed_and_cancelled_jobs(make_queue):
+    queue = make_queue()
+
+    def handler(params, files, job):
+        raise ValueError('no face')
+
+    queue.register('test', handler, priority=10)
+    cancelled = queue.submit('test', {})
+    failed = queue.submit('test', {})
+    assert queue.cancel(cancelled['id'])['state'] == 'cancelled'
+    queue.start()
+
+    assert wait_for(finished(queue, failed['id']))
+    assert queue.get(failed['id'])['error'] == 'no face'
+    assert queue.get(cancelled['id'])['state'] == 'cancelled'
+
+def test_running_job_is_cancelled_at_its_next_checkpoint(make_queue):
+    queue = make_queue()
+    steps = []
+
+    def handler(params, files, job):
+        for step in range(100):
+            job.checkpoint(step, 100)
+            steps.append(step)
+            if step == 2:
+                queue.cancel(job.job_id)
+        return {}
+
+    queue.register('test', handler, priority=10)
+    job = queue.submit('test', {})
+    queue.start()
+
+    assert wait_for(finished(queue, job['id']))
+    assert queue.get(job['id'])['state'] == 'cancelled'
+    assert steps == [0, 1, 2]
+
+def test_jobs_of_an_earlier_server_start_run_again(make_queue):
+    earlier = make_queue(token='earlier')
+    earlier.register('test', lambda params, files, job: {}, priority=10)
+    job = earlier.submit('test', {})
+    # Claimed, then the server stopped before the job finished
+    assert earlier._claim()['id'] == job['id']
+
+    queue = make_queue(token='current')
+    queue.register('test', lambda params, files, job: {'ran': True}, priority=10)
+    queue.start()
+
+    assert wait_for(finished(queue, job['id']))
+    assert queue.get(job['id'])['result'] == {'ran': True}
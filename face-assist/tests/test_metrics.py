@@ -0,0 +1,55 @@
+import os
+import json
+from app.core.metrics import DEFAULT_BUCKETS, MetricsRegistry
+
+def test_large_counters_keep_every_increment():
+    registry = MetricsRegistry()
+    registry.inc('requests_total', 1234567)
+    registry.inc('requests_total')
+    registry.inc('seconds_total', 0.1)
+    registry.gauge('ratio', lambda: 1 / 3)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total 1234568' in lines
+    assert 'seconds_total 0.1' in lines
+    assert 'ratio 0.3333333333333333' in lines
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    for seconds in (0.002, 0.02, 0.02, 20.0):
+        registry.observe('latency_seconds', seconds, stage='encode')
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{stage="encode",le="0.0025"} 1' in lines
+    assert 'latency_seconds_bucket{stage="encode",le="0.025"} 3' in lines
+    assert 'latency_seconds_bucket{stage="encode",le="10"} 3' in lines
+    assert 'latency_seconds_bucket{stage="encode",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{stage="encode"} 4' in lines
+    assert registry.summary('latency_seconds', 'stage')['encode']['count'] == 4
+
+def test_shared_metrics_sum_over_workers(tmp_path):
+    path = tmp_path / 'metrics'
+    path.mkdir()
+    (path / 'old-1.json').write_text('{}')
+    # A worker of the same server that has exited
+    (path / 'run-999999999.json').write_text(json.dumps({
+        'pid': 999999999,
+        'counters': [['requests_total', [['status', '200']], 5]],
+        'histograms': [['latency_seconds', [], {'buckets': list(DEFAULT_BUCKETS),
+                                                'counts': [1] + [0] * (len(DEFAULT_BUCKETS) - 1),
+                                                'count': 1, 'sum': 0.001, 'max': 0.001}]],
+        'gauges': [['queue_depth', [], 7]]
+    }))
+    registry = MetricsRegistry()
+    registry.share(str(path), 'run', interval=3600)
+    registry.inc('requests_total', status=200)
+    registry.observe('latency_seconds', 0.001)
+    registry.gauge('queue_depth', lambda: 2)
+
+    lines = registry.render().splitlines()
+    assert not (path / 'old-1.json').exists()
+    assert (path / f'run-{os.getpid()}.json').exists()
+    assert 'requests_total{status="200"} 6' in lines
+    assert 'latency_seconds_count 2' in lines
+    assert f'queue_depth{{worker="{os.getpid()}"}} 2' in lines
+    assert not any(line.startswith('queue_depth{worker="999999999"}') for line in lines)
@@ -0,0 +1,78 @@
+import threading
+import pytest
+from app.core import model_registry
+from app.core.model_registry import ModelRegistry
+from .conftest import wait_for
+
+class SlowPool:
+    """Stands in for SessionPool, loading until `release` is set."""
+
+    release = threading.Event()
+    loads = 0
+
+    def __init__(self, model_path: str, size: int = 2, threads: int = 1):
+        SlowPool.loads += 1
+        if not SlowPool.release.wait(10):
+            raise RuntimeError('load not released')
+        if model_path.endswith('broken.onnx'):
+            raise RuntimeError('invalid model')
+        self.input_shape = [1, 3, 112, 112]
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    for name in ('a.onnx', 'b.onnx', 'broken.onnx'):
+        (tmp_path / name).write_bytes(b'\0' * 100)
+    monkeypatch.setattr(model_registry, 'SessionPool', SlowPool)
+    SlowPool.release = threading.Event()
+    SlowPool.loads = 0
+    return ModelRegistry(str(tmp_path), memory_budget=10000)
+
+def load(registry, name, results):
+    try:
+        results.append(registry.get_pool(name))
+    except Exception as e:
+        results.append(e)
+
+def test_loaded_models_are_served_while_another_loads(registry):
+    SlowPool.release.set()
+    pool = registry.get_pool('a.onnx')
+    SlowPool.release.clear()
+
+    results = []
+    loader = threading.Thread(target=load, args=(registry, 'b.onnx', results))
+    loader.start()
+    try:
+        assert wait_for(lambda: SlowPool.loads == 2)
+        assert registry.get_pool('a.onnx') is pool
+        assert {m['name']: m['state'] for m in registry.list_models()}['b.onnx'] == 'loading'
+    finally:
+        SlowPool.release.set()
+        loader.join()
+    assert registry.status()['memory_used'] > 0
+    assert not isinstance(results[0], Exception)
+
+def test_concurrent_requests_share_one_load(registry):
+    results = []
+    threads = [threading.Thread(target=load, args=(registry, 'a.onnx', results)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    SlowPool.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert SlowPool.loads == 1
+    assert len({id(pool) for pool in results}) == 1
+
+def test_failed_load_is_reported_to_every_waiter(registry):
+    results = []
+    threads = [threading.Thread(target=load, args=(registry, 'broken.onnx', results)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    SlowPool.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert SlowPool.loads == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    info = {m['name']: m for m in registry.list_models()}['broken.onnx']
+    assert info['state'] == 'error' and info['error'] == 'invalid model'
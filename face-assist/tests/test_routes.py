@@ -0,0 +1,25 @@
+import io
+import pytest
+from app.api import routes
+from app.main import create_app
+from .conftest import face_image
+
+@pytest.fixture
+def client(make_processor):
+    processor = make_processor()
+    processor.import_images([('alice', 'alice.png', face_image(1))])
+    return create_app(processor).test_client()
+
+def test_app_serves_a_given_processor(client):
+    response = client.post('/api/verify', data={'person': 'alice', 'image': (io.BytesIO(face_image(1)), 'a.png')})
+
+    assert response.status_code == 200 and response.get_json()['match']
+    assert client.get('/api/faces').get_json() == [{'name': 'alice', 'face_count': 1}]
+    # Background services stay off around a given processor
+    assert routes.job_queue is None and routes.face_watcher is None and routes.stream_manager is None
+
+def test_reserved_person_names_are_rejected(client):
+    response = client.post('/api/faces/progress', data={'image': (io.BytesIO(face_image(5)), 'p.png')})
+
+    assert response.status_code == 400
+    assert 'reserved' in response.get_json()['error']